@@ -0,0 +1,163 @@
+"""
+Static assets for piGallery
+The web interface's files are prepared when the server starts, without a build
+step: the stylesheets index.html links are bundled into one file, every asset
+gets a content-hashed name browsers can cache for good, and gzip (and, with the
+brotli module, brotli) copies are compressed ahead of time at the highest
+level, so a page load costs a few small responses and no compression work.
+Edits to static/ are picked up on the next request.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Content encodings in order of preference (smallest output first)
+ENCODINGS = ('br', 'gzip') if BROTLI_AVAILABLE else ('gzip',)
+# Smaller files are sent as they are; compressing them saves next to nothing
+MIN_COMPRESS_BYTES = 1024
+# Name the bundled stylesheets are served under (with their hash added)
+BUNDLED_CSS_NAME = 'bundle.css'
+# <link rel="stylesheet" href="/static/styles.css"> lines in the page, replaced by one bundle link
+STYLESHEET_LINK = re.compile(
+    r'(?P<indent>[ \t]*)<link rel="stylesheet" href="/static/(?P<name>[\w./-]+\.css)">[ \t]*\n?')
+# Other references to scripts in static/
+SCRIPT_REFERENCE = re.compile(r'(?P<quote>["\'])/static/(?P<name>[\w./-]+\.js)(?P=quote)')
+
+
+def compress(data, encoding, fast=False):
+    """data compressed with 'br' or 'gzip'; fast trades size for speed (for responses made per request)"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=5 if fast else 11)
+    return gzip.compress(data, compresslevel=5 if fast else 9, mtime=0)
+
+
+def negotiate_encoding(accept_encodings, available=ENCODINGS):
+    """The encoding of available the client prefers (Werkzeug's request.accept_encodings), or None"""
+    return accept_encodings.best_match(available)
+
+
+def hashed_name(name, content_hash):
+    """app.js -> app.<hash>.js"""
+    stem, ext = os.path.splitext(name)
+    return f'{stem}.{content_hash}{ext}'
+
+
+class Asset:
+    """One prepared file: its bytes, a short content hash and precompressed copies"""
+
+    def __init__(self, name, data, mimetype=None):
+        self.name = name
+        self.data = data
+        self.mimetype = mimetype or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.hash = hashlib.blake2b(data, digest_size=5).hexdigest()
+        self.hashed_name = hashed_name(name, self.hash)
+        # encoding -> compressed bytes, only where that is smaller
+        self.encoded = {}
+        if len(data) >= MIN_COMPRESS_BYTES:
+            for encoding in ENCODINGS:
+                compressed = compress(data, encoding)
+                if len(compressed) < len(data):
+                    self.encoded[encoding] = compressed
+
+
+class StaticAssets:
+    """The web page and the scripts and stylesheets it links, prepared from a static directory.
+
+    page() returns index.html rewritten to link the bundled stylesheet and
+    hashed script names; get() finds an asset by its hashed name (or
+    current() by its plain name, for pages from an older version). Sources
+    are checked for changes (size and mtime) on every call and everything
+    is prepared again when one changed."""
+
+    def __init__(self, static_dir, page_name='index.html'):
+        self.static_dir = static_dir
+        self.page_name = page_name
+        self._lock = threading.Lock()
+        self._sources = {}
+        self._page = None
+        self._by_hashed_name = {}
+        self._by_name = {}
+
+    def build(self):
+        """Prepare the page and its assets from the files in the static directory"""
+        sources = {}
+
+        def read(name):
+            path = os.path.join(self.static_dir, name)
+            stat = os.stat(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+            sources[path] = (stat.st_size, stat.st_mtime_ns)
+            return data
+
+        html = read(self.page_name).decode('utf-8')
+        assets = []
+        links = list(STYLESHEET_LINK.finditer(html))
+        if links:
+            # One request instead of one per stylesheet; order (and so the cascade) is kept
+            bundle = b'\n'.join(read(link.group('name')).rstrip(b'\n') + b'\n' for link in links)
+            bundle_asset = Asset(BUNDLED_CSS_NAME, bundle, 'text/css')
+            assets.append(bundle_asset)
+            first = links[0]
+            html = (html[:first.start()]
+                    + f'{first.group("indent")}<link rel="stylesheet" href="/static/{bundle_asset.hashed_name}">\n'
+                    + STYLESHEET_LINK.sub('', html[first.end():]))
+
+        def script_reference(match):
+            try:
+                asset = Asset(match.group('name'), read(match.group('name')))
+            except OSError:
+                return match.group(0)
+            assets.append(asset)
+            return f'{match.group("quote")}/static/{asset.hashed_name}{match.group("quote")}'
+
+        html = SCRIPT_REFERENCE.sub(script_reference, html)
+        page = Asset(self.page_name, html.encode('utf-8'), 'text/html')
+        with self._lock:
+            self._sources = sources
+            self._page = page
+            self._by_hashed_name = {asset.hashed_name: asset for asset in assets}
+            self._by_name = {asset.name: asset for asset in assets}
+        print(f"[Assets] Prepared {self.page_name} and {len(assets)} assets "
+              f"({', '.join(asset.hashed_name for asset in assets)})")
+
+    def _refresh(self):
+        with self._lock:
+            sources = self._sources
+        changed = not sources
+        for path, signature in sources.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                changed = True
+                break
+            if (stat.st_size, stat.st_mtime_ns) != signature:
+                changed = True
+                break
+        if changed:
+            self.build()
+
+    def page(self):
+        """The rewritten index.html as an Asset"""
+        self._refresh()
+        return self._page
+
+    def get(self, name):
+        """The asset with this hashed name, or None"""
+        self._refresh()
+        return self._by_hashed_name.get(name)
+
+    def current(self, name):
+        """The current asset with this plain name (app.js, bundle.css), or None"""
+        self._refresh()
+        return self._by_name.get(name)
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+piGallery benchmarks
+Synthetic benchmarks for the library structures - no display, images or config.ini needed
+
+Usage:
+    python benchmarks.py paths                  # memory for 100k and 1M paths
+    python benchmarks.py paths --counts 250000
+    python benchmarks.py scan                   # refresh/sort/navigation on a synthetic 100k library
+    python benchmarks.py scan --counts 1000000 --orders random filename size
+    python benchmarks.py metadata               # caption reading: metadata.py vs the PIL/piexif reader
+    python benchmarks.py metadata --count 200 --size 4000x3000
+    python benchmarks.py search                 # full-text search on a synthetic 100k-image index
+    python benchmarks.py server                 # web server throughput and render-loop frame times
+"""
+
+import argparse
+import gc
+import http.client
+import multiprocessing
+import io
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from library import PathList, PathTable
+
+
+def synthetic_paths(count, files_per_dir=250):
+    """Generate realistic relative paths: year/month-event folders of camera files plus uploads"""
+    events = ["Holiday", "Birthday", "Christmas", "Weekend", "School Concert", "Family BBQ"]
+    for i in range(count):
+        if i % 20 == 0:
+            yield f"uploaded/IMG_{i:07d}.jpg"
+            continue
+        folder = i // files_per_dir
+        year = 2005 + folder % 20
+        month = 1 + folder % 12
+        yield f"{year}/{year}-{month:02d} {events[folder % len(events)]}/IMG_{i:07d}.JPG"
+
+
+def _measure(build):
+    """Return (result, bytes allocated and still alive, seconds) for build()"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+def bench_paths(counts):
+    """Compare lists of path strings with the interned PathTable/PathList storage"""
+    print(f"{'entries':>10} {'storage':<28} {'MB':>9} {'B/entry':>8} {'build s':>8} {'lookup us':>10}")
+    for count in counts:
+        def build_strings():
+            # Old layout: the queue plus a reversed copy for circular navigation
+            images = list(synthetic_paths(count))
+            return images, images[::-1]
+
+        def build_table():
+            table = PathTable()
+            images = PathList(table, synthetic_paths(count))
+            return table, images, images[::-1]
+
+        for label, build in (("list[str] (queue + nav copy)", build_strings),
+                             ("PathTable + PathList", build_table)):
+            result, used, elapsed = _measure(build)
+            probe = f"uploaded/IMG_{(count // 2) // 20 * 20:07d}.jpg"
+            start = time.perf_counter()
+            if isinstance(result[0], PathTable):
+                lookups = 10000
+                for _ in range(lookups):
+                    result[0].lookup(probe)
+            else:
+                # The old refresh_images tested "path not in self.images" for every scanned file
+                lookups = 20
+                for _ in range(lookups):
+                    probe in result[0]
+            lookup_us = (time.perf_counter() - start) / lookups * 1e6
+            print(f"{count:>10} {label:<28} {used / 1024 / 1024:>9.1f} {used / count:>8.1f} "
+                  f"{elapsed:>8.2f} {lookup_us:>10.2f}")
+            del result
+        print()
+
+
+def bench_scan(counts, orders, steps):
+    """Time refresh_images, sorting and navigation of a real Slideshow on an in-memory library"""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import pygame
+    import gallery  # Note: loads config.ini and the log file like a normal start
+    from filesystem import MemoryFileSystem
+
+    pygame.init()
+    screen = pygame.display.set_mode((320, 240))
+    results = []
+    for count in counts:
+        fs = MemoryFileSystem()
+        fs.add_synthetic_tree('/library', count)
+        for order in orders:
+            config = {'sort_order': order, 'show_temperature': 'false', 'show_weather_code': 'false'}
+            # Memory is measured on a separate scan because tracemalloc slows everything down
+            slideshow = gallery.Slideshow('/library', screen, 10, config, filesystem=fs)
+            _, memory, _ = _measure(slideshow.refresh_images)
+            del slideshow
+
+            slideshow = gallery.Slideshow('/library', screen, 10, config, filesystem=fs)
+            gc.collect()
+            start = time.perf_counter()
+            slideshow.refresh_images()
+            scan_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for _ in range(steps):
+                slideshow.next_image()
+            for _ in range(steps):
+                slideshow.prev_image()
+            step_us = (time.perf_counter() - start) / (2 * steps) * 1e6
+
+            start = time.perf_counter()
+            slideshow.refresh_images()
+            rescan_seconds = time.perf_counter() - start
+            results.append((count, order, scan_seconds, rescan_seconds, memory, step_us))
+            del slideshow
+
+    # Print the table at the end so it isn't interleaved with slideshow log lines
+    print(f"{'entries':>10} {'order':<14} {'scan+sort s':>12} {'rescan s':>9} {'MB':>8} {'next/prev us':>13}")
+    for count, order, scan_seconds, rescan_seconds, memory, step_us in results:
+        print(f"{count:>10} {order:<14} {scan_seconds:>12.2f} {rescan_seconds:>9.2f} "
+              f"{memory / 1024 / 1024:>8.1f} {step_us:>13.1f}")
+
+
+def _jpeg_segment(marker, payload):
+    return struct.pack('>BBH', 0xFF, marker, len(payload) + 2) + payload
+
+
+def build_metadata_corpus(directory, count, width, height):
+    """Write count JPEG/PNG files with captions stored the different ways cameras and tools do.
+
+    Returns [(path, kind)]. Pixels are noise so files have realistic sizes."""
+    import piexif
+    from PIL import Image, PngImagePlugin
+
+    noise = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    kinds = ['exif_user_comment', 'exif_description', 'iptc', 'xmp', 'none', 'png_text', 'png_itxt', 'png_none']
+    corpus = []
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        caption = f"Caption {i} for {kind}"
+        if kind.startswith('png'):
+            path = os.path.join(directory, f"image_{i:05d}.png")
+            info = PngImagePlugin.PngInfo()
+            if kind == 'png_text':
+                info.add_text('Comment', caption)
+            elif kind == 'png_itxt':
+                info.add_itxt('Description', caption + ' été')
+            # compress_level 1 keeps corpus generation quick; parsing cost doesn't depend on it
+            noise.save(path, 'PNG', pnginfo=info, compress_level=1)
+        else:
+            path = os.path.join(directory, f"image_{i:05d}.jpg")
+            exif = {'0th': {piexif.ImageIFD.Orientation: 1}, 'Exif': {
+                piexif.ExifIFD.DateTimeOriginal: b'2021:06:01 12:00:00'}, 'GPS': {}, '1st': {}, 'thumbnail': None}
+            if kind == 'exif_user_comment':
+                exif['Exif'][piexif.ExifIFD.UserComment] = b'ASCII\x00\x00\x00' + caption.encode('utf-8')
+            elif kind == 'exif_description':
+                exif['0th'][piexif.ImageIFD.ImageDescription] = caption.encode('utf-8')
+            buffer = io.BytesIO()
+            noise.save(buffer, 'JPEG', quality=90, exif=piexif.dump(exif))
+            data = buffer.getvalue()
+            if kind == 'iptc':
+                text = caption.encode('utf-8')
+                iptc = b'\x1c\x02\x78' + struct.pack('>H', len(text)) + text
+                resource = b'8BIM\x04\x04\x00\x00' + struct.pack('>I', len(iptc)) + iptc + b'\x00' * (len(iptc) % 2)
+                data = data[:2] + _jpeg_segment(0xED, b'Photoshop 3.0\x00' + resource) + data[2:]
+            elif kind == 'xmp':
+                packet = ('<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF '
+                          'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+                          '<rdf:Description xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:description><rdf:Alt>'
+                          f'<rdf:li xml:lang="x-default">{caption}</rdf:li></rdf:Alt></dc:description>'
+                          '</rdf:Description></rdf:RDF></x:xmpmeta>').encode('utf-8')
+                data = data[:2] + _jpeg_segment(0xE1, b'http://ns.adobe.com/xap/1.0/\x00' + packet) + data[2:]
+            with open(path, 'wb') as f:
+                f.write(data)
+        corpus.append((path, kind))
+    return corpus
+
+
+def bench_metadata(count, width, height, rounds):
+    """Time caption reading with metadata.read_metadata against the PIL/piexif reader"""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    from metadata import read_metadata
+    from web import read_image_caption_pil
+
+    directory = tempfile.mkdtemp(prefix='pigallery-metadata-')
+    try:
+        print(f"Writing {count} {width}x{height} test images to {directory}...")
+        corpus = build_metadata_corpus(directory, count, width, height)
+        total_mb = sum(os.path.getsize(path) for path, _ in corpus) / 1024 / 1024
+
+        readers = (("PIL + piexif", read_image_caption_pil),
+                   ("metadata.read_metadata", lambda path: read_metadata(path).caption))
+        results = {}
+        for label, reader in readers:
+            best = None
+            for _ in range(rounds):
+                start = time.perf_counter()
+                captions = [reader(path) for path, _ in corpus]
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[label] = (best, captions)
+
+        print(f"\n{count} files, {total_mb:.1f} MB, best of {rounds} (files are in the page cache)")
+        print(f"{'reader':<24} {'total s':>8} {'ms/file':>8}")
+        for label, (elapsed, _) in results.items():
+            print(f"{label:<24} {elapsed:>8.3f} {elapsed / count * 1000:>8.3f}")
+
+        old, new = results["PIL + piexif"][1], results["metadata.read_metadata"][1]
+        differences = {}
+        for (path, kind), before, after in zip(corpus, old, new):
+            if before != after:
+                differences.setdefault(kind, (before, after))
+        for kind, (before, after) in differences.items():
+            print(f"Differs for {kind}: {before!r} -> {after!r}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_search(counts, queries, pages):
+    """Time building the full-text index and ranked, paginated queries on synthetic paths and captions"""
+    from media_index import MediaIndex
+
+    words = ["beach", "sunset", "grandma", "birthday cake", "snow", "garden", "dog", "school play"]
+    print(f"{'entries':>10} {'build s':>8} {'query':<16} {'matches':>8} {'ms/page':>8}")
+    for count in counts:
+        directory = tempfile.mkdtemp(prefix='pigallery-search-')
+        try:
+            index = MediaIndex(os.path.join(directory, 'media_index.db'))
+            paths = list(synthetic_paths(count))
+            start = time.perf_counter()
+            for offset in range(0, count, 10000):
+                batch = paths[offset:offset + 10000]
+                index.set_captions((path, 1000 + i, 0.0, f"{words[i % len(words)]} with the family {i}")
+                                   for i, path in enumerate(batch, offset))
+            build = time.perf_counter() - start
+            for query in queries:
+                start = time.perf_counter()
+                for page in range(pages):
+                    total, rows = index.search(query, limit=24, offset=page * 24)
+                elapsed = (time.perf_counter() - start) / pages
+                print(f"{count:>10} {build:>8.2f} {query:<16} {total:>8} {elapsed * 1000:>8.2f}")
+            index.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def _server_load(port, paths, seconds, results):
+    """Client process: request paths round-robin over one keep-alive connection for seconds"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request('GET', paths[i % len(paths)])
+            conn.getresponse().read()
+            latencies.append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+        i += 1
+    conn.close()
+    results.put((latencies, errors))
+
+
+def _frame_times(stop, frame_seconds, work_seconds, times):
+    """Stand-in for the render loop: work_seconds of Python work per frame at frame_seconds"""
+    last = time.perf_counter()
+    while not stop.is_set():
+        busy_until = time.perf_counter() + work_seconds
+        while time.perf_counter() < busy_until:
+            pass
+        next_frame = last + frame_seconds
+        time.sleep(max(0, next_frame - time.perf_counter()))
+        now = time.perf_counter()
+        times.append(now - last)
+        last = now
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def bench_server(modes, clients, seconds, workers):
+    """Throughput and latency of each web server mode under concurrent keep-alive clients,
+    and the frame times of a simulated 30 fps render loop in the same process"""
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    import logging
+    from flask import Flask, jsonify, send_file
+    from web import STATIC_DIR, WebServer
+
+    # Request log lines would measure the terminal
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('waitress.queue').setLevel(logging.ERROR)
+
+    app = Flask(__name__)
+    status = {'current_image': 'uploaded/IMG_0001.jpg', 'current_index': 1, 'total_images': 100000,
+              'paused': False, 'time': '12:00', 'date': 'Mon 1 Jan', 'temperature': '20°C',
+              'weather': 'Sunny', 'time_remaining': 10, 'image_version': '0123456789abcdef'}
+    app.add_url_rule('/api/status', 'status', lambda: jsonify(status))
+    app.add_url_rule('/static/app.js', 'app_js', lambda: send_file(os.path.join(STATIC_DIR, 'app.js')))
+    paths = ['/api/status', '/api/status', '/api/status', '/static/app.js']
+
+    frame_seconds, work_seconds = 1 / 30, 0.005
+    print(f"{clients} keep-alive clients for {seconds}s; render loop: 30 fps with {work_seconds * 1000:.0f} ms "
+          f"of work per frame; requests: 3x /api/status, 1x /static/app.js")
+    print(f"{'server':<12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} "
+          f"{'frame p50':>10} {'frame p99':>10} {'frame max':>10} {'late %':>7}")
+    for mode in ['idle'] + list(modes):
+        server = None
+        if mode != 'idle':
+            server = WebServer(app, '127.0.0.1', 0, mode, workers)
+            threading.Thread(target=server.serve, daemon=True).start()
+        stop = threading.Event()
+        times = []
+        render = threading.Thread(target=_frame_times, args=(stop, frame_seconds, work_seconds, times), daemon=True)
+        render.start()
+        latencies, errors = [], 0
+        if server is not None:
+            results = multiprocessing.Queue()
+            processes = [multiprocessing.Process(target=_server_load, args=(server.port, paths, seconds, results))
+                         for _ in range(clients)]
+            for process in processes:
+                process.start()
+            for _ in processes:
+                client_latencies, client_errors = results.get()
+                latencies.extend(client_latencies)
+                errors += client_errors
+            for process in processes:
+                process.join()
+        else:
+            time.sleep(seconds)
+        stop.set()
+        render.join()
+        if server is not None:
+            server.stop()
+        # A frame is late when it took more than half a frame longer than planned
+        late = sum(1 for t in times if t > frame_seconds * 1.5) / max(1, len(times)) * 100
+        label = 'no server' if mode == 'idle' else mode
+        print(f"{label:<12} {len(latencies) / seconds:>8.0f} {_percentile(latencies, 0.5) * 1000:>8.2f} "
+              f"{_percentile(latencies, 0.99) * 1000:>8.2f} {errors:>7} "
+              f"{_percentile(times, 0.5) * 1000:>10.1f} {_percentile(times, 0.99) * 1000:>10.1f} "
+              f"{max(times, default=0) * 1000:>10.1f} {late:>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="piGallery synthetic benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    paths_parser = subparsers.add_parser("paths", help="Memory used by image path storage")
+    paths_parser.add_argument("--counts", type=int, nargs="+", default=[100000, 1000000],
+                              help="Library sizes to measure (default: 100000 1000000)")
+
+    scan_parser = subparsers.add_parser("scan", help="Slideshow scan, sort and navigation on a synthetic library")
+    scan_parser.add_argument("--counts", type=int, nargs="+", default=[100000],
+                             help="Library sizes to generate (default: 100000)")
+    scan_parser.add_argument("--orders", nargs="+", default=["random", "filename", "size", "date_modified"],
+                             help="sort_order values to test (date_taken decodes EXIF and is slow)")
+    scan_parser.add_argument("--steps", type=int, default=1000, help="next/prev steps to time (default: 1000)")
+
+    metadata_parser = subparsers.add_parser("metadata", help="Caption reading speed on a generated JPEG/PNG corpus")
+    metadata_parser.add_argument("--count", type=int, default=80, help="Number of files (default: 80)")
+    metadata_parser.add_argument("--size", default="2000x1500", help="Image size WIDTHxHEIGHT (default: 2000x1500)")
+    metadata_parser.add_argument("--rounds", type=int, default=3, help="Timed passes, best is reported (default: 3)")
+
+    search_parser = subparsers.add_parser("search", help="Full-text search over a synthetic index")
+    search_parser.add_argument("--counts", type=int, nargs="+", default=[100000],
+                               help="Library sizes to index (default: 100000)")
+    search_parser.add_argument("--queries", nargs="+", default=["sunset", "birthday", "holiday 2005", "img_00042"],
+                               help="Queries to time")
+    search_parser.add_argument("--pages", type=int, default=5, help="Result pages fetched per query (default: 5)")
+
+    server_parser = subparsers.add_parser("server", help="Web server throughput and render-loop frame times")
+    server_parser.add_argument("--modes", nargs="+", default=["development", "production"],
+                               help="web_server modes to compare (default: development production)")
+    server_parser.add_argument("--clients", type=int, default=8, help="Concurrent client processes (default: 8)")
+    server_parser.add_argument("--seconds", type=float, default=10, help="Load duration per mode (default: 10)")
+    server_parser.add_argument("--workers", type=int, default=8,
+                               help="Worker threads of the production server (default: 8)")
+
+    args = parser.parse_args()
+    if args.benchmark == "paths":
+        bench_paths(args.counts)
+    elif args.benchmark == "scan":
+        bench_scan(args.counts, args.orders, args.steps)
+    elif args.benchmark == "metadata":
+        width, height = (int(n) for n in args.size.lower().split('x'))
+        bench_metadata(args.count, width, height, args.rounds)
+    elif args.benchmark == "search":
+        bench_search(args.counts, args.queries, args.pages)
+    elif args.benchmark == "server":
+        bench_server(args.modes, args.clients, args.seconds, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Status events for piGallery
+Server-Sent Events feed of the slideshow status: one background thread builds
+the status and system stats for every connected browser, so the cost does
+not grow with the number of open pages.
+"""
+
+import json
+import threading
+import time
+
+
+def sse_message(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class StatusFeed:
+    """Publishes the slideshow status when it changes and system stats periodically.
+
+    build_status() returns the status dict; its 'time_remaining' entry is
+    ignored when looking for changes (clients count down locally from it)
+    and is brought up to date when a client is sent an older status.
+    build_stats() returns the system stats dict. The thread starts with the
+    first subscriber and idles while nobody is connected; poke() makes it
+    look again right away (after a control action from the web UI)."""
+
+    def __init__(self, build_status, build_stats, check_seconds=0.5, stats_seconds=10, heartbeat_seconds=15):
+        self.build_status = build_status
+        self.build_stats = build_stats
+        self.check_seconds = check_seconds
+        self.stats_seconds = stats_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self._changed = threading.Condition()
+        self._status = None
+        self._status_key = None
+        self._status_time = 0
+        self._status_id = 0
+        self._stats = None
+        self._stats_id = 0
+        self._subscribers = 0
+        self._next_stats = 0
+        self._wake_event = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-feed", daemon=True)
+                self._thread.start()
+
+    def poke(self):
+        """Publish the status now instead of at the next check"""
+        self._wake_event.set()
+
+    def close(self):
+        """End every client's stream and stop the thread"""
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._wake_event.set()
+
+    def _run(self):
+        while not self._closed:
+            with self._changed:
+                # Nobody is listening: build nothing until a client connects
+                self._changed.wait_for(lambda: self._closed or self._subscribers)
+            self._wake_event.wait(self.check_seconds)
+            self._wake_event.clear()
+            try:
+                status = self.build_status()
+                key = json.dumps({k: v for k, v in status.items() if k != 'time_remaining'}, sort_keys=True)
+                if key != self._status_key:
+                    with self._changed:
+                        self._status, self._status_key = status, key
+                        self._status_time = time.monotonic()
+                        self._status_id += 1
+                        self._changed.notify_all()
+                if time.monotonic() >= self._next_stats:
+                    self._next_stats = time.monotonic() + self.stats_seconds
+                    stats = self.build_stats()
+                    with self._changed:
+                        self._stats = stats
+                        self._stats_id += 1
+                        self._changed.notify_all()
+            except Exception as e:
+                print(f"[Events] Status update failed: {e}")
+
+    def events(self):
+        """Yield Server-Sent Events messages for one client until it disconnects"""
+        self.start()
+        with self._changed:
+            self._subscribers += 1
+            if self._subscribers == 1:
+                # What the thread published before it went idle is out of date: have it publish
+                # both afresh right away and wait for that
+                seen_status, seen_stats = self._status_id, self._stats_id
+                self._status_key = None
+                self._next_stats = 0
+                self._wake_event.set()
+            else:
+                seen_status = seen_stats = 0
+            self._changed.notify_all()
+        try:
+            yield from self._stream(seen_status, seen_stats)
+        finally:
+            with self._changed:
+                self._subscribers -= 1
+
+    def _stream(self, seen_status, seen_stats):
+        # Browsers reconnect after this many ms if the connection drops
+        yield "retry: 3000\n\n"
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._closed or self._status_id != seen_status
+                                       or self._stats_id != seen_stats, timeout=self.heartbeat_seconds)
+                if self._closed:
+                    return
+                status, status_id, status_time = self._status, self._status_id, self._status_time
+                stats, stats_id = self._stats, self._stats_id
+            sent = False
+            if status_id != seen_status:
+                seen_status = status_id
+                if status.get('time_remaining') and not status.get('paused'):
+                    elapsed = int(time.monotonic() - status_time)
+                    status = dict(status, time_remaining=max(0, status['time_remaining'] - elapsed))
+                yield sse_message('status', status)
+                sent = True
+            if stats_id != seen_stats:
+                seen_stats = stats_id
+                if stats:
+                    yield sse_message('stats', stats)
+                sent = True
+            if not sent:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": ping\n\n"
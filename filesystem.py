@@ -0,0 +1,294 @@
+"""
+Filesystem access for piGallery
+The scanner and metadata readers go through a filesystem object so they can run
+against the real disk (LocalFileSystem) or a synthetic in-memory library
+(MemoryFileSystem) for scale testing and benchmarks
+"""
+
+import io
+import os
+import posixpath
+import time
+from collections import namedtuple
+
+FileStat = namedtuple('FileStat', ['st_size', 'st_mtime', 'st_ctime'])
+
+
+class LocalFileSystem:
+    """The real filesystem (thin wrapper over os / os.path)"""
+
+    def walk(self, top):
+        return os.walk(top)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def isfile(self, path):
+        return os.path.isfile(path)
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def getsize(self, path):
+        return os.path.getsize(path)
+
+    def getmtime(self, path):
+        return os.path.getmtime(path)
+
+    def getctime(self, path):
+        return os.path.getctime(path)
+
+    def open(self, path, mode='rb'):
+        return open(path, mode)
+
+
+class _MemoryFile:
+    __slots__ = ('data', 'size', 'mtime', 'ctime', 'date_taken')
+
+    def __init__(self, data, size, mtime, ctime, date_taken):
+        self.data = data
+        self.size = size
+        self.mtime = mtime
+        self.ctime = ctime
+        self.date_taken = date_taken
+
+
+def _synthetic_jpeg(date_taken=None):
+    """Return a tiny valid JPEG, with EXIF DateTimeOriginal if date_taken (epoch seconds) is given"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    save_kwargs = {}
+    if date_taken is not None:
+        exif = Image.Exif()
+        exif.get_ifd(0x8769)[0x9003] = time.strftime('%Y:%m:%d %H:%M:%S', time.localtime(date_taken))
+        save_kwargs['exif'] = exif.tobytes()
+    Image.new('RGB', (1, 1)).save(buffer, 'JPEG', **save_kwargs)
+    return buffer.getvalue()
+
+
+class SyntheticTree:
+    """A directory of generated image files, computed on demand from the file index.
+
+    Nothing is stored per file, so a tree of millions of entries costs a few
+    hundred bytes. Sizes, timestamps and EXIF dates are derived
+    deterministically from (seed, index); exif_ratio controls how many files
+    carry a DateTimeOriginal tag."""
+
+    def __init__(self, root, count, files_per_dir=250, seed=0, start_time=1262304000.0,
+                 span_seconds=15 * 365 * 86400, min_size=200 * 1024, max_size=8 * 1024 * 1024,
+                 exif_ratio=0.9, extension='.jpg'):
+        self.root = root
+        self.count = count
+        self.files_per_dir = max(1, files_per_dir)
+        self.seed = seed
+        self.start_time = start_time
+        self.span_seconds = span_seconds
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.exif_ratio = exif_ratio
+        self.extension = extension
+
+    @property
+    def dir_count(self):
+        return (self.count + self.files_per_dir - 1) // self.files_per_dir
+
+    @staticmethod
+    def dir_name(dir_index):
+        return f"d{dir_index:05d}"
+
+    def file_name(self, index):
+        return f"IMG_{index:08d}{self.extension}"
+
+    def file_path(self, index):
+        return posixpath.join(self.root, self.dir_name(index // self.files_per_dir), self.file_name(index))
+
+    def walk(self):
+        yield self.root, [self.dir_name(d) for d in range(self.dir_count)], []
+        for d in range(self.dir_count):
+            first = d * self.files_per_dir
+            last = min(self.count, first + self.files_per_dir)
+            yield (posixpath.join(self.root, self.dir_name(d)), [],
+                   [self.file_name(i) for i in range(first, last)])
+
+    def _relative_parts(self, path):
+        relative = posixpath.relpath(path, self.root)
+        return [] if relative == '.' else relative.split('/')
+
+    def isdir(self, path):
+        parts = self._relative_parts(path)
+        if not parts:
+            return True
+        return (len(parts) == 1 and parts[0].startswith('d') and parts[0][1:].isdigit()
+                and int(parts[0][1:]) < self.dir_count)
+
+    def listdir(self, path):
+        parts = self._relative_parts(path)
+        if not parts:
+            return [self.dir_name(d) for d in range(self.dir_count)]
+        d = int(parts[0][1:])
+        first = d * self.files_per_dir
+        return [self.file_name(i) for i in range(first, min(self.count, first + self.files_per_dir))]
+
+    def index_of(self, path):
+        """Return the file index for path, or None if it is not a file of this tree"""
+        parts = self._relative_parts(path)
+        if len(parts) != 2 or not parts[1].startswith('IMG_') or not parts[1].endswith(self.extension):
+            return None
+        number = parts[1][4:-len(self.extension)]
+        if not number.isdigit():
+            return None
+        index = int(number)
+        if index >= self.count or parts[0] != self.dir_name(index // self.files_per_dir):
+            return None
+        return index
+
+    def file(self, index):
+        mix = hash((self.seed, index)) & 0xFFFFFFFFFFFF
+        date_taken = self.start_time + (mix % 1000003) / 1000003 * self.span_seconds
+        ctime = date_taken + (mix >> 20) % 86400 * 30
+        mtime = ctime + (mix >> 8) % 3600
+        size = self.min_size + (mix >> 4) % (self.max_size - self.min_size + 1)
+        has_exif = (mix >> 32) % 1000 < self.exif_ratio * 1000
+        return _MemoryFile(None, size, mtime, ctime, date_taken if has_exif else None)
+
+
+class MemoryFileSystem:
+    """In-memory filesystem with the LocalFileSystem interface.
+
+    Holds explicitly added files (add_file) and lazily generated synthetic
+    trees (add_synthetic_tree). Paths are POSIX style."""
+
+    def __init__(self):
+        self._files = {}     # path -> _MemoryFile
+        self._dirs = {}      # dir path -> [set of subdir names, list of file names]
+        self._trees = []
+
+    @staticmethod
+    def _normalize(path):
+        return posixpath.normpath(str(path).replace('\\', '/'))
+
+    def _add_dir(self, path):
+        path = self._normalize(path)
+        if path in self._dirs:
+            return
+        self._dirs[path] = [set(), []]
+        parent = posixpath.dirname(path)
+        if parent != path:
+            self._add_dir(parent)
+            self._dirs[parent][0].add(posixpath.basename(path))
+
+    def makedirs(self, path, exist_ok=True):
+        self._add_dir(path)
+
+    def add_file(self, path, data=b'', size=None, mtime=None, ctime=None, date_taken=None):
+        """Add a file; without data a tiny JPEG (with EXIF if date_taken is set) is generated on open"""
+        path = self._normalize(path)
+        now = time.time()
+        parent = posixpath.dirname(path)
+        self._add_dir(parent)
+        if path not in self._files:
+            self._dirs[parent][1].append(posixpath.basename(path))
+        self._files[path] = _MemoryFile(data or None, len(data) if size is None and data else (size or 0),
+                                        now if mtime is None else mtime, now if ctime is None else ctime,
+                                        date_taken)
+
+    def add_synthetic_tree(self, root, count, **options):
+        """Mount a SyntheticTree of count images at root (see SyntheticTree for options)"""
+        tree = SyntheticTree(self._normalize(root), count, **options)
+        parent = posixpath.dirname(tree.root)
+        self._add_dir(parent)
+        self._dirs[parent][0].add(posixpath.basename(tree.root))
+        self._trees.append(tree)
+        return tree
+
+    def remove(self, path):
+        path = self._normalize(path)
+        if path not in self._files:
+            raise FileNotFoundError(path)
+        del self._files[path]
+        self._dirs[posixpath.dirname(path)][1].remove(posixpath.basename(path))
+
+    def _tree_for(self, path):
+        for tree in self._trees:
+            if path == tree.root or path.startswith(tree.root + '/'):
+                return tree
+        return None
+
+    def _entry(self, path):
+        path = self._normalize(path)
+        entry = self._files.get(path)
+        if entry is None:
+            tree = self._tree_for(path)
+            index = tree.index_of(path) if tree else None
+            if index is not None:
+                entry = tree.file(index)
+        return entry
+
+    def walk(self, top):
+        top = self._normalize(top)
+        tree = self._tree_for(top)
+        if tree is not None:
+            if top == tree.root:
+                yield from tree.walk()
+            elif tree.isdir(top):
+                yield top, [], tree.listdir(top)
+            return
+        if top not in self._dirs:
+            return
+        subdirs, files = self._dirs[top]
+        names = sorted(subdirs | {posixpath.basename(t.root) for t in self._trees
+                                  if posixpath.dirname(t.root) == top})
+        yield top, names, list(files)
+        for name in names:
+            yield from self.walk(posixpath.join(top, name))
+
+    def listdir(self, path):
+        path = self._normalize(path)
+        tree = self._tree_for(path)
+        if tree is not None:
+            return tree.listdir(path)
+        if path not in self._dirs:
+            raise FileNotFoundError(path)
+        subdirs, files = self._dirs[path]
+        return sorted(subdirs) + list(files)
+
+    def exists(self, path):
+        return self.isdir(path) or self.isfile(path)
+
+    def isdir(self, path):
+        path = self._normalize(path)
+        tree = self._tree_for(path)
+        return tree.isdir(path) if tree is not None else path in self._dirs
+
+    def isfile(self, path):
+        return self._entry(path) is not None
+
+    def stat(self, path):
+        entry = self._entry(path)
+        if entry is None:
+            raise FileNotFoundError(path)
+        return FileStat(entry.size, entry.mtime, entry.ctime)
+
+    def getsize(self, path):
+        return self.stat(path).st_size
+
+    def getmtime(self, path):
+        return self.stat(path).st_mtime
+
+    def getctime(self, path):
+        return self.stat(path).st_ctime
+
+    def open(self, path, mode='rb'):
+        if 'b' not in mode or any(flag in mode for flag in 'wax+'):
+            raise ValueError("MemoryFileSystem only supports reading in binary mode")
+        entry = self._entry(path)
+        if entry is None:
+            raise FileNotFoundError(path)
+        data = entry.data if entry.data is not None else _synthetic_jpeg(entry.date_taken)
+        return io.BytesIO(data)
@@ -15,14 +15,15 @@ from flask import Flask, jsonify, request, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from PIL import Image
-from PIL.ExifTags import TAGS
-
-try:
-    import psutil
-    PSUTIL_AVAILABLE = True
-except ImportError:
-    PSUTIL_AVAILABLE = False
-    print("[Warning] psutil not available. System monitoring disabled.")
+import json
+from array import array
+from collections import deque
+from library import PathList, PathTable, ShuffledSequence, SlideScheduler
+from filesystem import LocalFileSystem
+from media_index import MediaIndex
+from metadata import read_metadata
+from scanner import MediaScanner
+from sysstats import SystemStatsSampler
 
 if sys.version_info < (3, 7):
     print("Python 3.7 or newer is required.")
@@ -56,7 +57,30 @@ DEFAULT_CONFIG = {
         "shutdown_on_display_off": "true",
         "shutdown_countdown_seconds": "10",
         "sort_order": "random",
-        "sort_reverse": "false"
+        "sort_reverse": "false",
+        "shuffle_seed": "",
+        "upload_boost": "4.0",
+        "upload_boost_half_life_days": "7",
+        "shown_penalty": "0.5",
+        "favorite_boost": "3.0",
+        "deduplicate": "true",
+        "near_duplicates": "spread",
+        "near_duplicate_threshold": "8",
+        "near_duplicate_spacing": "25",
+        "caption_write_workers": "2",
+        "caption_storage": "embedded",
+        "caption_export": "false",
+        "thumbnail_cache_directory": "",
+        "thumbnail_cache_megabytes": "500",
+        "web_server": "production",
+        "web_workers": "8",
+        "upload_normalize": "false",
+        "upload_max_edge_factor": "1.5",
+        "upload_png_to_jpeg": "true",
+        "upload_originals_directory": "",
+        "upload_client_resize": "false",
+        "upload_max_megabytes": "80",
+        "upload_max_megapixels": "120"
     },
     "telegram": {
         "bot_token": "",
@@ -114,6 +138,17 @@ LOG_DIR = os.path.join(os.path.dirname(__file__), "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(LOG_DIR, "gallery.log")
 
+# Per-image show counts and favorites used by sort_order = weighted
+SHOW_STATS_PATH = os.path.join(os.path.dirname(__file__), "show_stats.json")
+# Image the random order had reached, with its shuffle_seed, so a restart resumes there
+POSITION_PATH = os.path.join(os.path.dirname(__file__), "slideshow_position.json")
+# Slides between saves of the position (it is also saved on shutdown)
+POSITION_SAVE_INTERVAL = 10
+# SQLite index of file sizes, mtimes and content hashes (see media_index.py)
+MEDIA_INDEX_PATH = os.path.join(os.path.dirname(__file__), "media_index.db")
+# Most burst images held back at once by near_duplicates = spread
+MAX_DEFERRED_IMAGES = 500
+
 # Setup rotating file handler (10MB max, keep 1 backups)
 file_handler = RotatingFileHandler(
     LOG_FILE,
@@ -223,6 +258,14 @@ def get_int_config(key, default):
         return default
 
 
+def get_float_setting(config_dict, key, default):
+    """Read a float from a settings dict (e.g. Slideshow.config), falling back to default"""
+    try:
+        return float(config_dict.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
 def get_bool_config(key, default):
     val = get_config_value(key, str(default)).lower()
     return val in ("1", "true", "yes", "on")
@@ -443,142 +486,9 @@ class TelegramNotifier:
 # ---------------- System Monitoring ----------------
 
 
-def get_cpu_temperature():
-    """Get CPU temperature (Raspberry Pi specific, very lightweight)"""
-    # Try Raspberry Pi vcgencmd first (native, no dependencies)
-    try:
-        result = subprocess.run(['vcgencmd', 'measure_temp'], 
-                              capture_output=True, text=True, timeout=1)
-        if result.returncode == 0:
-            temp_str = result.stdout.strip()
-            # Extract temperature value (format: "temp=45.2'C")
-            temp = float(temp_str.split('=')[1].split("'")[0])
-            return temp
-    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError, IndexError):
-        pass
-    
-    # Fallback to psutil only if available (for non-Pi systems)
-    if PSUTIL_AVAILABLE:
-        try:
-            temps = psutil.sensors_temperatures()
-            if temps:
-                for name, entries in temps.items():
-                    if entries:
-                        return entries[0].current
-        except Exception:
-            pass
-    
-    return None
-
-
-def get_memory_info():
-    """Get memory info - lightweight on Linux, psutil on Windows/Mac"""
-    # Try lightweight /proc/meminfo on Linux first
-    try:
-        with open('/proc/meminfo', 'r') as f:
-            meminfo = f.read()
-            # Parse MemAvailable (preferred) or MemFree
-            for line in meminfo.split('\n'):
-                if line.startswith('MemAvailable:'):
-                    # Format: "MemAvailable:    123456 kB"
-                    kb = int(line.split()[1])
-                    return kb / 1024  # Convert to MB
-                elif line.startswith('MemFree:'):
-                    kb = int(line.split()[1])
-                    return kb / 1024
-    except (FileNotFoundError, ValueError, IndexError):
-        pass
-    
-    # Fallback to psutil (works on Windows, Mac, and Linux)
-    if PSUTIL_AVAILABLE:
-        try:
-            mem = psutil.virtual_memory()
-            return mem.available / (1024 * 1024)
-        except Exception:
-            pass
-    
-    return None
-
-
-def get_cpu_usage():
-    """Get CPU usage - lightweight on Linux, psutil on Windows/Mac"""
-    # Try lightweight /proc/stat on Linux first
-    try:
-        with open('/proc/stat', 'r') as f:
-            line = f.readline()
-            # Format: "cpu  1234 0 5678 9012 0 0 0 0 0 0"
-            parts = line.split()
-            if len(parts) >= 8:
-                # Calculate CPU usage from idle time
-                user = int(parts[1])
-                nice = int(parts[2])
-                system = int(parts[3])
-                idle = int(parts[4])
-                iowait = int(parts[5])
-                
-                total = user + nice + system + idle + iowait
-                if total > 0:
-                    # Return non-idle percentage
-                    non_idle = user + nice + system + iowait
-                    return (non_idle / total) * 100
-    except (FileNotFoundError, ValueError, IndexError):
-        pass
-    
-    # Fallback to psutil (works on Windows, Mac, and Linux)
-    if PSUTIL_AVAILABLE:
-        try:
-            return psutil.cpu_percent(interval=0.1)  # Short interval for lighter check
-        except Exception:
-            pass
-    
-    return None
-
-
-def get_disk_usage(path='/'):
-    """Get disk usage - lightweight on Linux, psutil on Windows/Mac"""
-    # Try lightweight df command on Linux first
-    try:
-        result = subprocess.run(['df', '-B', '1', path], 
-                              capture_output=True, text=True, timeout=2)
-        if result.returncode == 0:
-            lines = result.stdout.strip().split('\n')
-            if len(lines) >= 2:
-                # Parse the header and data line
-                # Format: "Filesystem      1B-blocks       Used Available Use% Mounted on"
-                #         "/dev/mmcblk0p2 7122513920 5904424960 835575808  88% /"
-                parts = lines[1].split()
-                if len(parts) >= 4:
-                    total = int(parts[1])
-                    used = int(parts[2])
-                    available = int(parts[3])
-                    percent_used = (used / total) * 100 if total > 0 else 0
-                    return {
-                        'total': total,
-                        'used': used,
-                        'available': available,
-                        'percent_used': percent_used
-                    }
-    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError, IndexError):
-        pass
-    
-    # Fallback to psutil (works on Windows, Mac, and Linux)
-    if PSUTIL_AVAILABLE:
-        try:
-            usage = psutil.disk_usage(path)
-            return {
-                'total': usage.total,
-                'used': usage.used,
-                'available': usage.free,
-                'percent_used': usage.percent
-            }
-        except Exception:
-            pass
-    
-    return None
-
-
-def monitor_system_resources(telegram_notifier, check_interval=120):
-    """Monitor system resources using lightweight native OS commands"""
+def monitor_system_resources(telegram_notifier, system_stats, check_interval=120):
+    """Send alerts for low memory, sustained high CPU and high temperature from the
+    system stats sampler's snapshots"""
     # Alert thresholds
     MEMORY_THRESHOLD_MB = 100  # Alert if less than 100 MB free
     CPU_THRESHOLD_PERCENT = 80  # Alert if CPU > 80% for sustained period
@@ -592,16 +502,16 @@ def monitor_system_resources(telegram_notifier, check_interval=120):
     }
     alert_cooldown = 300  # 5 minutes between alerts of same type
     cpu_high_count = 0  # Count consecutive high CPU readings
-    last_cpu_total = None  # For calculating CPU delta
     
     print("[System Monitor] Starting lightweight system resource monitoring")
     
     while True:
         try:
             now = time.time()
+            stats = system_stats.snapshot()
             
-            # Check memory (lightweight /proc/meminfo)
-            free_mb = get_memory_info()
+            # Check memory
+            free_mb = stats.get('memory_free_mb')
             if free_mb is not None and free_mb < MEMORY_THRESHOLD_MB:
                 if now - last_alert_time['memory'] > alert_cooldown:
                     telegram_notifier.notify_system_alert(
@@ -611,8 +521,8 @@ def monitor_system_resources(telegram_notifier, check_interval=120):
                     )
                     last_alert_time['memory'] = now
             
-            # Check CPU (lightweight /proc/stat, non-blocking)
-            cpu_percent = get_cpu_usage()
+            # Check CPU (load over the sampler's last interval)
+            cpu_percent = stats.get('cpu_percent')
             if cpu_percent is not None:
                 if cpu_percent > CPU_THRESHOLD_PERCENT:
                     cpu_high_count += 1
@@ -628,8 +538,8 @@ def monitor_system_resources(telegram_notifier, check_interval=120):
                 else:
                     cpu_high_count = 0
             
-            # Check temperature (lightweight vcgencmd on Pi)
-            temp = get_cpu_temperature()
+            # Check temperature
+            temp = stats.get('cpu_temp')
             if temp is not None and temp > TEMP_THRESHOLD_C:
                 if now - last_alert_time['temperature'] > alert_cooldown:
                     telegram_notifier.notify_system_alert(
@@ -689,7 +599,8 @@ def scale_image(img, screen_w, screen_h, correction_h=1.0, correction_v=1.0):
 
 
 # ---------------- Web Server Setup ----------------
-app = Flask(__name__, static_folder='static')
+# static/ is served by web.py (fingerprinted asset names)
+app = Flask(__name__, static_folder=None)
 CORS(app)
 
 # Global reference to slideshow instance (set in main)
@@ -700,8 +611,13 @@ telegram_notifier = None
 
 # ---------------- Slideshow Class ----------------
 class Slideshow:
-    def __init__(self, folder, screen, display_time_seconds, config_dict, telegram_notifier=None):
+    def __init__(self, folder, screen, display_time_seconds, config_dict, telegram_notifier=None, filesystem=None,
+                 media_index=None):
         self.screen = screen
+        # Scanner and metadata readers go through self.fs (a MemoryFileSystem in benchmarks)
+        self.fs = filesystem or LocalFileSystem()
+        # Persistent per-file index; an in-memory one is used when none is given
+        self.media_index = media_index or MediaIndex(filesystem=self.fs)
         self.screen_w, self.screen_h = screen.get_size()
         self.display_time_seconds = display_time_seconds
         self.config = config_dict
@@ -714,14 +630,52 @@ class Slideshow:
 
         self.telegram = telegram_notifier
 
-        self.images = []
+        # Relative paths are interned in a compact table; queues hold 4-byte ids (see library.py)
+        self.path_table = PathTable()
+        self.images = PathList(self.path_table)
+        # Exact duplicates kept out of the playlist (see _collapse_duplicates)
+        self.hidden_duplicates = PathList(self.path_table)
+        self._index_pruned = False
         self.folder = folder
 
+        # Near-duplicate (burst shot) groups computed by the background MediaScanner.
+        # The scanner hands groups over in _pending_near_duplicates; they are applied
+        # on the slideshow thread by _apply_near_duplicates.
+        self.scanner = None
+        self.near_duplicate_groups = None
+        self._pending_near_duplicates = None
+        # Set by the scanner when it stored new content hashes (see duplicates_changed)
+        self._duplicates_pending = False
+        self._near_group_of = array('i')  # path id -> group number, -1 if none
+        self._group_last_shown = {}       # group number -> value of _slides_shown
+        self._slides_shown = 0
+        self._deferred = deque()          # path ids held back in spread mode
+        self._deferred_ids = set()
+
         self.history = []
         self.forward_stack = []
         self.current_index = -1
         self.current_img = None
         self.total_images = 0
+
+        # Random order is a seeded permutation over self.images (see _build_navigation_order).
+        # A fixed shuffle_seed in config.ini reproduces the same order across restarts; without
+        # one the seed saved in POSITION_PATH is reused, so either way the order resumes at the
+        # image saved there. A new seed is drawn only when nothing was saved.
+        try:
+            self.shuffle_seed = int(str(config_dict.get('shuffle_seed', '')).strip())
+        except ValueError:
+            self.shuffle_seed = self._saved_seed()
+            if self.shuffle_seed is None:
+                self.shuffle_seed = random.getrandbits(64)
+        self._slides_since_position_save = 0
+
+        # Weighted scheduler (sort_order = weighted) and persisted show counts/favorites,
+        # both created on first use
+        self.scheduler = None
+        self._scheduler_images = None
+        self._show_stats = None
+        self._unsaved_shows = 0
         
         # Web control state
         self.paused = False
@@ -1104,38 +1058,28 @@ class Slideshow:
         else:
             full_path = os.path.join(self.folder, img_path)
 
-        if not os.path.exists(full_path):
+        if not self.fs.exists(full_path):
             return None
 
         try:
             if date_type == 'date_taken':
-                # Try EXIF DateTimeOriginal first
-                img = Image.open(full_path)
-                exif_data = img._getexif()
-                date_obj = None
-                if exif_data:
-                    for tag, value in exif_data.items():
-                        tag_name = TAGS.get(tag, tag)
-                        if tag_name == 'DateTimeOriginal' and value:
-                            try:
-                                date_obj = datetime.datetime.strptime(str(value), '%Y:%m:%d %H:%M:%S')
-                                break
-                            except (ValueError, TypeError):
-                                pass
-                img.close()
+                # Try EXIF DateTimeOriginal (or XMP creation date) first; only the header is read
+                with self.fs.open(full_path) as f:
+                    image_metadata = read_metadata(f)
+                date_obj = image_metadata.date_taken if image_metadata else None
                 if date_obj is None:
-                    date_obj = datetime.datetime.fromtimestamp(os.path.getctime(full_path))
+                    date_obj = datetime.datetime.fromtimestamp(self.fs.getctime(full_path))
             elif date_type == 'date_created':
-                date_obj = datetime.datetime.fromtimestamp(os.path.getctime(full_path))
+                date_obj = datetime.datetime.fromtimestamp(self.fs.getctime(full_path))
             elif date_type == 'date_modified':
-                date_obj = datetime.datetime.fromtimestamp(os.path.getmtime(full_path))
+                date_obj = datetime.datetime.fromtimestamp(self.fs.getmtime(full_path))
             else:
                 return None
 
             return date_obj
         except Exception:
             # Fallback to file creation time
-            return datetime.datetime.fromtimestamp(os.path.getctime(full_path))
+            return datetime.datetime.fromtimestamp(self.fs.getctime(full_path))
 
     def sort_images(self, images):
         """Sort images based on configured sort_order"""
@@ -1144,9 +1088,9 @@ class Slideshow:
         print(f"[Slideshow] sort_images called with sort_order='{sort_order}', reverse_order={reverse_order}")
 
         if sort_order == 'random':
-            # Keep current random behavior
-            random.shuffle(images)
-            return images
+            # Keep scan order; the shuffle is applied lazily by _build_navigation_order
+            # so the shuffled list is never materialized
+            return self._as_path_list(images)
 
         # Create list of (image_path, sort_key) tuples
         image_sort_data = []
@@ -1172,8 +1116,8 @@ class Slideshow:
                     else:
                         full_path = os.path.join(self.folder, img_path)
 
-                    if os.path.exists(full_path):
-                        sort_key = os.path.getsize(full_path)
+                    if self.fs.exists(full_path):
+                        sort_key = self.fs.getsize(full_path)
 
                 elif sort_order in ['date_taken', 'date_created', 'date_modified']:
                     # Get file path for date operations
@@ -1188,7 +1132,6 @@ class Slideshow:
                         full_path = os.path.join(self.folder, img_path)
 
                     sort_key = self.get_image_date(img_path, sort_order)
-                    print(f"[Slideshow] Sort key for {os.path.basename(img_path)}: {sort_key} ({sort_order})")
 
                 elif sort_order == 'size':
                     # Get file path for size operations
@@ -1201,8 +1144,8 @@ class Slideshow:
                     else:
                         full_path = os.path.join(self.folder, img_path)
 
-                    if os.path.exists(full_path):
-                        sort_key = os.path.getsize(full_path)
+                    if self.fs.exists(full_path):
+                        sort_key = self.fs.getsize(full_path)
                     else:
                         sort_key = 0
 
@@ -1251,7 +1194,13 @@ class Slideshow:
 
         order_desc = "ascending" if not reverse_order else "descending"
         print(f"[Slideshow] Sorted {len(sorted_images)} images by {sort_order} ({order_desc})")
-        return sorted_images
+        return PathList(self.path_table, sorted_images)
+
+    def _as_path_list(self, images):
+        """Return images as a PathList backed by this slideshow's path table"""
+        if isinstance(images, PathList) and images.table is self.path_table:
+            return images
+        return PathList(self.path_table, images)
 
     def _image_exists_in_tracked_dirs(self, img_path):
         """Check if image exists in our 2 tracked directories"""
@@ -1267,35 +1216,52 @@ class Slideshow:
             # Check main images directory
             full_path = os.path.join(self.folder, img_path)
         
-        return os.path.exists(full_path) and os.path.isfile(full_path)
+        return self.fs.exists(full_path) and self.fs.isfile(full_path)
 
     def refresh_images(self):
         # Check if directory exists
-        if not os.path.exists(self.folder):
+        if not self.fs.exists(self.folder):
             print(f"[Error] Images directory does not exist: {self.folder}")
             return
-        if not os.path.isdir(self.folder):
+        if not self.fs.isdir(self.folder):
             print(f"[Error] Images path is not a directory: {self.folder}")
             return
         
+        # Mark everything already queued, in history or on screen (one byte per interned path),
+        # so checking each scanned file is O(1) instead of a scan of the whole queue
+        self.images = self._as_path_list(self.images)
+        known = bytearray(len(self.path_table))
+        for path_id in self.images.ids:
+            known[path_id] = 1
+        for path_id in self.hidden_duplicates.ids:
+            known[path_id] = 1
+        for img in self.history + [self.current_img]:
+            path_id = self.path_table.lookup(img) if img else None
+            if path_id is not None:
+                known[path_id] = 1
+
+        def is_known(rel_path):
+            path_id = self.path_table.lookup(rel_path)
+            return path_id is not None and path_id < len(known) and known[path_id]
+
         # Recursively scan for images (supports subfolders)
-        new_images = []
+        new_images = PathList(self.path_table)
         try:
             # Scan main images directory
-            for root, _, files in os.walk(self.folder):
+            for root, _, files in self.fs.walk(self.folder):
                 for f in files:
                     if f.lower().endswith((".jpg", ".jpeg", ".png")):
                         # Store relative path from base folder
                         rel_path = os.path.relpath(os.path.join(root, f), self.folder)
                         # Check if image is already in queue, history, or is current image
-                        if rel_path not in self.images and rel_path not in self.history and rel_path != self.current_img:
+                        if not is_known(rel_path):
                             new_images.append(rel_path)
             
             # Also scan upload directory if it's separate from images directory
             upload_dir = self.config.get('upload_directory', '').strip()
             if upload_dir:
                 upload_dir = os.path.expanduser(upload_dir)
-                if os.path.exists(upload_dir) and os.path.isdir(upload_dir):
+                if self.fs.exists(upload_dir) and self.fs.isdir(upload_dir):
                     # Check if upload_dir is within self.folder (already scanned by os.walk)
                     try:
                         # Normalize paths for comparison
@@ -1312,7 +1278,7 @@ class Slideshow:
                     if not is_subdirectory:
                         # Upload directory is separate, scan it too
                         print(f"[Slideshow] Also scanning upload directory: {upload_dir}")
-                        for root, _, files in os.walk(upload_dir):
+                        for root, _, files in self.fs.walk(upload_dir):
                             for f in files:
                                 if f.lower().endswith((".jpg", ".jpeg", ".png")):
                                     # Store as relative path from upload_dir, with "uploaded/" prefix
@@ -1320,7 +1286,7 @@ class Slideshow:
                                     # Use a prefix to distinguish uploaded images
                                     upload_rel_path = os.path.join("uploaded", rel_path).replace("\\", "/")
                                     # Check if image is already in queue, history, or is current image
-                                    if upload_rel_path not in self.images and upload_rel_path not in self.history and upload_rel_path != self.current_img:
+                                    if not is_known(upload_rel_path):
                                         new_images.append(upload_rel_path)
         except PermissionError as e:
             print(f"[Error] Permission denied accessing {self.folder}: {e}")
@@ -1331,7 +1297,14 @@ class Slideshow:
             
         # CLEAN QUEUES: Remove images no longer in our 2 tracked directories
         original_count = len(self.images) + len(self.history)
-        self.images = [img for img in self.images if self._image_exists_in_tracked_dirs(img)]
+        kept_images = PathList(self.path_table)
+        removed_images = []
+        for img in self.images:
+            if self._image_exists_in_tracked_dirs(img):
+                kept_images.append(img)
+            else:
+                removed_images.append(img)
+        self.images = kept_images
         self.history = [img for img in self.history if self._image_exists_in_tracked_dirs(img)]
 
         if self.current_img and not self._image_exists_in_tracked_dirs(self.current_img):
@@ -1339,6 +1312,20 @@ class Slideshow:
 
         cleaned_count = original_count - (len(self.images) + len(self.history))
 
+        if removed_images:
+            self.media_index.remove(removed_images)
+            if self.hidden_duplicates:
+                # A removed image may have been the copy we kept; re-evaluate the hidden ones
+                new_images.extend(img for img in self.hidden_duplicates if self._image_exists_in_tracked_dirs(img))
+                self.hidden_duplicates = PathList(self.path_table)
+
+        if new_images:
+            self._index_images(new_images)
+            if self.config.get('deduplicate', 'true').lower() == 'true' or self.near_duplicate_mode() == 'hide':
+                new_images = self._collapse_duplicates(new_images)
+            if self.scanner:
+                self.scanner.wake()
+
         if new_images or cleaned_count > 0:
             # Add new images to the queue
             self.images.extend(new_images)
@@ -1350,6 +1337,202 @@ class Slideshow:
                 self._all_images = []
         print(f"[Slideshow] Found {len(new_images)} new images, total queue={self.total_images}")
 
+    def add_images(self, paths):
+        """Add just-saved files (relative paths, e.g. uploads) to the queue without rescanning the
+        library; returns the number added. Safe to call from other threads."""
+        with self.control_lock:
+            self.images = self._as_path_list(self.images)
+            # One byte per interned path, as in refresh_images
+            present = bytearray(len(self.path_table))
+            for path_id in self.images.ids:
+                present[path_id] = 1
+            for path_id in self.hidden_duplicates.ids:
+                present[path_id] = 1
+            new_images = PathList(self.path_table)
+            for img in paths:
+                path_id = self.path_table.lookup(img)
+                known = path_id is not None and path_id < len(present) and present[path_id]
+                if not known and self._image_exists_in_tracked_dirs(img):
+                    new_images.append(img)
+            if not new_images:
+                return 0
+
+            self._index_images(new_images)
+            if self.config.get('deduplicate', 'true').lower() == 'true' or self.near_duplicate_mode() == 'hide':
+                new_images = self._collapse_duplicates(new_images)
+            if self.scanner:
+                self.scanner.wake()
+            self.images.extend(new_images)
+            self.images = self.sort_images(self.images)
+            self.total_images = len(self.images)
+            self.rebuild_navigation_preserve_current()
+            print(f"[Slideshow] Added {len(new_images)} new images, total queue={self.total_images}")
+            return len(new_images)
+
+    def _index_images(self, new_images):
+        """Record size/mtime of new images in the media index (hashes are computed later)"""
+        rows = []
+        for img in new_images:
+            try:
+                stat = self.fs.stat(self._resolve_image_path(img))
+                rows.append((img, stat.st_size, stat.st_mtime))
+            except OSError:
+                pass
+        self.media_index.update_stats(rows)
+        if not self._index_pruned:
+            # Forget files deleted while we were not running
+            self.media_index.prune(list(self.images) + list(new_images) + list(self.hidden_duplicates))
+            self._index_pruned = True
+
+    def _collapse_duplicates(self, new_images):
+        """Hide duplicates so each photo gets one playlist entry.
+
+        Exact duplicates come from the full hashes stored in the index (the
+        scanner computes them, so nothing is read from disk here); with
+        near_duplicates = hide the scanner's burst groups are
+        collapsed too. Of each group the main-library copy with the shortest
+        path is kept; the rest go to self.hidden_duplicates. Returns new_images
+        minus the hidden ones (self.images is filtered in place)."""
+        groups = []
+        if self.config.get('deduplicate', 'true').lower() == 'true':
+            groups.extend(self.media_index.find_duplicates())
+        if self.near_duplicate_mode() == 'hide' and self.near_duplicate_groups:
+            groups.extend(list(group) for group in self.near_duplicate_groups)
+
+        hidden = bytearray(len(self.path_table))
+        for path_id in self.hidden_duplicates.ids:
+            hidden[path_id] = 1
+        newly_hidden = 0
+        for group in groups:
+            group.sort(key=lambda p: (p.startswith('uploaded/'), len(p), p))
+            for img in group[1:]:
+                path_id = self.path_table.lookup(img)
+                if path_id is not None and path_id < len(hidden) and not hidden[path_id]:
+                    hidden[path_id] = 1
+                    self.hidden_duplicates.ids.append(path_id)
+                    newly_hidden += 1
+                    print(f"[Slideshow] Hiding duplicate {img} (keeping {group[0]})")
+
+        if not newly_hidden:
+            return new_images
+        self.images = PathList.from_ids(self.path_table, [i for i in self.images.ids if not hidden[i]])
+        return PathList.from_ids(self.path_table, [i for i in new_images.ids if not hidden[i]])
+
+    def near_duplicate_mode(self):
+        """Return the near_duplicates setting: 'spread', 'hide' or 'off'"""
+        mode = str(self.config.get('near_duplicates', 'spread')).strip().lower()
+        return mode if mode in ('spread', 'hide', 'off') else 'spread'
+
+    def near_duplicate_threshold(self):
+        """Maximum number of differing dHash bits (out of 64) for two images to count as near-duplicates"""
+        try:
+            return max(0, min(32, int(self.config.get('near_duplicate_threshold', '8'))))
+        except (ValueError, TypeError):
+            return 8
+
+    def duplicates_changed(self):
+        """The scanner stored new content hashes; called from the scanner thread"""
+        self._duplicates_pending = True
+
+    def _apply_duplicates(self):
+        """Hide exact duplicates found since the last check (runs on the slideshow thread)"""
+        self._duplicates_pending = False
+        before = len(self.hidden_duplicates)
+        self._collapse_duplicates(PathList(self.path_table))
+        if len(self.hidden_duplicates) != before:
+            self.total_images = len(self.images)
+            self.rebuild_navigation_preserve_current()
+
+    def set_near_duplicates(self, groups):
+        """Hand over near-duplicate groups (lists of paths); called from the scanner thread"""
+        self._pending_near_duplicates = groups
+
+    def _apply_near_duplicates(self):
+        """Take over groups from the scanner (runs on the slideshow thread, before advancing)"""
+        groups, self._pending_near_duplicates = self._pending_near_duplicates, None
+        if groups is None:
+            return
+        self.near_duplicate_groups = groups
+        group_of = array('i', [-1]) * len(self.path_table)
+        for number, group in enumerate(groups):
+            for img in group:
+                path_id = self.path_table.lookup(img)
+                if path_id is not None:
+                    group_of[path_id] = number
+        self._near_group_of = group_of
+        self._group_last_shown = {}
+
+        if self.near_duplicate_mode() == 'hide':
+            # Re-evaluate everything hidden so far against the new groups
+            before = sorted(self.hidden_duplicates.ids)
+            restored, self.hidden_duplicates = self.hidden_duplicates, PathList(self.path_table)
+            kept = self._collapse_duplicates(restored)
+            if sorted(self.hidden_duplicates.ids) != before:
+                self.images.extend(kept)
+                self.images = self.sort_images(self.images)
+                self.total_images = len(self.images)
+                self.rebuild_navigation_preserve_current()
+
+    def _near_group(self, img):
+        path_id = self.path_table.lookup(img) if img else None
+        if path_id is None or path_id >= len(self._near_group_of):
+            return -1
+        return self._near_group_of[path_id]
+
+    def _shown_too_recently(self, img):
+        """True if another image of img's near-duplicate group was shown within near_duplicate_spacing slides"""
+        group = self._near_group(img)
+        if group < 0 or group not in self._group_last_shown:
+            return False
+        try:
+            spacing = int(self.config.get('near_duplicate_spacing', '25'))
+        except (ValueError, TypeError):
+            spacing = 25
+        return self._slides_shown - self._group_last_shown[group] < spacing
+
+    def _record_slide_shown(self, img):
+        self._slides_shown += 1
+        group = self._near_group(img)
+        if group >= 0:
+            self._group_last_shown[group] = self._slides_shown
+
+    def _advance_circular(self):
+        """Step forward (wrapping) through _all_images and return the next image.
+
+        With near_duplicates = spread, an image whose burst group was shown in
+        the last near_duplicate_spacing slides is held back in self._deferred
+        and shown once enough other slides have passed, so bursts are spread
+        out instead of played back to back. current_index does not move when a
+        held-back image is shown."""
+        spread = self.near_duplicate_mode() == 'spread' and self.near_duplicate_groups
+        if spread:
+            while self._deferred:
+                path_id = self._deferred[0]
+                if path_id not in self._deferred_ids:
+                    self._deferred.popleft()
+                    continue
+                img = self.path_table.path(path_id)
+                if self._shown_too_recently(img):
+                    break
+                self._deferred.popleft()
+                self._deferred_ids.discard(path_id)
+                return img
+
+        for _ in range(len(self._all_images)):
+            self.current_index = (self.current_index + 1) % len(self._all_images)
+            img = self._all_images[self.current_index]
+            if not spread or len(self._deferred_ids) >= MAX_DEFERRED_IMAGES or not self._shown_too_recently(img):
+                break
+            path_id = self.path_table.lookup(img)
+            if path_id in self._deferred_ids:
+                # Came round again while still held back; show it now
+                break
+            self._deferred.append(path_id)
+            self._deferred_ids.add(path_id)
+        if spread:
+            self._deferred_ids.discard(self.path_table.lookup(img))
+        return img
+
     def rebuild_navigation_preserve_current(self):
         """Rebuild _all_images from self.images while preserving current image position"""
         if not self.images:
@@ -1361,10 +1544,7 @@ class Slideshow:
             return
         
         # Build new _all_images (same logic as next_image)
-        self._all_images = []
-        temp_queue = self.images[:]
-        while temp_queue:
-            self._all_images.append(temp_queue.pop())
+        self._all_images = self._build_navigation_order()
         
         self.total_images = len(self._all_images)
         
@@ -1374,8 +1554,7 @@ class Slideshow:
             self.current_index = self._all_images.index(self.current_img)
             # Keep existing history but ensure it's consistent
             self.history = [img for img in self.history if img in self._all_images]
-            if self.current_img not in self.history:
-                self.history.append(self.current_img)
+            self._remember_history(self.current_img)
         else:
             # Current image was deleted - move to nearest valid position
             if self._all_images:
@@ -1391,18 +1570,222 @@ class Slideshow:
         
         print(f"[Slideshow] Navigation rebuilt, current: {self.current_index+1}/{self.total_images}")
 
+    def _build_navigation_order(self):
+        """Return the circular viewing order for self.images without copying it in random mode"""
+        # Held-back burst images may no longer be in the library
+        self._deferred.clear()
+        self._deferred_ids.clear()
+        sort_order = self.config.get('sort_order', 'random')
+        if sort_order == 'random':
+            return ShuffledSequence(self.images, self.shuffle_seed)
+        if sort_order == 'weighted':
+            # Weighted picks come from the scheduler; the library order only backs "n / total"
+            return self.images
+        # self.images is sorted with the last image first (it used to be consumed with pop()),
+        # so reversing it gives the correct viewing order
+        return self.images[::-1]
+
+    def _remember_history(self, img):
+        """Append img to the bounded recently-shown history (image_history_size entries)"""
+        try:
+            history_size = max(1, int(self.config.get('image_history_size', '5')))
+        except (ValueError, TypeError):
+            history_size = 5
+        if not self.history or self.history[-1] != img:
+            self.history.append(img)
+        if len(self.history) > history_size:
+            del self.history[:-history_size]
+
+    def _resolve_image_path(self, img_path):
+        """Return the full filesystem path for a relative image path (handles uploaded/ prefix)"""
+        if img_path.startswith('uploaded/'):
+            upload_dir = self.config.get('upload_directory', '').strip()
+            if upload_dir:
+                return os.path.join(os.path.expanduser(upload_dir), img_path[9:])
+        return os.path.join(self.folder, img_path)
+
+    def _relative_image_path(self, full_path):
+        """Inverse of _resolve_image_path: the relative image path for a file, or None if outside the library"""
+        full_path = os.path.abspath(full_path)
+        folder = os.path.abspath(self.folder)
+        if full_path.startswith(folder + os.sep):
+            return os.path.relpath(full_path, folder)
+        upload_dir = self.config.get('upload_directory', '').strip()
+        if upload_dir:
+            upload_dir = os.path.abspath(os.path.expanduser(upload_dir))
+            if full_path.startswith(upload_dir + os.sep):
+                return os.path.join("uploaded", os.path.relpath(full_path, upload_dir)).replace("\\", "/")
+        return None
+
+    @staticmethod
+    def _saved_seed():
+        """The shuffle_seed stored by save_position, or None if there is no readable one"""
+        try:
+            with open(POSITION_PATH, 'r', encoding='utf-8') as f:
+                seed = json.load(f).get('shuffle_seed')
+        except (OSError, ValueError, AttributeError):
+            return None
+        return seed if isinstance(seed, int) else None
+
+    def _saved_position(self):
+        """Position in _all_images of the image saved by save_position, if it was saved in random
+        order with the current shuffle_seed and is still in the library; otherwise 0"""
+        if self.config.get('sort_order', 'random') != 'random':
+            return 0
+        try:
+            with open(POSITION_PATH, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('shuffle_seed') != self.shuffle_seed:
+                return 0
+            position = self._all_images.index(saved.get('image'))
+        except (OSError, ValueError, AttributeError):
+            return 0
+        print(f"[Slideshow] Resuming random order at {saved['image']}")
+        return position
+
+    def save_position(self):
+        """Persist the current image of random order with its shuffle_seed (atomic replace)"""
+        self._slides_since_position_save = 0
+        if self.config.get('sort_order', 'random') != 'random' or not self.current_img:
+            return
+        try:
+            temp_path = POSITION_PATH + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'shuffle_seed': self.shuffle_seed, 'image': self.current_img}, f)
+            os.replace(temp_path, POSITION_PATH)
+        except OSError as e:
+            print(f"[Slideshow] Could not save position: {e}")
+
+    def _get_show_stats(self):
+        """Return {image path: [show count, favorite]} loaded from SHOW_STATS_PATH"""
+        if self._show_stats is None:
+            self._show_stats = {}
+            try:
+                if os.path.exists(SHOW_STATS_PATH):
+                    with open(SHOW_STATS_PATH, 'r', encoding='utf-8') as f:
+                        self._show_stats = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[Slideshow] Could not read show stats: {e}")
+        return self._show_stats
+
+    def save_show_stats(self):
+        """Persist show counts and favorites (atomic replace)"""
+        if self._show_stats is None:
+            return
+        try:
+            temp_path = SHOW_STATS_PATH + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._show_stats, f)
+            os.replace(temp_path, SHOW_STATS_PATH)
+            self._unsaved_shows = 0
+        except OSError as e:
+            print(f"[Slideshow] Could not save show stats: {e}")
+
+    def is_favorite(self, img_path):
+        stats = self._get_show_stats().get(img_path)
+        return bool(stats and stats[1])
+
+    def set_favorite(self, img_path, favorite):
+        """Mark or unmark an image as favorite; favorites get favorite_boost in weighted order"""
+        stats = self._get_show_stats().setdefault(img_path, [0, False])
+        stats[1] = bool(favorite)
+        if self.scheduler is not None:
+            path_id = self.path_table.lookup(img_path)
+            if path_id is not None:
+                self.scheduler.set_favorite(path_id, favorite)
+        self.save_show_stats()
+
+    def _get_scheduler(self):
+        """Return the weighted scheduler, adding/removing only the images that changed since last use"""
+        if self.scheduler is None:
+            self.scheduler = SlideScheduler(
+                upload_boost=get_float_setting(self.config, 'upload_boost', 4.0),
+                boost_half_life_days=get_float_setting(self.config, 'upload_boost_half_life_days', 7.0),
+                shown_penalty=get_float_setting(self.config, 'shown_penalty', 0.5),
+                favorite_boost=get_float_setting(self.config, 'favorite_boost', 3.0))
+        if self._scheduler_images is not self.images:
+            self.images = self._as_path_list(self.images)
+            stats = self._get_show_stats()
+            wanted = bytearray(len(self.path_table))
+            for path_id in self.images.ids:
+                wanted[path_id] = 1
+            for path_id in range(len(wanted)):
+                if wanted[path_id] and path_id not in self.scheduler:
+                    img = self.path_table.path(path_id)
+                    added_at = None
+                    if img.startswith('uploaded/'):
+                        try:
+                            added_at = self.fs.getmtime(self._resolve_image_path(img))
+                        except OSError:
+                            pass
+                    shows, favorite = stats.get(img, (0, False))
+                    self.scheduler.add(path_id, added_at=added_at, shows=shows, favorite=favorite)
+                elif not wanted[path_id] and path_id in self.scheduler:
+                    self.scheduler.remove(path_id)
+            self._scheduler_images = self.images
+        self.scheduler.refresh_boosts()
+        return self.scheduler
+
+    def _next_weighted_image(self):
+        """Advance to an image picked by the weighted scheduler (sort_order = weighted)"""
+        if self.forward_stack:
+            self.current_img = self.forward_stack.pop()
+        else:
+            scheduler = self._get_scheduler()
+            current_id = self.path_table.lookup(self.current_img) if self.current_img else None
+            path_id = scheduler.sample(exclude=current_id)
+            if path_id is None:
+                self.current_img = None
+                return
+            if self.near_duplicate_mode() == 'spread':
+                # Re-draw a few times rather than show two frames of the same burst close together
+                for _ in range(4):
+                    if not self._shown_too_recently(self.path_table.path(path_id)):
+                        break
+                    path_id = scheduler.sample(exclude=current_id)
+            self.current_img = self.path_table.path(path_id)
+            self._record_slide_shown(self.current_img)
+            scheduler.record_shown(path_id)
+            stats = self._get_show_stats().setdefault(self.current_img, [0, False])
+            stats[0] += 1
+            self._unsaved_shows += 1
+            if self._unsaved_shows >= 10:
+                self.save_show_stats()
+
+        # Navigation order is the library order, used for the "n / total" display
+        self._all_images = self.images
+        self.total_images = len(self.images)
+        try:
+            self.current_index = self.images.index(self.current_img)
+        except ValueError:
+            self.current_index = 0
+        self._remember_history(self.current_img)
+
+        print(f"[Slideshow] Next image (weighted) {self.current_index+1}/{self.total_images}: {self.current_img}")
+        if self.telegram and self.current_img:
+            self.telegram.notify_image_change(self.current_img, self.current_index + 1, self.total_images)
+
     def next_image(self):
-        if hasattr(self, '_all_images') and self._all_images:
-            # Use circular navigation with full image set
-            if self.current_index < len(self._all_images) - 1:
-                self.current_index += 1
-            else:
-                # Wrap around to the beginning
-                self.current_index = 0
+        if self._duplicates_pending:
+            self._apply_duplicates()
+        if self._pending_near_duplicates is not None:
+            self._apply_near_duplicates()
 
-            self.current_img = self._all_images[self.current_index]
+        if self.config.get('sort_order', 'random') == 'weighted':
+            if not self.images and not self.history:
+                self.refresh_images()
+            self._next_weighted_image()
+            return
+
+        if hasattr(self, '_all_images') and self._all_images:
+            # Use circular navigation with full image set (wraps around to the beginning)
+            self.current_img = self._advance_circular()
+            self._record_slide_shown(self.current_img)
+            self._slides_since_position_save += 1
+            if self._slides_since_position_save >= POSITION_SAVE_INTERVAL:
+                self.save_position()
             # Update history for consistency
-            self.history = self._all_images[:self.current_index + 1]
+            self._remember_history(self.current_img)
             self.forward_stack = []
 
             print(f"[Slideshow] Next image {self.current_index+1}/{len(self._all_images)}: {self.current_img}")
@@ -1417,20 +1800,15 @@ class Slideshow:
 
             if self.images and (not hasattr(self, '_all_images') or not self._all_images):
                 # Build the complete image list for circular navigation
-                # self.images is already sorted with latest dates first
-                # Popping gives us earliest dates first (correct viewing order)
-                self._all_images = []
-                temp_queue = self.images[:]
-                while temp_queue:
-                    self._all_images.append(temp_queue.pop())
-                # _all_images now has earliest dates first (correct viewing order)
+                self._all_images = self._build_navigation_order()
 
                 self.total_images = len(self._all_images)
 
-                # Start circular navigation
-                self.current_index = 0
+                # Start circular navigation (where a previous run with the same shuffle left off)
+                self.current_index = self._saved_position()
                 self.current_img = self._all_images[self.current_index]
-                self.history = [self._all_images[0]]
+                self._record_slide_shown(self.current_img)
+                self.history = [self.current_img]
                 self.forward_stack = []
 
                 print(f"[Slideshow] Next image {self.current_index+1}/{len(self._all_images)}: {self.current_img}")
@@ -1468,6 +1846,18 @@ class Slideshow:
                 self.telegram.notify_image_change(self.current_img, self.current_index + 1, self.total_images)
 
     def prev_image(self):
+        if self.config.get('sort_order', 'random') == 'weighted':
+            # Weighted picks are not a fixed order; step back through recent history instead
+            if len(self.history) > 1:
+                self.forward_stack.append(self.history.pop())
+                self.current_img = self.history[-1]
+                if self.current_img in self.images:
+                    self.current_index = self.images.index(self.current_img)
+                print(f"[Slideshow] Previous image (weighted): {self.current_img}")
+                if self.telegram and self.current_img:
+                    self.telegram.notify_image_change(self.current_img, self.current_index + 1, self.total_images)
+            return
+
         if hasattr(self, '_all_images') and self._all_images:
             # Use circular navigation with full image set
             if self.current_index > 0:
@@ -1479,13 +1869,17 @@ class Slideshow:
 
             self.current_img = self._all_images[self.current_index]
             # Update history for consistency
-            self.history = self._all_images[:self.current_index + 1]
+            self._remember_history(self.current_img)
             self.forward_stack = []
 
             print(f"[Slideshow] Previous image {self.current_index+1}/{len(self._all_images)}: {self.current_img}")
             # Notify Telegram of image change
             if self.telegram and self.current_img:
                 self.telegram.notify_image_change(self.current_img, self.current_index + 1, len(self._all_images))
+        elif self.images and self.current_img in self.images:
+            # Navigation was cleared by a refresh; rebuild it around the current image and step back
+            self.rebuild_navigation_preserve_current()
+            self.prev_image()
         else:
             # Fallback to old navigation logic
             if self.current_index > 0:
@@ -1499,6 +1893,24 @@ class Slideshow:
                     self.telegram.notify_image_change(self.current_img, self.current_index + 1, self.total_images)
             # No wrap-around in fallback mode
 
+    def show_image(self, img_path):
+        """Jump to img_path (e.g. a search result); the slideshow continues from there.
+
+        Returns False if the file does not exist."""
+        if not self.fs.exists(self._resolve_image_path(img_path)):
+            return False
+        if hasattr(self, '_all_images') and self._all_images and img_path in self._all_images:
+            # Keep circular navigation going from the image's position
+            self.current_index = self._all_images.index(img_path)
+        self.current_img = img_path
+        self._record_slide_shown(img_path)
+        self._remember_history(img_path)
+        self.forward_stack = []
+        print(f"[Slideshow] Showing {img_path}")
+        if self.telegram:
+            self.telegram.notify_image_change(img_path, self.current_index + 1, self.total_images)
+        return True
+
     def is_display_on(self):
         # Check for manual override first
         if self.manual_display_override is not None:
@@ -1574,9 +1986,11 @@ class Slideshow:
 
                 # Only advance if not paused and not manually navigated
                 if not self.paused and not manual_navigation:
-                    self.next_image()
-                    self.draw_image()
-                    pygame.display.flip()
+                    # Uploads and web controls replace the queue under this lock (see add_images)
+                    with self.control_lock:
+                        self.next_image()
+                        self.draw_image()
+                        pygame.display.flip()
                     # Reset countdown timer
                     self.image_display_start_time = time.time()
 
@@ -1744,7 +2158,30 @@ def main():
         'shutdown_on_display_off': get_config_value('shutdown_on_display_off', 'true'),
         'shutdown_countdown_seconds': get_config_value('shutdown_countdown_seconds', '10'),
         'sort_order': get_config_value('sort_order', 'random'),
-        'sort_reverse': get_config_value('sort_reverse', 'false')
+        'sort_reverse': get_config_value('sort_reverse', 'false'),
+        'shuffle_seed': get_config_value('shuffle_seed', ''),
+        'upload_boost': get_config_value('upload_boost', '4.0'),
+        'upload_boost_half_life_days': get_config_value('upload_boost_half_life_days', '7'),
+        'shown_penalty': get_config_value('shown_penalty', '0.5'),
+        'favorite_boost': get_config_value('favorite_boost', '3.0'),
+        'deduplicate': get_config_value('deduplicate', 'true'),
+        'near_duplicates': get_config_value('near_duplicates', 'spread'),
+        'near_duplicate_threshold': get_config_value('near_duplicate_threshold', '8'),
+        'near_duplicate_spacing': get_config_value('near_duplicate_spacing', '25'),
+        'caption_write_workers': get_config_value('caption_write_workers', '2'),
+        'caption_storage': get_config_value('caption_storage', 'embedded'),
+        'caption_export': get_config_value('caption_export', 'false'),
+        'thumbnail_cache_directory': get_config_value('thumbnail_cache_directory', ''),
+        'thumbnail_cache_megabytes': get_config_value('thumbnail_cache_megabytes', '500'),
+        'web_server': get_config_value('web_server', 'production'),
+        'web_workers': get_config_value('web_workers', '8'),
+        'upload_normalize': get_config_value('upload_normalize', 'false'),
+        'upload_max_edge_factor': get_config_value('upload_max_edge_factor', '1.5'),
+        'upload_png_to_jpeg': get_config_value('upload_png_to_jpeg', 'true'),
+        'upload_originals_directory': get_config_value('upload_originals_directory', ''),
+        'upload_client_resize': get_config_value('upload_client_resize', 'false'),
+        'upload_max_megabytes': get_config_value('upload_max_megabytes', '80'),
+        'upload_max_megapixels': get_config_value('upload_max_megapixels', '120')
     }
 
     # Initialize Telegram notifier
@@ -1752,7 +2189,8 @@ def main():
     telegram_notifier = TelegramNotifier(TELEGRAM_CONFIG)
 
     # Pass config values to Slideshow
-    slideshow = Slideshow(images_directory, screen, display_time_seconds, slideshow_config, telegram_notifier)
+    slideshow = Slideshow(images_directory, screen, display_time_seconds, slideshow_config, telegram_notifier,
+                          media_index=MediaIndex(MEDIA_INDEX_PATH))
     
     # Set global reference for web API
     global slideshow_instance
@@ -1762,24 +2200,32 @@ def main():
     if telegram_notifier:
         telegram_notifier.notify_startup()
     
+    # Memory, CPU, temperature and disk are sampled once for the web UI and the monitor
+    system_stats = SystemStatsSampler()
+    system_stats.start()
+    
     # Initialize web routes
-    web.init_web(app, slideshow_instance, telegram_notifier, CONFIG_PATH, LOG_FILE, logger)
+    web.init_web(app, slideshow_instance, telegram_notifier, CONFIG_PATH, LOG_FILE, logger, system_stats)
     
     # Start web server in background thread
     web_thread = threading.Thread(target=web.start_web_server, kwargs={'host': '0.0.0.0', 'port': 5000}, daemon=True)
     web_thread.start()
     print("[Startup] Web interface available at http://0.0.0.0:5000")
     
-    # Start system monitoring in background thread (lightweight, works without psutil)
+    # Start system monitoring in background thread (reads the sampler's snapshots)
     if telegram_notifier:
         monitor_thread = threading.Thread(
             target=monitor_system_resources, 
-            args=(telegram_notifier,),
+            args=(telegram_notifier, system_stats),
             kwargs={'check_interval': 120},  # Check every 2 minutes (lighter)
             daemon=True
         )
         monitor_thread.start()
-        print("[Startup] System monitoring started (lightweight mode)")
+        print("[Startup] System monitoring started")
+    
+    # Caption caching and perceptual hashing run off the render thread
+    slideshow.scanner = MediaScanner(slideshow, read_caption=web.read_image_caption)
+    slideshow.scanner.start()
     
     # Run slideshow (this blocks)
     try:
@@ -1787,6 +2233,9 @@ def main():
     except KeyboardInterrupt:
         print("\n[Shutdown] Interrupted by user")
     finally:
+        web.stop_web_server()
+        slideshow.save_show_stats()
+        slideshow.save_position()
         # Send shutdown notification
         if telegram_notifier:
             telegram_notifier.notify_shutdown()
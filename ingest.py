@@ -0,0 +1,392 @@
+"""
+Upload ingest for piGallery
+The web server receives a whole request body before the app sees it (waitress
+buffers it, refusing bodies over the upload limit), so uploads are checked as
+they are copied out of that buffer: anything that isn't a JPEG or PNG, is
+larger than upload_max_megabytes or has more than upload_max_megapixels
+according to its header is refused without copying the rest into the upload
+directory or decoding it, and damaged files are refused before the slideshow
+ever tries to load them. Accepted files
+are renamed into place under a name nobody else has.
+
+Optional normalization of uploaded photos (upload_normalize): the EXIF rotation
+is applied to the pixels, photos larger than the screen needs are scaled down
+and opaque PNGs become JPEGs, so uploads are cheap to decode from then on and
+take less space on the SD card.
+"""
+
+import itertools
+import os
+import shutil
+import tempfile
+
+from PIL import Image, ImageOps
+
+from metadata import PNG_SIGNATURE, read_metadata, write_caption
+
+# JPEG quality of normalized uploads
+NORMALIZED_JPEG_QUALITY = 90
+# EXIF Orientation tag
+ORIENTATION_TAG = 0x0112
+# Pointers from IFD0 to the Exif and GPS IFDs, and from the Exif IFD to the Interoperability IFD
+EXIF_IFD_TAG = 0x8769
+GPS_IFD_TAG = 0x8825
+INTEROP_IFD_TAG = 0xA005
+# Exif PixelXDimension / PixelYDimension (the size of the image the data describes)
+PIXEL_X_DIMENSION_TAG = 0xA002
+PIXEL_Y_DIMENSION_TAG = 0xA003
+# Bytes read at a time while checking a file on disk
+SNIFF_BUFFER_SIZE = 64 * 1024
+# JPEG start-of-frame markers (C4, C8 and CC are other segments), which hold the image size
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Extension given to files whose name doesn't match their content
+FORMAT_EXTENSIONS = {'JPEG': ('.jpg', '.jpeg'), 'PNG': ('.png',)}
+
+
+class RejectedUpload(ValueError):
+    """An upload that is not an image the slideshow can show; the message says why"""
+
+
+class UploadTooLarge(RejectedUpload):
+    """An upload over the size or pixel limit"""
+
+
+class ImageSniffer:
+    """Identifies a JPEG or PNG from its first bytes as they are fed in.
+
+    feed() raises RejectedUpload as soon as the data can't be a JPEG or PNG
+    and UploadTooLarge once more than max_bytes were fed or the header gives
+    more than max_pixels, so a decompression bomb is refused after its first
+    few bytes. Once the header was read, format, width and height are set and
+    only the byte count is kept. finish() checks that the header was
+    complete."""
+
+    def __init__(self, max_bytes, max_pixels):
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.size = 0
+        self.format = None
+        self.width = None
+        self.height = None
+        self._buffer = bytearray()
+        # Bytes of a JPEG segment still to be passed over
+        self._skip = 0
+
+    def feed(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"File is larger than {self.max_bytes // (1024 * 1024)} MB")
+        if self.width is not None:
+            return
+        if self._skip:
+            skipped = min(self._skip, len(data))
+            self._skip -= skipped
+            data = data[skipped:]
+        self._buffer += data
+        if self.format is None:
+            if len(self._buffer) < len(PNG_SIGNATURE):
+                return
+            if self._buffer[:3] == b'\xff\xd8\xff':
+                self.format = 'JPEG'
+                del self._buffer[:2]
+            elif self._buffer[:8] == PNG_SIGNATURE:
+                self.format = 'PNG'
+                del self._buffer[:8]
+            else:
+                raise RejectedUpload("Not a JPEG or PNG image")
+        if self.format == 'JPEG':
+            self._read_jpeg_header()
+        else:
+            self._read_png_header()
+
+    def _read_jpeg_header(self):
+        buffer = self._buffer
+        while True:
+            # Markers may be padded with any number of 0xFF bytes
+            while len(buffer) >= 2 and buffer[0] == 0xFF and buffer[1] == 0xFF:
+                del buffer[0]
+            if len(buffer) < 4:
+                return
+            if buffer[0] != 0xFF:
+                raise RejectedUpload("Malformed JPEG header")
+            marker = buffer[1]
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                # Markers without a length
+                del buffer[:2]
+                continue
+            if marker in (0xD9, 0xDA):
+                raise RejectedUpload("JPEG has no image size before its image data")
+            length = (buffer[2] << 8) | buffer[3]
+            if length < 2:
+                raise RejectedUpload("Malformed JPEG header")
+            if marker in JPEG_SOF_MARKERS:
+                # Length, precision, height, width
+                if len(buffer) >= 9:
+                    self._set_size((buffer[7] << 8) | buffer[8], (buffer[5] << 8) | buffer[6])
+                return
+            if len(buffer) < 2 + length:
+                self._skip = 2 + length - len(buffer)
+                buffer.clear()
+                return
+            del buffer[:2 + length]
+
+    def _read_png_header(self):
+        # The IHDR chunk comes first: length, type, width, height
+        if len(self._buffer) < 16:
+            return
+        if self._buffer[4:8] != b'IHDR' or int.from_bytes(self._buffer[:4], 'big') != 13:
+            raise RejectedUpload("Malformed PNG header")
+        self._set_size(int.from_bytes(self._buffer[8:12], 'big'), int.from_bytes(self._buffer[12:16], 'big'))
+
+    def _set_size(self, width, height):
+        self._buffer.clear()
+        if not width or not height:
+            raise RejectedUpload("Image has no pixels")
+        if width * height > self.max_pixels:
+            raise UploadTooLarge(f"Image is {width}x{height}, more than {self.max_pixels / 1e6:g} megapixels")
+        self.width, self.height = width, height
+
+    def finish(self):
+        """Raise RejectedUpload unless the whole header was fed"""
+        if self.width is None:
+            raise RejectedUpload("Not a complete JPEG or PNG image")
+
+
+def sniff_image_file(path, max_bytes, max_pixels):
+    """Feed the start of a file (which may still be arriving) to an ImageSniffer until the
+    image size is known; returns the sniffer"""
+    sniffer = ImageSniffer(max_bytes, max_pixels)
+    with open(path, 'rb') as f:
+        while sniffer.width is None:
+            data = f.read(SNIFF_BUFFER_SIZE)
+            if not data:
+                break
+            sniffer.feed(data)
+    return sniffer
+
+
+def verify_image(path, image_format):
+    """Raise RejectedUpload if path is not a complete, readable image of image_format.
+
+    JPEGs are decoded at 1/8 scale, which is quick and finds truncated or
+    corrupt image data; PNGs have the checksums of all their chunks checked."""
+    try:
+        with Image.open(path) as img:
+            if img.format != image_format:
+                raise RejectedUpload(f"Not a readable {image_format} image")
+            if image_format == 'JPEG':
+                img.draft('RGB', (max(1, img.width // 8), max(1, img.height // 8)))
+                img.load()
+            else:
+                img.verify()
+    except RejectedUpload:
+        raise
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise RejectedUpload(f"Damaged image: {e}") from e
+
+
+def check_image(path, max_bytes, max_pixels):
+    """Check a complete file on disk like an upload; returns its format ('JPEG' or 'PNG')"""
+    if os.path.getsize(path) > max_bytes:
+        raise UploadTooLarge(f"File is larger than {max_bytes // (1024 * 1024)} MB")
+    sniffer = sniff_image_file(path, max_bytes, max_pixels)
+    sniffer.finish()
+    verify_image(path, sniffer.format)
+    return sniffer.format
+
+
+def filename_for_format(filename, image_format):
+    """filename with the extension of image_format unless it already has one of its extensions"""
+    base_name, ext = os.path.splitext(filename)
+    extensions = FORMAT_EXTENSIONS[image_format]
+    return filename if ext.lower() in extensions else base_name + extensions[0]
+
+
+def move_into(src, directory, filename, keep_source=False):
+    """Move src (copy with keep_source) into directory as filename, numbered (name_1.jpg, ...)
+    if that is taken; returns the new path.
+
+    An existing file is never replaced, even one another upload creates at
+    the same moment: the name is claimed with a hard link, which fails if it
+    exists, or on filesystems without hard links (FAT, exFAT) with an
+    exclusive create before the data is moved in."""
+    base_name, ext = os.path.splitext(filename)
+    for counter in itertools.count():
+        path = os.path.join(directory, filename if counter == 0 else f"{base_name}_{counter}{ext}")
+        try:
+            os.link(src, path)
+        except FileExistsError:
+            continue
+        except OSError:
+            try:
+                os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+            except FileExistsError:
+                continue
+            try:
+                if keep_source:
+                    shutil.copy2(src, path)
+                else:
+                    shutil.move(src, path)
+            except BaseException:
+                os.remove(path)
+                raise
+            return path
+        if not keep_source:
+            os.remove(src)
+        return path
+
+
+class IncomingImage:
+    """A temporary file in directory that checks an upload while it is written.
+
+    write() raises RejectedUpload (deleting what was written) as soon as the
+    data is not an acceptable image (see ImageSniffer), so it can be handed
+    to Werkzeug's multipart parser as the stream the file part is written to.
+    keep() checks the complete file and moves it into place; discard()
+    deletes it."""
+
+    def __init__(self, directory, max_bytes, max_pixels):
+        self.sniffer = ImageSniffer(max_bytes, max_pixels)
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-', suffix='.tmp')
+        self._file = os.fdopen(fd, 'w+b')
+
+    def write(self, data):
+        try:
+            self.sniffer.feed(data)
+        except RejectedUpload:
+            self.discard()
+            raise
+        return self._file.write(data)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, offset, whence=0):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def keep(self, directory, filename):
+        """Check the complete image and move it into directory as filename (with the extension of
+        its real format, numbered if taken); returns the path. Raises RejectedUpload for a damaged
+        image, which is deleted."""
+        try:
+            self._file.flush()
+            # The response tells the phone the photo is safe; make sure it is on the card
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self.sniffer.finish()
+            verify_image(self.path, self.sniffer.format)
+            return move_into(self.path, directory, filename_for_format(filename, self.sniffer.format))
+        except BaseException:
+            self.discard()
+            raise
+
+
+def _is_opaque(img):
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        alpha = img.convert('RGBA').getchannel('A')
+        return alpha.getextrema()[0] == 255
+    return 'transparency' not in img.info
+
+
+def _exif_for_new_pixels(exif, width, height):
+    """A copy of exif for rotated and resized pixels of width x height: without Orientation, with
+    PixelXDimension/PixelYDimension set to the new size and without IFD1, the camera's thumbnail
+    of the old pixels (unrotated, so viewers that show it would show it sideways)"""
+    copy = Image.Exif()
+    for tag, value in exif.items():
+        if tag not in (ORIENTATION_TAG, EXIF_IFD_TAG, GPS_IFD_TAG):
+            copy[tag] = value
+    exif_ifd = dict(exif.get_ifd(EXIF_IFD_TAG))
+    if exif_ifd:
+        if INTEROP_IFD_TAG in exif_ifd:
+            exif_ifd[INTEROP_IFD_TAG] = dict(exif.get_ifd(INTEROP_IFD_TAG))
+        if PIXEL_X_DIMENSION_TAG in exif_ifd or PIXEL_Y_DIMENSION_TAG in exif_ifd:
+            exif_ifd[PIXEL_X_DIMENSION_TAG] = width
+            exif_ifd[PIXEL_Y_DIMENSION_TAG] = height
+        copy[EXIF_IFD_TAG] = exif_ifd
+    gps_ifd = exif.get_ifd(GPS_IFD_TAG)
+    if gps_ifd:
+        copy[GPS_IFD_TAG] = dict(gps_ifd)
+    return copy
+
+
+def normalize_image(path, max_edge, png_to_jpeg=True, originals_directory=None, quality=NORMALIZED_JPEG_QUALITY):
+    """Rotate, downscale and re-encode an uploaded JPEG or PNG in place where that helps.
+
+    Nothing happens to a file that is upright, at most max_edge pixels on its
+    longest side and not a PNG to convert. Otherwise the EXIF orientation is
+    applied to the pixels, the image is scaled to fit max_edge and saved
+    again; with png_to_jpeg a PNG without transparency is saved as a JPEG
+    with the same name and a .jpg extension (numbered if that is taken). EXIF
+    data (updated to the new size, without the camera's thumbnail), the
+    colour profile and the caption are kept. The original is kept
+    in originals_directory, or deleted if that is None. Returns the path of
+    the resulting file."""
+    metadata = read_metadata(path)
+    if metadata is None or not metadata.width or not metadata.height:
+        return path
+    rotated = metadata.orientation not in (None, 1)
+    too_big = max(metadata.width, metadata.height) > max_edge
+    if not (rotated or too_big or (png_to_jpeg and metadata.format == 'PNG')):
+        return path
+
+    with Image.open(path) as original:
+        to_jpeg = metadata.format == 'JPEG' or (png_to_jpeg and _is_opaque(original))
+        if not (rotated or too_big or to_jpeg != (metadata.format == 'JPEG')):
+            return path
+        if too_big and metadata.format == 'JPEG':
+            # Let the decoder scale down by up to 8x instead of decoding full resolution
+            original.draft('RGB', (max_edge, max_edge))
+        icc_profile = original.info.get('icc_profile')
+        img = ImageOps.exif_transpose(original)
+        exif = img.getexif()
+        if to_jpeg and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        if too_big:
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        exif = _exif_for_new_pixels(exif, img.width, img.height)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        # Written to a temporary name and renamed so the library never sees a partial file
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.normalize-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                options = {'exif': exif.tobytes()} if exif else {}
+                if icc_profile:
+                    options['icc_profile'] = icc_profile
+                if to_jpeg:
+                    img.save(f, format='JPEG', quality=quality, **options)
+                else:
+                    img.save(f, format='PNG', **options)
+                f.flush()
+                os.fsync(f.fileno())
+            if metadata.caption and (read_metadata(temp_path) or metadata).caption != metadata.caption:
+                # The caption was in IPTC, XMP or PNG text chunks, which aren't copied
+                write_caption(temp_path, metadata.caption)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    if originals_directory:
+        os.makedirs(originals_directory, exist_ok=True)
+        # A second name for the same file where possible, so nothing is copied
+        move_into(path, originals_directory, os.path.basename(path), keep_source=True)
+    if to_jpeg and metadata.format != 'JPEG':
+        target = move_into(temp_path, directory, os.path.splitext(os.path.basename(path))[0] + '.jpg')
+        os.remove(path)
+    else:
+        target = path
+        os.replace(temp_path, target)
+    print(f"[Ingest] Normalized {os.path.basename(path)} -> {os.path.basename(target)} "
+          f"({img.width}x{img.height}, was {metadata.width}x{metadata.height})")
+    return target
@@ -0,0 +1,108 @@
+"""
+Background jobs for piGallery
+Work handed off by web requests (processing an upload) runs on a daemon thread
+so the request can answer right away; progress is kept for /api/jobs/<id>.
+"""
+
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class Job:
+    """One queued piece of work. Its function reports progress with update()."""
+
+    def __init__(self, kind, function, args):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.function = function
+        self.args = args
+        self.state = 'queued'  # queued, running, done or failed
+        self.step = None
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def update(self, step, progress):
+        """Record the step being worked on and the fraction done (0-1)"""
+        self.step = step
+        self.progress = progress
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'step': self.step,
+            'progress': round(self.progress, 3),
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """Runs submitted jobs in order on one daemon thread.
+
+    submit(kind, function, *args) queues function(job, *args) and returns
+    the Job right away; its return value becomes job.result and an exception
+    marks the job failed. One worker keeps the Pi's CPU free for the render
+    loop. The most recent keep_finished finished jobs stay available to
+    get()."""
+
+    def __init__(self, keep_finished=500):
+        self.keep_finished = keep_finished
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="job-queue", daemon=True)
+                self._thread.start()
+
+    def submit(self, kind, function, *args):
+        job = Job(kind, function, args)
+        with self._lock:
+            self._jobs[job.id] = job
+        self.start()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self):
+        """Number of jobs queued or running"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.state in ('queued', 'running'))
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            job.state = 'running'
+            try:
+                job.result = job.function(job, *job.args)
+                job.progress = 1.0
+                job.state = 'done'
+            except Exception as e:
+                print(f"[Jobs] {job.kind} job {job.id} failed: {e}")
+                job.error = str(e)
+                job.state = 'failed'
+            job.finished_at = time.time()
+            job.function = job.args = None
+            self._forget_old()
+
+    def _forget_old(self):
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job.state in ('done', 'failed')]
+            for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+                del self._jobs[job_id]
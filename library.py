@@ -0,0 +1,507 @@
+"""
+Image library structures for piGallery
+Memory-light building blocks used by the slideshow to handle very large libraries
+"""
+
+import math
+import random
+import time
+from array import array
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value):
+    """Cheap 64-bit integer hash (splitmix64 finaliser)"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class FeistelPermutation:
+    """Seeded bijection over range(size) using a balanced Feistel network.
+
+    The network permutes the smallest power-of-four domain that covers size;
+    values that land outside range(size) are re-encrypted (cycle walking),
+    so forward and inverse lookups are O(1) on average with O(1) memory."""
+
+    ROUNDS = 4
+
+    def __init__(self, size, seed=0):
+        self.size = max(0, int(size))
+        bits = max(2, (self.size - 1).bit_length()) if self.size > 1 else 2
+        if bits % 2:
+            bits += 1
+        self._half_bits = bits // 2
+        self._half_mask = (1 << self._half_bits) - 1
+        self._keys = [_mix64((int(seed) & _MASK64) ^ _mix64(i + 1)) for i in range(self.ROUNDS)]
+
+    def _round(self, value, key):
+        return _mix64(value ^ key) & self._half_mask
+
+    def _encrypt(self, value):
+        left = value >> self._half_bits
+        right = value & self._half_mask
+        for key in self._keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self._half_bits) | right
+
+    def _decrypt(self, value):
+        left = value >> self._half_bits
+        right = value & self._half_mask
+        for key in reversed(self._keys):
+            left, right = right ^ self._round(left, key), left
+        return (left << self._half_bits) | right
+
+    def forward(self, position):
+        """Map a position in the shuffled order to an index in the base order"""
+        if not 0 <= position < self.size:
+            raise IndexError("permutation index out of range")
+        value = self._encrypt(position)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def inverse(self, index):
+        """Map an index in the base order back to its shuffled position"""
+        if not 0 <= index < self.size:
+            raise IndexError("permutation index out of range")
+        value = self._decrypt(index)
+        while value >= self.size:
+            value = self._decrypt(value)
+        return value
+
+
+class ShuffledSequence:
+    """Read-only view of items in a seeded pseudo-random order.
+
+    Nothing is copied: position k is resolved through a FeistelPermutation
+    into the underlying sequence, so a million-image shuffle costs the same
+    memory as a ten-image one. The view is sized when created; rebuild it
+    after the underlying sequence changes."""
+
+    def __init__(self, items, seed=0):
+        self._items = items
+        self.seed = seed
+        self._permutation = FeistelPermutation(len(items), seed)
+
+    def __len__(self):
+        return self._permutation.size
+
+    def __bool__(self):
+        return self._permutation.size > 0
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        return self._items[self._permutation.forward(position)]
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def index(self, item):
+        """Return the shuffled position of item (ValueError if missing); O(1) over a PathList,
+        whose position lookup and the inverse permutation are both constant time"""
+        base_index = self._items.index(item)
+        if base_index >= len(self):
+            raise ValueError(f"{item!r} is not in sequence")
+        return self._permutation.inverse(base_index)
+
+
+class PathTable:
+    """Compact, append-only table of relative image paths.
+
+    Directory prefixes are interned once and basenames are packed into a
+    single UTF-8 buffer, so each path costs a few bytes of overhead plus its
+    basename instead of a full Python string. Paths are referenced by
+    integer ids; lookups use an open-addressing hash over those ids."""
+
+    def __init__(self):
+        self._dirs = []                      # dir id -> directory prefix (with trailing separator)
+        self._dir_ids = {}                   # directory prefix -> dir id
+        self._path_dirs = array('I')         # path id -> dir id
+        self._name_offsets = array('I', [0])  # path id -> start of basename in _names
+        self._names = bytearray()            # packed UTF-8 basenames
+        self._slots = array('i', [-1]) * 16  # hash slots holding path ids (-1 = empty)
+
+    def __len__(self):
+        return len(self._path_dirs)
+
+    @staticmethod
+    def _split(path):
+        cut = max(path.rfind('/'), path.rfind('\\')) + 1
+        return path[:cut], path[cut:]
+
+    def path(self, path_id):
+        """Return the relative path stored under path_id"""
+        start = self._name_offsets[path_id]
+        name = self._names[start:self._name_offsets[path_id + 1]].decode('utf-8', 'surrogateescape')
+        return self._dirs[self._path_dirs[path_id]] + name
+
+    def _find_slot(self, dir_id, name_bytes):
+        """Return (slot, path id or None) for a directory id and encoded basename"""
+        mask = len(self._slots) - 1
+        slot = hash((dir_id, name_bytes)) & mask
+        while True:
+            path_id = self._slots[slot]
+            if path_id < 0:
+                return slot, None
+            if (self._path_dirs[path_id] == dir_id and
+                    self._names[self._name_offsets[path_id]:self._name_offsets[path_id + 1]] == name_bytes):
+                return slot, path_id
+            slot = (slot + 1) & mask
+
+    def lookup(self, path):
+        """Return the id of path, or None if it has never been interned"""
+        prefix, name = self._split(path)
+        dir_id = self._dir_ids.get(prefix)
+        if dir_id is None:
+            return None
+        return self._find_slot(dir_id, name.encode('utf-8', 'surrogateescape'))[1]
+
+    def intern(self, path):
+        """Return the id of path, adding it to the table if needed"""
+        prefix, name = self._split(path)
+        dir_id = self._dir_ids.get(prefix)
+        if dir_id is None:
+            dir_id = len(self._dirs)
+            self._dirs.append(prefix)
+            self._dir_ids[prefix] = dir_id
+        name_bytes = name.encode('utf-8', 'surrogateescape')
+        slot, path_id = self._find_slot(dir_id, name_bytes)
+        if path_id is not None:
+            return path_id
+
+        path_id = len(self._path_dirs)
+        self._path_dirs.append(dir_id)
+        self._names.extend(name_bytes)
+        self._name_offsets.append(len(self._names))
+        self._slots[slot] = path_id
+        # Keep the load factor at or below one half
+        if len(self._path_dirs) * 2 > len(self._slots):
+            self._rehash()
+        return path_id
+
+    def _rehash(self):
+        self._slots = array('i', [-1]) * (len(self._slots) * 2)
+        mask = len(self._slots) - 1
+        offsets = self._name_offsets
+        for path_id, dir_id in enumerate(self._path_dirs):
+            slot = hash((dir_id, bytes(self._names[offsets[path_id]:offsets[path_id + 1]]))) & mask
+            while self._slots[slot] >= 0:
+                slot = (slot + 1) & mask
+            self._slots[slot] = path_id
+
+
+class PathList:
+    """Mutable list of image paths stored as 4-byte ids into a PathTable.
+
+    Behaves like the list of relative path strings it replaces (indexing,
+    iteration, membership, append/extend/pop) while holding one array of
+    ints; strings are rebuilt on access. index() and membership use a path
+    id -> position array built on first use and rebuilt after the list
+    changed, so both are O(1) once per list."""
+
+    def __init__(self, table, paths=()):
+        self.table = table
+        self.ids = array('I', [table.intern(p) for p in paths])
+        self._positions = None
+
+    @classmethod
+    def from_ids(cls, table, ids):
+        path_list = cls(table)
+        path_list.ids = array('I', ids)
+        return path_list
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return len(self.ids) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PathList.from_ids(self.table, self.ids[index])
+        return self.table.path(self.ids[index])
+
+    def __iter__(self):
+        path = self.table.path
+        for path_id in self.ids:
+            yield path(path_id)
+
+    def __contains__(self, path):
+        if not isinstance(path, str):
+            return False
+        path_id = self.table.lookup(path)
+        if path_id is None:
+            return False
+        try:
+            self.position_of(path_id)
+        except ValueError:
+            return False
+        return True
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __repr__(self):
+        return f"PathList({list(self)!r})"
+
+    def index(self, path):
+        path_id = self.table.lookup(path) if isinstance(path, str) else None
+        if path_id is None:
+            raise ValueError(f"{path!r} is not in list")
+        return self.position_of(path_id)
+
+    def position_of(self, path_id):
+        """Position of the first occurrence of path_id (ValueError if missing)"""
+        positions = self._positions
+        if positions is None or positions[0] != len(self.ids):
+            positions = self._build_positions()
+        if path_id + 1 < len(positions) and positions[path_id + 1] >= 0 \
+                and self.ids[positions[path_id + 1]] != path_id:
+            # Ids were replaced in place since the array was built
+            positions = self._build_positions()
+        position = positions[path_id + 1] if path_id + 1 < len(positions) else -1
+        if position < 0:
+            raise ValueError(f"{self.table.path(path_id)!r} is not in list")
+        return position
+
+    def _build_positions(self):
+        # positions[0] is the list length the array was built for
+        positions = array('i', [-1]) * (len(self.table) + 1)
+        positions[0] = len(self.ids)
+        for position in range(len(self.ids) - 1, -1, -1):
+            positions[self.ids[position] + 1] = position
+        self._positions = positions
+        return positions
+
+    def append(self, path):
+        self.ids.append(self.table.intern(path))
+        self._positions = None
+
+    def extend(self, paths):
+        if isinstance(paths, PathList) and paths.table is self.table:
+            self.ids.extend(paths.ids)
+        else:
+            self.ids.extend(self.table.intern(p) for p in paths)
+        self._positions = None
+
+    def pop(self, index=-1):
+        self._positions = None
+        return self.table.path(self.ids.pop(index))
+
+
+class SlideScheduler:
+    """Weighted random slide picker with incremental updates.
+
+    Every item has a weight made of a decaying boost for recent uploads, a
+    favourite multiplier and a penalty of shown_penalty per time it has been
+    shown more than the library's average (a bonus per time fewer), capped at
+    MAX_SHOW_DIFFERENCE shows either way: an image added to a long-running
+    library catches up gently instead of taking over until its count matches.
+    Weights are kept as log2 values and grouped into power-of-two
+    buckets: sampling picks a bucket by total weight (there are only a handful)
+    and then an item inside it by rejection, so a pick is O(1) on average and
+    adding, removing or re-weighting one item never touches the others.
+    Items are integer ids, normally PathTable ids."""
+
+    _ABSENT = -(2 ** 31)
+    # Most shows above or below the average that still change an item's weight
+    MAX_SHOW_DIFFERENCE = 3
+
+    def __init__(self, upload_boost=4.0, boost_half_life_days=7.0, shown_penalty=0.5,
+                 favorite_boost=3.0, rng=None):
+        self.upload_boost = max(0.0, float(upload_boost))
+        self.boost_half_life = max(1.0, float(boost_half_life_days) * 86400)
+        self.shown_penalty = min(0.99, max(0.01, float(shown_penalty)))
+        self.favorite_boost = max(1.0, float(favorite_boost))
+        self._rng = rng or random.Random()
+
+        # Per-item state, indexed by item id
+        self._log_weight = array('d')
+        self._bucket_of = array('i')
+        self._slot_of = array('I')
+        self._shows = array('I')
+        self._added_at = array('d')
+        self._favorite = bytearray()
+
+        # bucket exponent -> item ids / sum of weights scaled by 2**-exponent
+        self._buckets = {}
+        self._bucket_sums = {}
+        self._boosted = set()  # items whose upload boost is still decaying
+        self._count = 0
+        # Sum of the show counts of present items, and the average (rounded down) weights use;
+        # it moves about once per len(self) shows, which is when every item is re-weighed
+        self._total_shows = 0
+        self._level = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, item_id):
+        return 0 <= item_id < len(self._bucket_of) and self._bucket_of[item_id] != self._ABSENT
+
+    def _ensure(self, item_id):
+        missing = item_id + 1 - len(self._bucket_of)
+        if missing > 0:
+            self._log_weight.extend([0.0] * missing)
+            self._bucket_of.extend([self._ABSENT] * missing)
+            self._slot_of.extend([0] * missing)
+            self._shows.extend([0] * missing)
+            self._added_at.extend([0.0] * missing)
+            self._favorite.extend(bytes(missing))
+
+    def _compute_log_weight(self, item_id, now):
+        difference = max(-self.MAX_SHOW_DIFFERENCE,
+                         min(self.MAX_SHOW_DIFFERENCE, self._shows[item_id] - self._level))
+        log_weight = difference * math.log2(self.shown_penalty)
+        if self._favorite[item_id]:
+            log_weight += math.log2(self.favorite_boost)
+        boost = self._boost(item_id, now)
+        if boost:
+            log_weight += math.log2(1.0 + boost)
+        return log_weight
+
+    def _boost(self, item_id, now):
+        added_at = self._added_at[item_id]
+        if not added_at or not self.upload_boost:
+            return 0.0
+        age = max(0.0, now - added_at)
+        boost = self.upload_boost * 0.5 ** (age / self.boost_half_life)
+        # Stop tracking once the boost no longer makes a meaningful difference
+        return boost if boost >= 0.01 else 0.0
+
+    def _place(self, item_id, log_weight):
+        bucket = math.floor(log_weight)
+        items = self._buckets.setdefault(bucket, array('I'))
+        self._slot_of[item_id] = len(items)
+        items.append(item_id)
+        self._bucket_of[item_id] = bucket
+        self._log_weight[item_id] = log_weight
+        self._bucket_sums[bucket] = self._bucket_sums.get(bucket, 0.0) + 2.0 ** (log_weight - bucket)
+
+    def _unplace(self, item_id):
+        bucket = self._bucket_of[item_id]
+        items = self._buckets[bucket]
+        slot = self._slot_of[item_id]
+        last = items.pop()
+        if last != item_id:
+            items[slot] = last
+            self._slot_of[last] = slot
+        self._bucket_of[item_id] = self._ABSENT
+        if items:
+            self._bucket_sums[bucket] -= 2.0 ** (self._log_weight[item_id] - bucket)
+        else:
+            del self._buckets[bucket]
+            del self._bucket_sums[bucket]
+
+    def _reweigh(self, item_id, now=None):
+        now = time.time() if now is None else now
+        self._unplace(item_id)
+        self._place(item_id, self._compute_log_weight(item_id, now))
+        if self._boost(item_id, now):
+            self._boosted.add(item_id)
+        else:
+            self._boosted.discard(item_id)
+
+    def add(self, item_id, added_at=None, shows=0, favorite=False, now=None):
+        """Add an item (or update it if present); added_at enables the upload boost"""
+        now = time.time() if now is None else now
+        self._ensure(item_id)
+        if item_id in self:
+            self._unplace(item_id)
+            self._count -= 1
+            self._total_shows -= self._shows[item_id]
+        self._added_at[item_id] = added_at or 0.0
+        self._shows[item_id] = max(0, int(shows))
+        self._total_shows += self._shows[item_id]
+        self._favorite[item_id] = 1 if favorite else 0
+        self._place(item_id, self._compute_log_weight(item_id, now))
+        self._count += 1
+        if self._boost(item_id, now):
+            self._boosted.add(item_id)
+
+    def remove(self, item_id):
+        if item_id in self:
+            self._unplace(item_id)
+            self._boosted.discard(item_id)
+            self._count -= 1
+            self._total_shows -= self._shows[item_id]
+
+    def record_shown(self, item_id):
+        """Count one more showing of item_id and lower its weight accordingly"""
+        if item_id in self:
+            self._shows[item_id] += 1
+            self._total_shows += 1
+            self._reweigh(item_id)
+
+    def set_favorite(self, item_id, favorite=True):
+        if item_id in self:
+            self._favorite[item_id] = 1 if favorite else 0
+            self._reweigh(item_id)
+
+    def is_favorite(self, item_id):
+        return item_id in self and bool(self._favorite[item_id])
+
+    def shows(self, item_id):
+        return self._shows[item_id] if item_id in self else 0
+
+    def refresh_boosts(self, now=None):
+        """Re-weigh only the items whose upload boost is still decaying"""
+        now = time.time() if now is None else now
+        for item_id in list(self._boosted):
+            self._reweigh(item_id, now)
+
+    def _update_level(self, now=None):
+        """Re-weigh every item if the average show count moved"""
+        level = self._total_shows // self._count if self._count else 0
+        if level == self._level:
+            return
+        self._level = level
+        now = time.time() if now is None else now
+        item_ids = [item_id for items in self._buckets.values() for item_id in items]
+        self._buckets = {}
+        self._bucket_sums = {}
+        for item_id in item_ids:
+            self._place(item_id, self._compute_log_weight(item_id, now))
+
+    def sample(self, exclude=None):
+        """Return a weighted random item id, never exclude unless it is the only one (None if empty)"""
+        if not self._count:
+            return None
+        self._update_level()
+        if exclude is None or exclude not in self or self._count == 1:
+            return self._draw()
+        # Take exclude out for this one draw, so the others share its weight exactly
+        log_weight = self._log_weight[exclude]
+        self._unplace(exclude)
+        try:
+            return self._draw()
+        finally:
+            self._place(exclude, log_weight)
+
+    def _draw(self):
+        top = max(self._buckets)
+        # Pick a bucket by its share of the total weight (relative to the heaviest bucket)
+        target = self._rng.random() * sum(total * 2.0 ** (bucket - top)
+                                          for bucket, total in self._bucket_sums.items())
+        chosen = top
+        for bucket, total in self._bucket_sums.items():
+            target -= total * 2.0 ** (bucket - top)
+            chosen = bucket
+            if target <= 0:
+                break
+        items = self._buckets[chosen]
+        # Every weight in a bucket is within a factor of two, so rejection accepts >= 50%
+        while True:
+            item_id = items[self._rng.randrange(len(items))]
+            if self._rng.random() * 2.0 < 2.0 ** (self._log_weight[item_id] - chosen):
+                return item_id
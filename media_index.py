@@ -0,0 +1,520 @@
+"""
+Media index for piGallery
+SQLite-backed record of every image in the library (size, mtime, content hashes and captions),
+kept alongside config.ini so expensive per-file work survives restarts
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+
+from filesystem import LocalFileSystem
+
+# Bytes read from each end of a file for the partial hash
+PARTIAL_HASH_BYTES = 64 * 1024
+HASH_CHUNK_BYTES = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    partial_hash TEXT,
+    full_hash TEXT,
+    dhash INTEGER,
+    caption TEXT,
+    caption_size INTEGER,
+    caption_mtime REAL
+);
+CREATE INDEX IF NOT EXISTS files_size ON files (size);
+CREATE INDEX IF NOT EXISTS files_full_hash ON files (full_hash);
+
+-- Captions kept outside the image files (caption_storage = sidecar); a row here
+-- overrides the caption embedded in the file
+CREATE TABLE IF NOT EXISTS sidecar_captions (
+    path TEXT PRIMARY KEY,
+    caption TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    exported INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS sidecar_captions_exported ON sidecar_captions (exported);
+"""
+
+# Full-text index over file names, folder names and captions; rowid is the files rowid.
+# Created separately since SQLite may be built without FTS5
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE search USING fts5(
+    filename, folder, caption,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+)
+"""
+# bm25 column weights (filename, folder, caption)
+SEARCH_WEIGHTS = (2.0, 1.0, 4.0)
+# Scoring costs a few microseconds per match; above this many matches results are
+# listed newest first instead of ranked, which keeps broad queries fast
+SEARCH_RANK_LIMIT = 2000
+
+# Sort keys accepted by MediaIndex.list_files
+LIST_SORT_COLUMNS = {'date': 'f.mtime', 'size': 'f.size', 'name': 'f.path'}
+
+# Columns added after the first release; created on existing databases by _migrate()
+ADDED_COLUMNS = {
+    'dhash': 'INTEGER',
+    'caption': 'TEXT',
+    'caption_size': 'INTEGER',
+    'caption_mtime': 'REAL',
+}
+
+
+def search_text(path):
+    """Return the (filename, folder) text indexed for a relative image path"""
+    folder, _, filename = path.replace('\\', '/').rpartition('/')
+    return filename.rsplit('.', 1)[0], folder
+
+
+def match_query(text):
+    """Turn free text into an FTS5 query: every word must match as a prefix (None if no words)"""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+
+def partial_hash_stream(stream, size):
+    """Hash the size plus the first and last PARTIAL_HASH_BYTES of a seekable binary stream"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(size).encode('ascii'))
+    stream.seek(0)
+    digest.update(stream.read(PARTIAL_HASH_BYTES))
+    if size > PARTIAL_HASH_BYTES:
+        stream.seek(max(PARTIAL_HASH_BYTES, size - PARTIAL_HASH_BYTES))
+        digest.update(stream.read(PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+def full_hash_stream(stream):
+    """Hash the whole content of a seekable binary stream"""
+    digest = hashlib.blake2b(digest_size=32)
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_BYTES), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaIndex:
+    """Persistent per-image index keyed by the slideshow's relative image path.
+
+    Exact duplicates are found in three steps so most files are never read:
+    files are grouped by size, only same-size files get a partial hash (both
+    ends of the file) and only matching partial hashes get a full hash.
+    Hashes are stored with the size/mtime they were computed for and are
+    recomputed when either changes. Safe to share between threads."""
+
+    def __init__(self, db_path=':memory:', filesystem=None):
+        self.db_path = db_path
+        self.fs = filesystem or LocalFileSystem()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        if db_path != ':memory:':
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self.search_available = self._create_search()
+        self._conn.commit()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        for name, column_type in ADDED_COLUMNS.items():
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE files ADD COLUMN {name} {column_type}")
+
+    def _create_search(self):
+        """Create the full-text index if missing (filled from existing rows); False without FTS5"""
+        if self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'search'").fetchone():
+            return True
+        try:
+            self._conn.execute(SEARCH_SCHEMA)
+        except sqlite3.OperationalError as e:
+            print(f"[Index] Full-text search unavailable: {e}")
+            return False
+        rows = self._conn.execute(
+            """SELECT f.rowid, f.path, COALESCE(s.caption, f.caption) FROM files f
+               LEFT JOIN sidecar_captions s ON s.path = f.path""").fetchall()
+        self._conn.executemany("INSERT INTO search (rowid, filename, folder, caption) VALUES (?, ?, ?, ?)",
+                               ((rowid, *search_text(path), caption) for rowid, path, caption in rows))
+        return True
+
+    def _refresh_search(self, paths):
+        """Re-index the search text of paths (called with the lock held, committed by the caller)"""
+        if not self.search_available:
+            return
+        for path in paths:
+            row = self._conn.execute(
+                """SELECT f.rowid, COALESCE(s.caption, f.caption) FROM files f
+                   LEFT JOIN sidecar_captions s ON s.path = f.path WHERE f.path = ?""", (path,)).fetchone()
+            if row is None:
+                continue
+            self._conn.execute("DELETE FROM search WHERE rowid = ?", (row[0],))
+            self._conn.execute("INSERT INTO search (rowid, filename, folder, caption) VALUES (?, ?, ?, ?)",
+                               (row[0], *search_text(path), row[1]))
+
+    def search(self, text, limit=24, offset=0):
+        """Return (number of matches, up to limit (path, caption) rows), best match first.
+
+        Every word of text has to match the start of a word in the file name,
+        folder name or caption (the sidecar caption if there is one)."""
+        query = match_query(text)
+        if not self.search_available or query is None:
+            return 0, []
+        with self._lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM search WHERE search MATCH ?", (query,)).fetchone()[0]
+            if total > SEARCH_RANK_LIMIT:
+                order = "search.rowid DESC"
+            else:
+                order = f"bm25(search, {', '.join(map(str, SEARCH_WEIGHTS))})"
+            page = self._conn.execute(
+                f"SELECT rowid, caption FROM search WHERE search MATCH ? ORDER BY {order} LIMIT ? OFFSET ?",
+                (query, limit, offset)).fetchall()
+            # Paths are looked up for the page only, not for every match
+            paths = dict(self._conn.execute(
+                f"SELECT rowid, path FROM files WHERE rowid IN ({', '.join('?' * len(page))})",
+                [rowid for rowid, _ in page]))
+        return total, [(paths[rowid], caption) for rowid, caption in page if rowid in paths]
+
+    def list_files(self, prefix, sort='date', descending=True, after=None, limit=50, name=None,
+                   has_caption=None):
+        """Return (number of matching files, up to limit rows) for the files directly in folder
+        prefix (e.g. 'uploaded/'), in keyset pages.
+
+        Rows are (path, size, mtime, caption, caption_cached): caption is the
+        sidecar caption or the cached embedded caption, caption_cached is False
+        when the embedded caption still has to be read. after is the
+        (sort value, path) of the last row of the previous page. name matches
+        part of the file name (case-insensitive); has_caption only sees
+        captions that are known."""
+        column = LIST_SORT_COLUMNS[sort]
+        conditions = ["f.path > ?", "f.path < ?", "instr(substr(f.path, ?), '/') = 0"]
+        # prefix + chr(0x10FFFF) is past every path in the folder, so the primary key range applies
+        params = [prefix, prefix + '\U0010ffff', len(prefix) + 1]
+        if name:
+            conditions.append("substr(f.path, ?) LIKE ? ESCAPE '\\'")
+            escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params += [len(prefix) + 1, f'%{escaped}%']
+        caption = ("COALESCE(s.caption, CASE WHEN f.caption_size = f.size AND f.caption_mtime = f.mtime "
+                   "THEN f.caption END, '')")
+        if has_caption is not None:
+            conditions.append(f"{caption} {'!=' if has_caption else '='} ''")
+        where = ' AND '.join(conditions)
+        query_from = f"FROM files f LEFT JOIN sidecar_captions s ON s.path = f.path WHERE {where}"
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) {query_from}", params).fetchone()[0]
+            page_conditions, page_params = '', []
+            if after is not None:
+                op = '<' if descending else '>'
+                if column == 'f.path':
+                    page_conditions = f" AND f.path {op} ?"
+                    page_params = [after[1]]
+                else:
+                    page_conditions = f" AND ({column} {op} ? OR ({column} = ? AND f.path {op} ?))"
+                    page_params = [after[0], after[0], after[1]]
+            direction = 'DESC' if descending else 'ASC'
+            rows = self._conn.execute(
+                f"""SELECT f.path, f.size, f.mtime, s.caption, f.caption,
+                           f.caption_size = f.size AND f.caption_mtime = f.mtime
+                    {query_from}{page_conditions}
+                    ORDER BY {column} {direction}, f.path {direction} LIMIT ?""",
+                params + page_params + [limit]).fetchall()
+        return total, [(path, size, mtime, sidecar if sidecar is not None else cached,
+                        sidecar is not None or bool(cached_valid))
+                       for path, size, mtime, sidecar, cached, cached_valid in rows]
+
+    def folder_names(self, prefix):
+        """Return the set of file names indexed directly in folder prefix (see list_files)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT substr(path, ?) FROM files WHERE path > ? AND path < ? AND instr(substr(path, ?), '/') = 0",
+                (len(prefix) + 1, prefix, prefix + '\U0010ffff', len(prefix) + 1)).fetchall()
+        return {name for name, in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def update_stats(self, rows):
+        """Record (path, size, mtime) rows; stored hashes are cleared when size or mtime changed"""
+        rows = list(rows)
+        with self._lock:
+            self._upsert_stats(rows)
+            self._refresh_search(path for path, _, _ in rows)
+            self._conn.commit()
+
+    def _upsert_stats(self, rows):
+        """Insert or update (path, size, mtime) rows without committing (see update_stats)"""
+        self._conn.executemany(
+            """INSERT INTO files (path, size, mtime) VALUES (?, ?, ?)
+               ON CONFLICT(path) DO UPDATE SET
+                   partial_hash = CASE WHEN files.size = excluded.size AND files.mtime = excluded.mtime
+                                       THEN files.partial_hash END,
+                   full_hash = CASE WHEN files.size = excluded.size AND files.mtime = excluded.mtime
+                                    THEN files.full_hash END,
+                   dhash = CASE WHEN files.size = excluded.size AND files.mtime = excluded.mtime
+                                THEN files.dhash END,
+                   size = excluded.size,
+                   mtime = excluded.mtime""",
+            rows)
+
+    def remove(self, paths):
+        paths = list(paths)
+        with self._lock:
+            if self.search_available:
+                self._conn.executemany(
+                    "DELETE FROM search WHERE rowid = (SELECT rowid FROM files WHERE path = ?)", ((p,) for p in paths))
+            self._conn.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in paths))
+            self._conn.commit()
+
+    def prune(self, keep_paths):
+        """Delete every row whose path is not in keep_paths (files removed while we were not running)"""
+        with self._lock:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_paths (path TEXT PRIMARY KEY)")
+            self._conn.execute("DELETE FROM keep_paths")
+            self._conn.executemany("INSERT OR IGNORE INTO keep_paths VALUES (?)", ((p,) for p in keep_paths))
+            removed = self._conn.execute(
+                "DELETE FROM files WHERE path NOT IN (SELECT path FROM keep_paths)").rowcount
+            if removed and self.search_available:
+                self._conn.execute("DELETE FROM search WHERE rowid NOT IN (SELECT rowid FROM files)")
+            self._conn.execute("DELETE FROM keep_paths")
+            self._conn.commit()
+        return removed
+
+    def get(self, path):
+        """Return the row for path as a dict, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, size, mtime, partial_hash, full_hash, dhash FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('path', 'size', 'mtime', 'partial_hash', 'full_hash', 'dhash'), row))
+
+    def stats_page(self, after='', limit=512):
+        """Return up to limit (path, size, mtime) rows in path order, after the given path"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, size, mtime FROM files WHERE path > ? ORDER BY path LIMIT ?", (after, limit)).fetchall()
+
+    def paths_without_dhash(self, after='', limit=64):
+        """Return up to limit paths (in path order, after the given path) that have no perceptual hash
+        yet and were not found undecodable (see mark_dhash_failed)"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT path FROM files WHERE dhash IS NULL AND path > ? ORDER BY path LIMIT ?", (after, limit))]
+
+    def set_dhashes(self, rows):
+        """Store (path, 64-bit dhash) rows"""
+        with self._lock:
+            # SQLite integers are signed 64-bit
+            self._conn.executemany("UPDATE files SET dhash = ? WHERE path = ?",
+                                   ((value - (1 << 64) if value >= 1 << 63 else value, path) for path, value in rows))
+            self._conn.commit()
+
+    def mark_dhash_failed(self, paths):
+        """Record that paths could not be decoded for a perceptual hash, so they are skipped until
+        their size or mtime changes (the marker is an empty string in the dhash column)"""
+        with self._lock:
+            self._conn.executemany("UPDATE files SET dhash = '' WHERE path = ?", ((p,) for p in paths))
+            self._conn.commit()
+
+    def dhashes(self):
+        """Return (paths, dhashes) lists for every file with a perceptual hash"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, dhash FROM files WHERE typeof(dhash) = 'integer'").fetchall()
+        return [row[0] for row in rows], [row[1] & 0xFFFFFFFFFFFFFFFF for row in rows]
+
+    def get_caption(self, path, size, mtime):
+        """Return (True, caption) if a caption was read from path at this size/mtime, else (False, None).
+
+        caption is None for files without one."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT caption, caption_size, caption_mtime FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None or row[1] != size or row[2] != mtime:
+            return False, None
+        return True, row[0]
+
+    def set_captions(self, rows):
+        """Store (path, size, mtime, caption) rows; size/mtime are the file's when the caption was read
+        and also become the file's recorded size/mtime"""
+        rows = list(rows)
+        with self._lock:
+            self._upsert_stats([(path, size, mtime) for path, size, mtime, _ in rows])
+            self._conn.executemany(
+                """INSERT INTO files (path, size, mtime, caption, caption_size, caption_mtime)
+                   VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(path) DO UPDATE SET
+                       caption = excluded.caption,
+                       caption_size = excluded.caption_size,
+                       caption_mtime = excluded.caption_mtime""",
+                ((path, size, mtime, caption, size, mtime) for path, size, mtime, caption in rows))
+            self._refresh_search(path for path, _, _, _ in rows)
+            self._conn.commit()
+
+    def invalidate_caption(self, path):
+        """Forget the cached caption for path (after the caption was written)"""
+        self.invalidate_captions([path])
+
+    def invalidate_captions(self, paths):
+        """Forget the cached captions for many paths in one transaction"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE files SET caption = NULL, caption_size = NULL, caption_mtime = NULL WHERE path = ?",
+                ((path,) for path in paths))
+            self._conn.commit()
+
+    def paths_needing_caption(self, after='', limit=64):
+        """Return up to limit paths (in path order, after the given path) whose caption was never
+        read or was read before the last size/mtime change seen by the scanner"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                """SELECT path FROM files
+                   WHERE path > ? AND (caption_mtime IS NULL OR caption_size != size OR caption_mtime != mtime)
+                   ORDER BY path LIMIT ?""", (after, limit))]
+
+    def get_sidecar_caption(self, path):
+        """Return (True, caption) if path has a sidecar caption ('' = caption removed), else (False, None)"""
+        with self._lock:
+            row = self._conn.execute("SELECT caption FROM sidecar_captions WHERE path = ?", (path,)).fetchone()
+        return (True, row[0]) if row else (False, None)
+
+    def set_sidecar_captions(self, rows):
+        """Store (path, caption) rows in one transaction; they are exported to the files later if enabled"""
+        rows = list(rows)
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                """INSERT INTO sidecar_captions (path, caption, updated_at, exported) VALUES (?, ?, ?, 0)
+                   ON CONFLICT(path) DO UPDATE SET
+                       caption = excluded.caption, updated_at = excluded.updated_at, exported = 0""",
+                ((path, caption or '', now) for path, caption in rows))
+            self._refresh_search(path for path, _ in rows)
+            self._conn.commit()
+
+    def remove_sidecar_captions(self, paths):
+        paths = list(paths)
+        with self._lock:
+            self._conn.executemany("DELETE FROM sidecar_captions WHERE path = ?", ((p,) for p in paths))
+            self._refresh_search(paths)
+            self._conn.commit()
+
+    def rename_sidecar_caption(self, old_path, new_path):
+        with self._lock:
+            self._conn.execute("DELETE FROM sidecar_captions WHERE path = ?", (new_path,))
+            self._conn.execute("UPDATE sidecar_captions SET path = ? WHERE path = ?", (new_path, old_path))
+            self._refresh_search([old_path, new_path])
+            self._conn.commit()
+
+    def sidecar_captions_to_export(self, limit=64):
+        """Return up to limit (path, caption, updated_at) rows not yet written into their files"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, caption, updated_at FROM sidecar_captions WHERE exported = 0 LIMIT ?",
+                (limit,)).fetchall()
+
+    def mark_sidecar_exported(self, rows, exported=1):
+        """Mark (path, updated_at) rows exported (1) or failed to export (-1), unless the caption
+        changed again meanwhile"""
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE sidecar_captions SET exported = ? WHERE path = ? AND updated_at = ?",
+                ((exported, path, updated_at) for path, updated_at in rows))
+            self._conn.commit()
+
+    def _hash(self, path, column, resolve):
+        """Return the stored partial/full hash for path, computing and storing it if missing"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT size, {column} FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return None
+        size, value = row
+        if value:
+            return value
+        try:
+            with self.fs.open(resolve(path)) as f:
+                value = partial_hash_stream(f, size) if column == 'partial_hash' else full_hash_stream(f)
+        except OSError as e:
+            print(f"[Index] Could not hash {path}: {e}")
+            return None
+        with self._lock:
+            self._conn.execute(f"UPDATE files SET {column} = ? WHERE path = ?", (value, path))
+            self._conn.commit()
+        return value
+
+    def _paths_with_size(self, size):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT path FROM files WHERE size = ?", (size,))]
+
+    def paths_needing_content_hash(self, limit=64):
+        """Return up to limit (path, column) pairs whose partial or full hash is still needed to
+        tell files apart: partial hashes of files sharing a size first, then full hashes of files
+        sharing a size and partial hash"""
+        with self._lock:
+            rows = [(row[0], 'partial_hash') for row in self._conn.execute(
+                """SELECT path FROM files WHERE partial_hash IS NULL
+                   AND size IN (SELECT size FROM files GROUP BY size HAVING COUNT(*) > 1) LIMIT ?""", (limit,))]
+            if rows:
+                return rows
+            return [(row[0], 'full_hash') for row in self._conn.execute(
+                """SELECT path FROM files WHERE full_hash IS NULL AND partial_hash != ''
+                   AND (size, partial_hash) IN (SELECT size, partial_hash FROM files WHERE partial_hash != ''
+                                                GROUP BY size, partial_hash HAVING COUNT(*) > 1)
+                   LIMIT ?""", (limit,))]
+
+    def hash_for_duplicates(self, resolve, limit=64):
+        """Compute one batch of the hashes find_duplicates needs (see paths_needing_content_hash);
+        returns the number of files processed, 0 once nothing is missing. Files that can't be read
+        get an empty hash so they are not retried until they change."""
+        rows = self.paths_needing_content_hash(limit)
+        for path, column in rows:
+            if self._hash(path, column, resolve) is None:
+                with self._lock:
+                    self._conn.execute(f"UPDATE files SET {column} = '' WHERE path = ?", (path,))
+                    self._conn.commit()
+        return len(rows)
+
+    def find_duplicates(self):
+        """Return lists of index paths with identical content according to the full hashes already
+        stored (the scanner computes them with hash_for_duplicates); never reads a file"""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT path, size, full_hash FROM files WHERE full_hash IN (
+                       SELECT full_hash FROM files WHERE full_hash != '' GROUP BY full_hash HAVING COUNT(*) > 1)
+                   ORDER BY full_hash, size""").fetchall()
+        groups = {}
+        for path, size, full_hash in rows:
+            groups.setdefault((size, full_hash), []).append(path)
+        return [group for group in groups.values() if len(group) > 1]
+
+    def find_duplicate_of(self, stream, resolve):
+        """Return the index path of a file identical to the seekable stream, or None.
+
+        The stream is only read past its ends when a same-size file with the
+        same partial hash exists; it is left positioned at the start."""
+        stream.seek(0, 2)
+        size = stream.tell()
+        try:
+            candidates = self._paths_with_size(size)
+            if not candidates:
+                return None
+            partial = partial_hash_stream(stream, size)
+            candidates = [p for p in candidates if self._hash(p, 'partial_hash', resolve) == partial]
+            if not candidates:
+                return None
+            full = full_hash_stream(stream)
+            for path in candidates:
+                if self._hash(path, 'full_hash', resolve) == full:
+                    return path
+            return None
+        finally:
+            stream.seek(0)
@@ -0,0 +1,549 @@
+"""
+Image metadata reader/writer for piGallery
+Reads captions, dates, orientation, GPS and dimensions from JPEG and PNG files
+in one pass over the container (JPEG markers up to the image data, PNG chunk
+headers), without decoding pixels or loading the whole file. Captions are
+written the same way: only the metadata segment/chunks are replaced and every
+other byte is copied unchanged.
+"""
+
+import datetime
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+import xml.etree.ElementTree as ElementTree
+
+# Caption sources in the order they are preferred (same order the slideshow always used;
+# XMP dc:description comes last)
+CAPTION_SOURCES = (
+    'png:Comment',
+    'png:Description',
+    'png:caption',
+    'exif:UserComment',
+    'exif:ImageDescription',
+    'iptc:Caption-Abstract',
+    'xmp:dc:description',
+)
+
+EXIF_DATE_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+# Largest PNG text/metadata chunk that is read (bigger ones are skipped)
+MAX_PNG_METADATA_CHUNK = 4 * 1024 * 1024
+# Buffer size for copying image data when a caption is written
+COPY_BUFFER_BYTES = 1024 * 1024
+# A JPEG segment's length field is 16 bits and counts itself
+MAX_JPEG_SEGMENT_PAYLOAD = 65533
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+EXIF_HEADER = b'Exif\x00\x00'
+XMP_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+PHOTOSHOP_HEADER = b'Photoshop 3.0\x00'
+
+# JPEG start-of-frame markers (carry the image size); C4, C8 and CC are not frames
+SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# TIFF tags
+TAG_IMAGE_DESCRIPTION = 0x010E
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+TAG_USER_COMMENT = 0x9286
+
+# TIFF field type -> size in bytes of one value
+TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+XMP_NAMESPACES = {
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'xmp': 'http://ns.adobe.com/xap/1.0/',
+    'photoshop': 'http://ns.adobe.com/photoshop/1.0/',
+}
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+
+class ImageMetadata:
+    """Fields found by read_metadata; anything not present in the file is None.
+
+    captions maps each source in CAPTION_SOURCES that was present to its
+    (sanitized, possibly empty) text; caption picks the preferred one."""
+
+    __slots__ = ('format', 'width', 'height', 'captions', 'date_taken', 'date_digitized', 'date_modified',
+                 'orientation', 'gps')
+
+    def __init__(self, image_format=None):
+        self.format = image_format
+        self.width = None
+        self.height = None
+        self.captions = {}
+        self.date_taken = None
+        self.date_digitized = None
+        self.date_modified = None
+        self.orientation = None
+        self.gps = None  # (latitude, longitude, altitude or None), degrees north/east and metres
+
+    @property
+    def caption(self):
+        """The first non-empty caption in CAPTION_SOURCES order, or None"""
+        for source in CAPTION_SOURCES:
+            text = self.captions.get(source)
+            if text:
+                return text
+        return None
+
+    @property
+    def xmp_description(self):
+        return self.captions.get('xmp:dc:description')
+
+    def __repr__(self):
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"ImageMetadata({fields})"
+
+
+def sanitize_caption(text):
+    """Remove null characters and other control characters, and surrounding whitespace"""
+    if not text:
+        return text
+    return ''.join(c for c in text if c != '\0' and ord(c) >= 32).strip()
+
+
+def parse_exif_date(value):
+    try:
+        return datetime.datetime.strptime(value.strip('\x00 '), EXIF_DATE_FORMAT)
+    except (ValueError, AttributeError):
+        return None
+
+
+def decode_user_comment(data, endian='<'):
+    """Decode an EXIF UserComment (8-byte character code prefix + text)"""
+    if data.startswith(b'ASCII\x00\x00\x00'):
+        # The caption writer stores UTF-8 under the ASCII code; plain ASCII decodes the same
+        return data[8:].decode('utf-8', errors='replace')
+    if data.startswith(b'UNICODE\x00'):
+        # UCS-2 in the byte order of the TIFF header
+        return data[8:].decode('utf-16-le' if endian == '<' else 'utf-16-be', errors='replace')
+    if data.startswith(b'JIS\x00\x00\x00\x00\x00'):
+        return data[8:].decode('shift_jis', errors='replace')
+    if data.startswith(b'\x00' * 8):
+        # Undefined character code
+        return data[8:].decode('utf-8', errors='replace')
+    return data.decode('utf-8', errors='replace')
+
+
+def _read_ifd(tiff, offset, endian):
+    """Return {tag: (type, count, raw value bytes)} for the IFD at offset in TIFF data"""
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    (count,) = struct.unpack_from(endian + 'H', tiff, offset)
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        tag, field_type, value_count = struct.unpack_from(endian + 'HHI', tiff, entry)
+        size = TIFF_TYPE_SIZES.get(field_type, 1) * value_count
+        if size <= 4:
+            value = tiff[entry + 8:entry + 8 + size]
+        else:
+            (value_offset,) = struct.unpack_from(endian + 'I', tiff, entry + 8)
+            value = tiff[value_offset:value_offset + size]
+        entries[tag] = (field_type, value_count, value)
+    return entries
+
+
+def _ifd_pointer(entries, tag, endian):
+    if tag not in entries or len(entries[tag][2]) < 4:
+        return None
+    return struct.unpack_from(endian + 'I', entries[tag][2])[0]
+
+
+def _ifd_text(entries, tag):
+    if tag not in entries:
+        return None
+    return entries[tag][2].split(b'\x00', 1)[0].decode('utf-8', errors='replace')
+
+
+def _ifd_rationals(entries, tag, endian):
+    if tag not in entries:
+        return None
+    field_type, count, value = entries[tag]
+    if field_type not in (5, 10) or len(value) < 8 * count:
+        return None
+    numbers = struct.unpack_from(endian + ('I' if field_type == 5 else 'i') * (2 * count), value)
+    return [numbers[i] / numbers[i + 1] if numbers[i + 1] else 0.0 for i in range(0, len(numbers), 2)]
+
+
+def parse_exif(tiff, metadata):
+    """Fill metadata from a TIFF-structured EXIF block (the APP1 payload after 'Exif\\0\\0')"""
+    if len(tiff) < 8 or tiff[:2] not in (b'II', b'MM'):
+        return
+    endian = '<' if tiff[:2] == b'II' else '>'
+    (ifd0_offset,) = struct.unpack_from(endian + 'I', tiff, 4)
+    ifd0 = _read_ifd(tiff, ifd0_offset, endian)
+
+    description = _ifd_text(ifd0, TAG_IMAGE_DESCRIPTION)
+    if description is not None:
+        metadata.captions['exif:ImageDescription'] = sanitize_caption(description)
+    if TAG_ORIENTATION in ifd0 and len(ifd0[TAG_ORIENTATION][2]) >= 2:
+        metadata.orientation = struct.unpack_from(endian + 'H', ifd0[TAG_ORIENTATION][2])[0]
+    metadata.date_modified = parse_exif_date(_ifd_text(ifd0, TAG_DATETIME))
+
+    exif_offset = _ifd_pointer(ifd0, TAG_EXIF_IFD, endian)
+    if exif_offset:
+        exif = _read_ifd(tiff, exif_offset, endian)
+        metadata.date_taken = parse_exif_date(_ifd_text(exif, TAG_DATETIME_ORIGINAL))
+        metadata.date_digitized = parse_exif_date(_ifd_text(exif, TAG_DATETIME_DIGITIZED))
+        if TAG_USER_COMMENT in exif:
+            metadata.captions['exif:UserComment'] = sanitize_caption(
+                decode_user_comment(exif[TAG_USER_COMMENT][2], endian))
+
+    gps_offset = _ifd_pointer(ifd0, TAG_GPS_IFD, endian)
+    if gps_offset:
+        gps = _read_ifd(tiff, gps_offset, endian)
+        latitude = _ifd_rationals(gps, 2, endian)
+        longitude = _ifd_rationals(gps, 4, endian)
+        if latitude and longitude and len(latitude) == 3 and len(longitude) == 3:
+            lat = latitude[0] + latitude[1] / 60 + latitude[2] / 3600
+            lon = longitude[0] + longitude[1] / 60 + longitude[2] / 3600
+            if _ifd_text(gps, 1) == 'S':
+                lat = -lat
+            if _ifd_text(gps, 3) == 'W':
+                lon = -lon
+            altitude = _ifd_rationals(gps, 6, endian)
+            alt = altitude[0] if altitude else None
+            if alt is not None and 5 in gps and gps[5][2][:1] == b'\x01':
+                alt = -alt
+            metadata.gps = (lat, lon, alt)
+
+
+def parse_iptc(data, metadata):
+    """Fill metadata from IPTC-IIM datasets (Caption-Abstract is record 2, dataset 120)"""
+    position = 0
+    while position + 5 <= len(data) and data[position] == 0x1C:
+        record, dataset, size = data[position + 1], data[position + 2], struct.unpack_from('>H', data, position + 3)[0]
+        position += 5
+        if size & 0x8000:
+            # Extended dataset: the low bits give the length of the size field
+            length_size = size & 0x7FFF
+            size = int.from_bytes(data[position:position + length_size], 'big')
+            position += length_size
+        if record == 2 and dataset == 120 and 'iptc:Caption-Abstract' not in metadata.captions:
+            metadata.captions['iptc:Caption-Abstract'] = sanitize_caption(
+                data[position:position + size].decode('utf-8', errors='replace'))
+        position += size
+
+
+def parse_photoshop_resources(data, metadata):
+    """Find the IPTC block (resource 0x0404) in Photoshop image resources (JPEG APP13)"""
+    position = 0
+    while position + 12 <= len(data) and data[position:position + 4] == b'8BIM':
+        (resource_id,) = struct.unpack_from('>H', data, position + 4)
+        name_length = data[position + 6]
+        position += 6 + ((name_length + 2) & ~1)  # Pascal string padded to even length
+        if position + 4 > len(data):
+            break
+        (size,) = struct.unpack_from('>I', data, position)
+        position += 4
+        if resource_id == 0x0404:
+            parse_iptc(data[position:position + size], metadata)
+        position += (size + 1) & ~1
+
+
+def parse_xmp(packet, metadata):
+    """Fill metadata from an XMP packet: dc:description and, if EXIF had none, the creation date"""
+    try:
+        root = ElementTree.fromstring(packet.strip(b'\x00 \r\n\t'))
+    except ElementTree.ParseError:
+        return
+    description = root.find('.//dc:description', XMP_NAMESPACES)
+    if description is not None:
+        items = description.findall('.//rdf:li', XMP_NAMESPACES)
+        preferred = [item for item in items if item.get(XML_LANG) == 'x-default'] or items
+        text = preferred[0].text if preferred else description.text
+        metadata.captions['xmp:dc:description'] = sanitize_caption(text or '')
+    if metadata.date_taken is None:
+        for element in root.iter():
+            for name in ('{%s}DateCreated' % XMP_NAMESPACES['photoshop'], '{%s}CreateDate' % XMP_NAMESPACES['xmp']):
+                value = element.get(name)
+                if value is None and element.tag == name:
+                    value = element.text
+                if value:
+                    try:
+                        date = datetime.datetime.fromisoformat(value.strip()[:19])
+                    except ValueError:
+                        continue
+                    metadata.date_taken = date.replace(tzinfo=None)
+                    return
+
+
+def _read_jpeg(f, metadata):
+    """Walk JPEG segments up to the start of scan, reading only the metadata segments"""
+    exif_seen = False
+    while True:
+        byte = f.read(1)
+        while byte and byte != b'\xff':
+            byte = f.read(1)
+        marker = f.read(1)
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            return
+        marker = marker[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # Markers without a length
+        if marker in (0xD9, 0xDA):
+            return  # End of image / start of compressed data: no more metadata
+        header = f.read(2)
+        if len(header) < 2:
+            return
+        length = struct.unpack('>H', header)[0] - 2
+        if length < 0:
+            return
+        if marker == 0xE1 or marker == 0xED:
+            segment = f.read(length)
+            if marker == 0xE1 and segment.startswith(EXIF_HEADER) and not exif_seen:
+                exif_seen = True
+                parse_exif(segment[len(EXIF_HEADER):], metadata)
+            elif marker == 0xE1 and segment.startswith(XMP_HEADER):
+                parse_xmp(segment[len(XMP_HEADER):], metadata)
+            elif marker == 0xED and segment.startswith(PHOTOSHOP_HEADER):
+                parse_photoshop_resources(segment[len(PHOTOSHOP_HEADER):], metadata)
+        elif marker in SOF_MARKERS:
+            segment = f.read(length)
+            if len(segment) >= 5:
+                metadata.height, metadata.width = struct.unpack_from('>HH', segment, 1)
+        else:
+            f.seek(length, 1)
+
+
+def _png_text(chunk_type, data):
+    """Return (keyword, text) for a tEXt, zTXt or iTXt chunk, or None if it can't be decoded"""
+    keyword, _, rest = data.partition(b'\x00')
+    keyword = keyword.decode('latin-1')
+    try:
+        if chunk_type == b'tEXt':
+            return keyword, rest.decode('latin-1')
+        if chunk_type == b'zTXt':
+            return keyword, zlib.decompress(rest[1:]).decode('latin-1')
+        # iTXt: compression flag, method, language tag\0, translated keyword\0, text
+        compressed = rest[:1] == b'\x01'
+        _, _, rest = rest[2:].partition(b'\x00')
+        _, _, text = rest.partition(b'\x00')
+        if compressed:
+            text = zlib.decompress(text)
+        return keyword, text.decode('utf-8')
+    except (zlib.error, UnicodeDecodeError):
+        return None
+
+
+def _read_png(f, metadata):
+    """Walk PNG chunks, reading text/EXIF chunks and seeking over image data"""
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type == b'IEND':
+            return
+        wanted = chunk_type in (b'IHDR', b'tEXt', b'zTXt', b'iTXt', b'eXIf')
+        if not wanted or length > MAX_PNG_METADATA_CHUNK:
+            f.seek(length + 4, 1)  # Data and CRC
+            continue
+        data = f.read(length)
+        f.seek(4, 1)
+        if chunk_type == b'IHDR' and len(data) >= 8:
+            metadata.width, metadata.height = struct.unpack_from('>II', data)
+        elif chunk_type == b'eXIf':
+            parse_exif(data, metadata)
+        else:
+            text = _png_text(chunk_type, data)
+            if text is None:
+                continue
+            keyword, value = text
+            if keyword == 'XML:com.adobe.xmp':
+                parse_xmp(value.encode('utf-8'), metadata)
+            elif keyword in ('Comment', 'Description', 'caption'):
+                metadata.captions.setdefault('png:' + keyword, sanitize_caption(value))
+
+
+def read_metadata(source):
+    """Return ImageMetadata for a JPEG or PNG file path or seekable binary stream.
+
+    Returns None for other formats. The stream position is left wherever
+    parsing stopped."""
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        with open(source, 'rb') as f:
+            return read_metadata(f)
+    signature = source.read(8)
+    if signature[:2] == b'\xff\xd8':
+        metadata = ImageMetadata('JPEG')
+        source.seek(2)
+        _read_jpeg(source, metadata)
+        return metadata
+    if signature == PNG_SIGNATURE:
+        metadata = ImageMetadata('PNG')
+        _read_png(source, metadata)
+        return metadata
+    return None
+
+
+def _copy_bytes(src, dst, count):
+    while count > 0:
+        chunk = src.read(min(count, COPY_BUFFER_BYTES))
+        if not chunk:
+            raise ValueError("Unexpected end of file")
+        dst.write(chunk)
+        count -= len(chunk)
+
+
+def _basic_exif_dict(tiff):
+    """piexif dict with the orientation and dates parse_exif finds in an EXIF block piexif can't load"""
+    import piexif
+
+    metadata = ImageMetadata('JPEG')
+    try:
+        parse_exif(tiff, metadata)
+    except (struct.error, ValueError, IndexError):
+        pass
+    zeroth, exif = {}, {}
+    if metadata.orientation:
+        zeroth[piexif.ImageIFD.Orientation] = metadata.orientation
+    for ifd, tag, date in ((zeroth, piexif.ImageIFD.DateTime, metadata.date_modified),
+                           (exif, piexif.ExifIFD.DateTimeOriginal, metadata.date_taken),
+                           (exif, piexif.ExifIFD.DateTimeDigitized, metadata.date_digitized)):
+        if date is not None:
+            ifd[tag] = date.strftime(EXIF_DATE_FORMAT).encode('ascii')
+    return {'0th': zeroth, 'Exif': exif, 'GPS': {}, '1st': {}, 'thumbnail': None}
+
+
+def _user_comment_exif(exif_payload, caption):
+    """Return new APP1 payload (starting 'Exif\\0\\0') with UserComment set to caption"""
+    import piexif
+
+    exif_dict = None
+    if exif_payload:
+        try:
+            exif_dict = piexif.load(exif_payload)
+        except Exception as e:
+            # Some vendor MakerNotes are more than piexif can parse; start from the basic fields
+            print(f"[Caption] Could not parse the existing EXIF ({e}); keeping only its orientation and dates")
+            exif_dict = _basic_exif_dict(exif_payload[len(EXIF_HEADER):])
+    if exif_dict is None:
+        exif_dict = {'0th': {}, 'Exif': {}, 'GPS': {}, '1st': {}, 'thumbnail': None}
+    # UserComment: 8-byte character code + text (UTF-8, as read_metadata expects)
+    exif_dict['Exif'][piexif.ExifIFD.UserComment] = b'ASCII\x00\x00\x00' + (caption or '').encode('utf-8')
+    payload = piexif.dump(exif_dict)
+    if len(payload) > MAX_JPEG_SEGMENT_PAYLOAD and exif_dict.get('thumbnail'):
+        # Drop the embedded thumbnail rather than fail
+        exif_dict['thumbnail'] = None
+        exif_dict['1st'] = {}
+        payload = piexif.dump(exif_dict)
+    if len(payload) > MAX_JPEG_SEGMENT_PAYLOAD:
+        raise ValueError("EXIF data too large for a JPEG segment")
+    return payload
+
+
+def _write_jpeg_caption(src, dst, caption):
+    """Copy a JPEG from src to dst with the EXIF APP1 segment replaced (or added after SOI/JFIF)"""
+    dst.write(src.read(2))  # SOI
+    segments = []  # (marker, payload) of the segments before the first non-APPn marker
+    while True:
+        position = src.tell()
+        header = src.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            raise ValueError("Malformed JPEG header")
+        marker = header[1]
+        if not 0xE0 <= marker <= 0xEF and marker != 0xFE:
+            src.seek(position)
+            break
+        length = struct.unpack('>H', header[2:])[0] - 2
+        segments.append((marker, src.read(length)))
+
+    exif_index = next((i for i, (marker, payload) in enumerate(segments)
+                       if marker == 0xE1 and payload.startswith(EXIF_HEADER)), None)
+    new_exif = (0xE1, _user_comment_exif(segments[exif_index][1] if exif_index is not None else None, caption))
+    if exif_index is not None:
+        segments[exif_index] = new_exif
+    else:
+        # EXIF goes right after SOI, or after the JFIF APP0 segment if there is one
+        insert_at = 1 if segments and segments[0][0] == 0xE0 else 0
+        segments.insert(insert_at, new_exif)
+    for marker, payload in segments:
+        dst.write(struct.pack('>BBH', 0xFF, marker, len(payload) + 2))
+        dst.write(payload)
+    shutil.copyfileobj(src, dst, COPY_BUFFER_BYTES)
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def _png_caption_chunks(caption):
+    chunks = []
+    for keyword in ('Comment', 'Description'):
+        try:
+            chunks.append(_png_chunk(b'tEXt', keyword.encode('latin-1') + b'\x00' + caption.encode('latin-1')))
+        except UnicodeEncodeError:
+            # iTXt: uncompressed UTF-8 with empty language tag and translated keyword
+            chunks.append(_png_chunk(b'iTXt', keyword.encode('latin-1') + b'\x00\x00\x00\x00\x00'
+                                     + caption.encode('utf-8')))
+    return chunks
+
+
+def _write_png_caption(src, dst, caption):
+    """Copy a PNG from src to dst, dropping Comment/Description text chunks and adding new ones after IHDR"""
+    dst.write(src.read(8))  # Signature
+    while True:
+        header = src.read(8)
+        if len(header) < 8:
+            raise ValueError("PNG ended without IEND")
+        length, chunk_type = struct.unpack('>I4s', header)
+        if chunk_type in (b'tEXt', b'zTXt', b'iTXt') and length <= MAX_PNG_METADATA_CHUNK:
+            data = src.read(length + 4)
+            if data.partition(b'\x00')[0] in (b'Comment', b'Description'):
+                continue  # Replaced by the new caption chunks
+            dst.write(header)
+            dst.write(data)
+            continue
+        dst.write(header)
+        _copy_bytes(src, dst, length + 4)  # Data and CRC
+        if chunk_type == b'IHDR' and caption:
+            for chunk in _png_caption_chunks(caption):
+                dst.write(chunk)
+        elif chunk_type == b'IEND':
+            return
+
+
+def write_caption(path, caption):
+    """Store caption in a JPEG (EXIF UserComment) or PNG (Comment/Description text chunks) file.
+
+    Only the metadata is rewritten: the rest of the file is copied byte for
+    byte to a temporary file in the same directory, which then atomically
+    replaces the original. An empty caption removes it. Returns False if the
+    file is neither JPEG nor PNG."""
+    with open(path, 'rb') as src:
+        signature = src.read(8)
+        src.seek(0)
+        if signature[:2] == b'\xff\xd8':
+            write = _write_jpeg_caption
+        elif signature == PNG_SIGNATURE:
+            write = _write_png_caption
+        else:
+            return False
+        directory = os.path.dirname(os.path.abspath(path))
+        temp_fd, temp_path = tempfile.mkstemp(prefix='.caption-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(temp_fd, 'wb') as dst:
+                write(src, dst, caption)
+                dst.flush()
+                os.fsync(dst.fileno())
+            shutil.copymode(path, temp_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+    os.replace(temp_path, path)
+    return True
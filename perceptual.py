@@ -0,0 +1,129 @@
+"""
+Perceptual hashing for piGallery
+64-bit difference hashes (dHash) of tiny grayscale thumbnails, used to find
+near-identical photos such as burst shots. NumPy is used for batches when it
+is installed; the pure Python fallback gives the same hashes.
+"""
+
+from PIL import Image
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# dHash compares each pixel with its right neighbour in a 9x8 thumbnail -> 64 bits
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+THUMBNAIL_BYTES = HASH_WIDTH * HASH_HEIGHT
+
+# Near-duplicates are looked for among this many following files of the same folder
+# (bursts are saved with consecutive names)
+NEIGHBOUR_WINDOW = 32
+# Files compared at once by the NumPy path (bounds its memory to COMPARE_BLOCK * window bytes)
+COMPARE_BLOCK = 4096
+
+
+def dhash_thumbnail(stream):
+    """Decode an image stream to the 9x8 grayscale pixels a dHash is computed from"""
+    with Image.open(stream) as img:
+        # JPEG: let the decoder scale down by up to 8x instead of decoding full resolution
+        img.draft('L', (HASH_WIDTH * 8, HASH_HEIGHT * 8))
+        img = img.convert('L')
+        return img.resize((HASH_WIDTH, HASH_HEIGHT), Image.BILINEAR, reducing_gap=2.0).tobytes()
+
+
+def dhash_batch(thumbnails):
+    """Return the 64-bit dHash (int) of each 9x8 thumbnail from dhash_thumbnail"""
+    if not thumbnails:
+        return []
+    if NUMPY_AVAILABLE:
+        pixels = np.frombuffer(b''.join(thumbnails), dtype=np.uint8).reshape(-1, HASH_HEIGHT, HASH_WIDTH)
+        bits = (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(thumbnails), 64)
+        return [int(h) for h in np.packbits(bits, axis=1).view('>u8').ravel()]
+    hashes = []
+    for pixels in thumbnails:
+        value = 0
+        for row in range(0, THUMBNAIL_BYTES, HASH_WIDTH):
+            for col in range(row, row + HASH_WIDTH - 1):
+                value = (value << 1) | (pixels[col + 1] > pixels[col])
+        hashes.append(value)
+    return hashes
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def _popcount(values):
+    """Number of set bits of each element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return table[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _close_rows(values, folder_ids, threshold, window, start, stop):
+    """Boolean array of shape (stop - start, window): [i - start, k] tells whether file i + 1 + k
+    is in the same folder as file i and within threshold bits of it"""
+    rows = np.zeros((stop - start, window), dtype=bool)
+    for offset in range(1, window + 1):
+        end = min(stop, len(values) - offset)
+        if end <= start:
+            break
+        rows[:end - start, offset - 1] = (
+            (_popcount(values[start + offset:end + offset] ^ values[start:end]) <= threshold)
+            & (folder_ids[start + offset:end + offset] == folder_ids[start:end]))
+    return rows
+
+
+def find_near_duplicates(paths, hashes, threshold, window=NEIGHBOUR_WINDOW):
+    """Group paths whose dHashes differ by at most threshold bits from the group's first photo.
+
+    Only files in the same folder within `window` places of each other (in
+    path order) are compared, which catches burst shots in O(n * window)
+    instead of comparing every pair. Groups are built leader-first: the
+    first file not in a group yet starts one and takes the following files
+    close to it, so every member is within threshold of the leader and a
+    folder of gradually changing shots is never chained into one group.
+    Returns a list of groups (lists of paths, in path order) with at least
+    two members."""
+    order = sorted(range(len(paths)), key=paths.__getitem__)
+    paths = [paths[i] for i in order]
+    hashes = [hashes[i] for i in order]
+    folders = [path.rpartition('/')[0] for path in paths]
+    count = len(paths)
+
+    if NUMPY_AVAILABLE:
+        values = np.array(hashes, dtype=np.uint64)
+        folder_numbers = {}
+        folder_ids = np.array([folder_numbers.setdefault(f, len(folder_numbers)) for f in folders])
+        rows = None
+        rows_start = 0
+
+        def members(i):
+            nonlocal rows, rows_start
+            if rows is None or i >= rows_start + len(rows):
+                # Comparisons are made a block of leaders at a time to bound memory
+                rows_start = i
+                rows = _close_rows(values, folder_ids, threshold, window, i, min(count, i + COMPARE_BLOCK))
+            return (i + 1 + int(k) for k in np.flatnonzero(rows[i - rows_start]))
+    else:
+        def members(i):
+            return (j for j in range(i + 1, min(count, i + window + 1))
+                    if folders[i] == folders[j] and hamming_distance(hashes[i], hashes[j]) <= threshold)
+
+    grouped = bytearray(count)
+    groups = []
+    for i in range(count):
+        if grouped[i]:
+            continue
+        group = [paths[i]]
+        for j in members(i):
+            if not grouped[j]:
+                grouped[j] = 1
+                group.append(paths[j])
+        if len(group) > 1:
+            groups.append(group)
+    return groups
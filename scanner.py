@@ -0,0 +1,205 @@
+"""
+Background media scanner for piGallery
+Fills in per-image data (captions, perceptual hashes) and exports sidecar
+captions in a daemon thread so the render loop never decodes an image it is
+not about to show
+"""
+
+import threading
+import time
+
+from metadata import write_caption
+from perceptual import dhash_batch, dhash_thumbnail, find_near_duplicates
+
+# Files stat'ed per batch when looking for ones changed in place (a stat is much cheaper than a read)
+STAT_BATCH_SIZE = 512
+
+
+class MediaScanner:
+    """Works through the media index in small batches after each library refresh.
+
+    refresh_images() records new files in the index and calls wake(); the
+    scanner then re-stats the files already indexed so ones changed in place
+    (re-copied, edited by another program) lose their stale captions and
+    hashes, writes sidecar captions into the files (caption_export =
+    true), reads captions of new or changed files with read_caption
+    (if given) into the index's caption cache, computes the content hashes
+    that tell same-size files apart (deduplicate = true), hashes files that
+    have no perceptual hash yet and hands the resulting duplicates and
+    near-duplicate groups to the slideshow, which applies them on its own
+    thread (see Slideshow.duplicates_changed and set_near_duplicates)."""
+
+    def __init__(self, slideshow, read_caption=None, batch_size=32, idle_seconds=600, pause_seconds=0.05):
+        self.slideshow = slideshow
+        self.read_caption = read_caption
+        self.index = slideshow.media_index
+        self.fs = slideshow.fs
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        # Short sleep between batches so the scanner doesn't starve the render thread on a Pi
+        self.pause_seconds = pause_seconds
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="media-scanner", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def wake(self):
+        """Ask for a scan pass (called after refresh_images found changes)"""
+        self._wake_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            try:
+                self.scan_once()
+            except Exception as e:
+                print(f"[Scanner] Scan failed: {e}")
+            self._wake_event.wait(self.idle_seconds)
+
+    def scan_once(self):
+        """Pick up files changed in place, export sidecar captions, cache missing captions, hash every file still
+        missing a perceptual hash, then refresh near-duplicate groups"""
+        self.refresh_stats()
+        if self.slideshow.config.get('caption_export', 'false').lower() == 'true':
+            self.export_captions()
+        if self.read_caption is not None:
+            self.refresh_captions()
+        if self.slideshow.config.get('deduplicate', 'true').lower() == 'true' and self.hash_duplicates():
+            self.slideshow.duplicates_changed()
+        if self.slideshow.near_duplicate_mode() == 'off':
+            return
+        hashed = self.hash_pending()
+        if hashed or self.slideshow.near_duplicate_groups is None:
+            self.update_near_duplicates()
+
+    def export_captions(self):
+        """Write sidecar captions into the image files; returns the number written"""
+        exported = 0
+        while not self._stop_event.is_set():
+            rows = self.index.sidecar_captions_to_export(self.batch_size)
+            if not rows:
+                break
+            done, failed = [], []
+            for path, caption, updated_at in rows:
+                try:
+                    ok = write_caption(self.slideshow._resolve_image_path(path), caption)
+                except Exception as e:
+                    print(f"[Scanner] Could not export caption to {path}: {e}")
+                    ok = False
+                (done if ok else failed).append((path, updated_at))
+            self.index.mark_sidecar_exported(done)
+            # Failed ones are retried when their caption changes
+            self.index.mark_sidecar_exported(failed, exported=-1)
+            self.index.invalidate_captions([path for path, _ in done])
+            exported += len(done)
+            time.sleep(self.pause_seconds)
+        if exported:
+            print(f"[Scanner] Exported {exported} sidecar captions into image files")
+        return exported
+
+    def refresh_stats(self):
+        """Record the current size and mtime of indexed files that changed since they were indexed
+        (which resets their cached caption and hashes); returns the number of changed files"""
+        changed = 0
+        after = ''
+        while not self._stop_event.is_set():
+            rows = self.index.stats_page(after, STAT_BATCH_SIZE)
+            if not rows:
+                break
+            after = rows[-1][0]
+            updates = []
+            for path, size, mtime in rows:
+                try:
+                    stat = self.fs.stat(self.slideshow._resolve_image_path(path))
+                except OSError:
+                    # Deleted; refresh_images removes it from the index
+                    continue
+                if stat.st_size != size or stat.st_mtime != mtime:
+                    updates.append((path, stat.st_size, stat.st_mtime))
+            if updates:
+                self.index.update_stats(updates)
+                changed += len(updates)
+            time.sleep(self.pause_seconds)
+        if changed:
+            print(f"[Scanner] {changed} images changed on disk since they were indexed")
+        return changed
+
+    def refresh_captions(self):
+        """Read captions of files whose cached caption is missing or stale; returns the number read"""
+        refreshed = 0
+        after = ''
+        while not self._stop_event.is_set():
+            paths = self.index.paths_needing_caption(after, self.batch_size)
+            if not paths:
+                break
+            after = paths[-1]
+            rows = []
+            for path in paths:
+                full_path = self.slideshow._resolve_image_path(path)
+                try:
+                    stat = self.fs.stat(full_path)
+                except OSError:
+                    continue
+                rows.append((path, stat.st_size, stat.st_mtime, self.read_caption(full_path)))
+            self.index.set_captions(rows)
+            refreshed += len(rows)
+            time.sleep(self.pause_seconds)
+        if refreshed:
+            print(f"[Scanner] Cached captions for {refreshed} images")
+        return refreshed
+
+    def hash_duplicates(self):
+        """Compute the content hashes that find exact duplicates; returns the number of files hashed"""
+        hashed = 0
+        while not self._stop_event.is_set():
+            count = self.index.hash_for_duplicates(self.slideshow._resolve_image_path, self.batch_size)
+            if not count:
+                break
+            hashed += count
+            time.sleep(self.pause_seconds)
+        if hashed:
+            print(f"[Scanner] Computed content hashes for {hashed} possible duplicates")
+        return hashed
+
+    def hash_pending(self):
+        """Compute perceptual hashes batch by batch; returns the number of files hashed"""
+        hashed = 0
+        after = ''
+        while not self._stop_event.is_set():
+            paths = self.index.paths_without_dhash(after, self.batch_size)
+            if not paths:
+                break
+            after = paths[-1]
+            thumbnails = []
+            done = []
+            failed = []
+            for path in paths:
+                try:
+                    with self.fs.open(self.slideshow._resolve_image_path(path)) as f:
+                        thumbnails.append(dhash_thumbnail(f))
+                    done.append(path)
+                except Exception as e:
+                    # Not tried again until the file changes
+                    print(f"[Scanner] Could not hash {path}: {e}")
+                    failed.append(path)
+            self.index.set_dhashes(zip(done, dhash_batch(thumbnails)))
+            self.index.mark_dhash_failed(failed)
+            hashed += len(done)
+            time.sleep(self.pause_seconds)
+        if hashed:
+            print(f"[Scanner] Computed perceptual hashes for {hashed} images")
+        return hashed
+
+    def update_near_duplicates(self):
+        paths, hashes = self.index.dhashes()
+        groups = find_near_duplicates(paths, hashes, self.slideshow.near_duplicate_threshold())
+        print(f"[Scanner] Found {len(groups)} groups of near-duplicate images")
+        self.slideshow.set_near_duplicates(groups)
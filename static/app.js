@@ -23,7 +23,7 @@ function updateThemeDebug() {
     const debugDisplay = document.getElementById('current-theme-display');
     if (debugDisplay) {
         const currentTheme = document.documentElement.getAttribute('data-theme') || 'default (:root)';
-        const cssLoaded = document.querySelector('link[href="/static/themes.css"]') ? 'Yes' : 'No';
+        const cssLoaded = document.querySelector('link[rel="stylesheet"][href^="/static/"]') ? 'Yes' : 'No';
         debugDisplay.textContent = currentTheme;
     }
 }
@@ -57,7 +57,7 @@ document.addEventListener('DOMContentLoaded', function() {
     setTimeout(updateThemeDebug, 100);
     updateStatus();
     loadSettings();
-    setInterval(updateStatus, 3000); // Update every 3 seconds
+    startStatusUpdates();
     
     // Update countdown every second
     countdownInterval = setInterval(updateCountdown, 500);
@@ -107,6 +107,7 @@ function setupStickySaveButton() {
 }
 
 let lastImageName = '';
+let lastImageVersion = '';
 let currentBrowsingField = null;
 let currentBrowsePath = '';
 
@@ -306,76 +307,153 @@ async function updateStatus() {
     try {
         const response = await fetch('/api/status');
         const data = await response.json();
-        
-        document.getElementById('status-time').textContent = data.time || '--:--';
-        document.getElementById('status-date').textContent = data.date || '---';
-        document.getElementById('status-temp').textContent = data.temperature || '--°C';
-        document.getElementById('status-weather').textContent = data.weather || '---';
-        document.getElementById('status-index').textContent = `${data.current_index} / ${data.total_images}`;
-        document.getElementById('status-paused').textContent = data.paused ? 'Paused' : 'Playing';
-        document.getElementById('current-image').textContent = data.current_image || 'No image loaded';
-        
-        // Update countdown tracking
-        if (data.time_remaining !== undefined) {
-            lastKnownTimeRemaining = data.time_remaining;
-            lastUpdateTime = Date.now();
-            
-            // Show "Paused" instead of countdown when paused
-            const countdownEl = document.getElementById('status-countdown');
-            if (data.paused && countdownEl) {
-                countdownEl.textContent = 'Paused';
-                countdownEl.style.color = '#f39c12';
-            } else {
-                updateCountdown(); // Immediately update display
-            }
+        return applyStatus(data);
+    } catch (error) {
+        console.error('Failed to update status:', error);
+        return false;
+    }
+}
+
+let lastStatusKey = '';
+
+// Status updates: pushed over Server-Sent Events; if the stream fails, poll /api/status
+// every 3 s, backing off to 15 s while nothing changes (60 s while the tab is hidden)
+const POLL_MIN_MS = 3000;
+const POLL_MAX_MS = 15000;
+const POLL_HIDDEN_MS = 60000;
+const STREAM_RETRY_MS = 60000;
+let statusSource = null;
+let pollTimer = null;
+let pollDelay = POLL_MIN_MS;
+
+function startStatusUpdates() {
+    if (window.EventSource) {
+        startStatusStream();
+    } else {
+        schedulePoll(POLL_MIN_MS);
+    }
+    document.addEventListener('visibilitychange', () => {
+        if (!document.hidden && pollTimer) {
+            // Catch up right away when the page is shown again
+            pollDelay = POLL_MIN_MS;
+            schedulePoll(0);
         }
-        
-        // Update system stats if available
-        if (data.system) {
-            const sys = data.system;
-            const memoryEl = document.getElementById('status-memory');
-            const cpuEl = document.getElementById('status-cpu');
-            const tempEl = document.getElementById('status-cpu-temp');
-            const diskFreeEl = document.getElementById('status-disk-free');
-            const diskUsedEl = document.getElementById('status-disk-used');
-            
-            if (memoryEl && sys.memory_free_mb !== undefined) {
-                memoryEl.textContent = `${sys.memory_free_mb} MB`;
-            }
-            if (cpuEl && sys.cpu_percent !== undefined) {
-                cpuEl.textContent = `${sys.cpu_percent}%`;
-            }
-            if (tempEl && sys.cpu_temp !== undefined) {
-                tempEl.textContent = `${sys.cpu_temp}°C`;
-            }
-            if (diskFreeEl && sys.disk_free_gb !== undefined) {
-                diskFreeEl.textContent = `${sys.disk_free_gb} GB`;
-            }
-            if (diskUsedEl && sys.disk_used_percent !== undefined) {
-                diskUsedEl.textContent = `${sys.disk_used_percent}%`;
-            }
+    });
+}
+
+function startStatusStream() {
+    statusSource = new EventSource('/api/events');
+    statusSource.addEventListener('status', (event) => applyStatus(JSON.parse(event.data)));
+    statusSource.addEventListener('stats', (event) => applySystemStats(JSON.parse(event.data)));
+    statusSource.onopen = () => {
+        clearTimeout(pollTimer);
+        pollTimer = null;
+    };
+    statusSource.onerror = () => {
+        // Fall back to polling and try the stream again later
+        statusSource.close();
+        statusSource = null;
+        pollDelay = POLL_MIN_MS;
+        schedulePoll(POLL_MIN_MS);
+        setTimeout(startStatusStream, STREAM_RETRY_MS);
+    };
+}
+
+function schedulePoll(delay) {
+    clearTimeout(pollTimer);
+    pollTimer = setTimeout(async () => {
+        const changed = await updateStatus();
+        if (statusSource && statusSource.readyState === EventSource.OPEN) {
+            pollTimer = null;
+            return;
         }
+        pollDelay = changed ? POLL_MIN_MS : Math.min(POLL_MAX_MS, Math.round(pollDelay * 1.5));
+        schedulePoll(document.hidden ? POLL_HIDDEN_MS : pollDelay);
+    }, delay);
+}
+
+function applyStatus(data) {
+    // Returns whether anything but the countdown changed since the last status
+    const { time_remaining, system, ...rest } = data;
+    const statusKey = JSON.stringify(rest);
+    const changed = statusKey !== lastStatusKey;
+    lastStatusKey = statusKey;
+
+    document.getElementById('status-time').textContent = data.time || '--:--';
+    document.getElementById('status-date').textContent = data.date || '---';
+    document.getElementById('status-temp').textContent = data.temperature || '--°C';
+    document.getElementById('status-weather').textContent = data.weather || '---';
+    document.getElementById('status-index').textContent = `${data.current_index} / ${data.total_images}`;
+    document.getElementById('status-paused').textContent = data.paused ? 'Paused' : 'Playing';
+    document.getElementById('current-image').textContent = data.current_image || 'No image loaded';
+    const favoriteBtn = document.getElementById('favoriteBtn');
+    if (favoriteBtn) {
+        favoriteBtn.textContent = data.favorite ? '★ Favorite' : '☆ Favorite';
+    }
+    
+    // Update countdown tracking
+    if (data.time_remaining !== undefined) {
+        lastKnownTimeRemaining = data.time_remaining;
+        lastUpdateTime = Date.now();
         
-        // Update image preview only when image changes
-        const previewImg = document.getElementById('image-preview');
-        if (data.current_image && data.current_image !== lastImageName) {
-            previewImg.src = `/api/image/preview?t=${Date.now()}`;
-            previewImg.style.display = 'block';
-            lastImageName = data.current_image;
-            // Load caption when image changes
-            loadCaption();
-        } else if (!data.current_image) {
-            previewImg.style.display = 'none';
-            lastImageName = '';
-            // Clear caption when no image
-            document.getElementById('caption-text').value = '';
-            document.getElementById('caption-status').textContent = '';
+        // Show "Paused" instead of countdown when paused
+        const countdownEl = document.getElementById('status-countdown');
+        if (data.paused && countdownEl) {
+            countdownEl.textContent = 'Paused';
+            countdownEl.style.color = '#f39c12';
+        } else {
+            updateCountdown(); // Immediately update display
         }
-        
-        isPaused = data.paused;
-        document.getElementById('pauseBtn').textContent = isPaused ? '▶️ Resume' : '⏸️ Pause';
-    } catch (error) {
-        console.error('Failed to update status:', error);
+    }
+    
+    // Update image preview only when image changes
+    const previewImg = document.getElementById('image-preview');
+    if (data.current_image && (data.current_image !== lastImageName || data.image_version !== lastImageVersion)) {
+        // v= names this exact image, so the browser can cache it
+        previewImg.src = `/api/image/preview?v=${data.image_version}`;
+        previewImg.style.display = 'block';
+        lastImageName = data.current_image;
+        lastImageVersion = data.image_version;
+        // Load caption when image changes
+        loadCaption();
+    } else if (!data.current_image) {
+        previewImg.style.display = 'none';
+        lastImageName = '';
+        // Clear caption when no image
+        document.getElementById('caption-text').value = '';
+        document.getElementById('caption-status').textContent = '';
+    }
+    
+    isPaused = data.paused;
+    document.getElementById('pauseBtn').textContent = isPaused ? '▶️ Resume' : '⏸️ Pause';
+
+    if (system) {
+        applySystemStats(system);
+    }
+    return changed;
+}
+
+function applySystemStats(sys) {
+    const memoryEl = document.getElementById('status-memory');
+    const cpuEl = document.getElementById('status-cpu');
+    const tempEl = document.getElementById('status-cpu-temp');
+    const diskFreeEl = document.getElementById('status-disk-free');
+    const diskUsedEl = document.getElementById('status-disk-used');
+    
+    if (memoryEl && sys.memory_free_mb !== undefined) {
+        memoryEl.textContent = `${sys.memory_free_mb} MB`;
+    }
+    if (cpuEl && sys.cpu_percent !== undefined) {
+        cpuEl.textContent = `${sys.cpu_percent}%`;
+    }
+    if (tempEl && sys.cpu_temp !== undefined) {
+        tempEl.textContent = `${sys.cpu_temp}°C`;
+    }
+    if (diskFreeEl && sys.disk_free_gb !== undefined) {
+        diskFreeEl.textContent = `${sys.disk_free_gb} GB`;
+    }
+    if (diskUsedEl && sys.disk_used_percent !== undefined) {
+        diskUsedEl.textContent = `${sys.disk_used_percent}%`;
     }
 }
 
@@ -439,6 +517,14 @@ async function loadSettings() {
             document.getElementById('sort-order').value = settings.sort_order || 'random';
         }
         updateToggle('toggle-sort-reverse', settings.sort_reverse === 'true');
+
+        // Offer to shrink photos before upload only if the server takes pre-scaled images
+        const prescaleOption = document.getElementById('upload-prescale-option');
+        if (prescaleOption) {
+            const prescaleAllowed = settings.upload_client_resize === 'true' && typeof createImageBitmap === 'function';
+            prescaleOption.style.display = prescaleAllowed ? 'flex' : 'none';
+            document.getElementById('upload-prescale').checked = localStorage.getItem('piGallery-prescale') !== 'false';
+        }
     } catch (error) {
         console.error('Failed to load settings:', error);
     }
@@ -557,6 +643,90 @@ async function previousImage() {
     }
 }
 
+let searchPage = 1;
+
+async function searchImages(page) {
+    const query = document.getElementById('search-query').value.trim();
+    const statusEl = document.getElementById('search-status');
+    const container = document.getElementById('search-results');
+    if (!query) {
+        container.innerHTML = '';
+        statusEl.textContent = '';
+        document.getElementById('search-prev-btn').style.display = 'none';
+        document.getElementById('search-next-btn').style.display = 'none';
+        return;
+    }
+    try {
+        const response = await fetch(`/api/search?q=${encodeURIComponent(query)}&page=${page}`);
+        const data = await response.json();
+        if (!response.ok) {
+            statusEl.textContent = 'Error: ' + (data.error || 'Search failed');
+            return;
+        }
+        searchPage = data.page;
+        renderSearchResults(data.results);
+        if (data.results.length) {
+            statusEl.textContent = `Results ${(data.page - 1) * data.per_page + 1}-${(data.page - 1) * data.per_page + data.results.length} of ${data.total}`;
+        } else {
+            statusEl.textContent = 'No photos found';
+        }
+        document.getElementById('search-prev-btn').style.display = data.page > 1 ? '' : 'none';
+        document.getElementById('search-next-btn').style.display = data.has_more ? '' : 'none';
+    } catch (error) {
+        statusEl.textContent = 'Error: ' + error.message;
+    }
+}
+
+function renderSearchResults(results) {
+    const container = document.getElementById('search-results');
+    container.innerHTML = '';
+    results.forEach(result => {
+        // Built with DOM nodes: captions and file names are user content
+        const itemDiv = document.createElement('div');
+        itemDiv.className = 'image-item';
+        const thumbnail = document.createElement('div');
+        thumbnail.className = 'image-thumbnail';
+        const img = document.createElement('img');
+        img.src = result.thumbnail_url;
+        img.alt = result.filename;
+        img.loading = 'lazy';
+        thumbnail.appendChild(img);
+        const name = document.createElement('div');
+        name.className = 'image-name';
+        name.title = result.path;
+        name.textContent = truncateText(result.filename, 20);
+        const caption = document.createElement('div');
+        caption.className = 'image-caption';
+        caption.title = result.caption;
+        caption.textContent = result.caption || result.folder;
+        const showBtn = document.createElement('button');
+        showBtn.className = 'btn-success';
+        showBtn.textContent = '▶️ Show now';
+        showBtn.onclick = () => showImageNow(result.path);
+        itemDiv.append(thumbnail, name, caption, showBtn);
+        container.appendChild(itemDiv);
+    });
+}
+
+async function showImageNow(path) {
+    try {
+        const response = await fetch('/api/show', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ path: path })
+        });
+        if (response.ok) {
+            updateStatus();
+            showAlert('Showing ' + path, 'success');
+        } else {
+            const error = await response.json();
+            showAlert('Error: ' + (error.error || 'Could not show image'), 'error');
+        }
+    } catch (error) {
+        showAlert('Error: ' + error.message, 'error');
+    }
+}
+
 async function loadCaption() {
     try {
         const response = await fetch('/api/image/caption');
@@ -642,6 +812,21 @@ async function togglePause() {
     }
 }
 
+async function toggleFavorite() {
+    try {
+        const response = await fetch('/api/image/favorite', { method: 'POST' });
+        const data = await response.json();
+        if (response.ok) {
+            updateStatus();
+            showAlert(data.favorite ? 'Added to favorites' : 'Removed from favorites', 'success');
+        } else {
+            showAlert('Error: ' + (data.error || 'Could not update favorite'), 'error');
+        }
+    } catch (error) {
+        showAlert('Error: ' + error.message, 'error');
+    }
+}
+
 async function setDisplay(action) {
     try {
         const response = await fetch('/api/display', {
@@ -666,6 +851,12 @@ async function setDisplay(action) {
 
 // Store selected files for preview
 let selectedFiles = [];
+// Files sent at once (the server also limits the chunks it accepts in parallel), and retries of a chunk
+const UPLOAD_PARALLEL_FILES = 3;
+const UPLOAD_MAX_RETRIES = 8;
+const UPLOAD_RETRY_MAX_MS = 15000;
+// JPEG quality of photos shrunk in the browser before upload
+const PRESCALE_JPEG_QUALITY = 0.9;
 
 function handleFileSelect(files) {
     // Add new files to the selection
@@ -817,39 +1008,40 @@ async function uploadSelectedFiles() {
 
     let successCount = 0;
     let failCount = 0;
-
-    for (let file of selectedFiles) {
-        const formData = new FormData();
-        // Use custom name if set, otherwise use original filename
-        const fileName = file.customName || file.name;
-        // Create a new File object with the custom name if renamed
-        const fileToUpload = file.customName ? new File([file], fileName, { type: file.type, lastModified: file.lastModified }) : file;
-        formData.append('file', fileToUpload);
-        if (caption) {
-            formData.append('caption', caption);
-        }
-
-        try {
-            uploadStatus.innerHTML += `<p>Uploading ${file.name}...</p>`;
-            const response = await fetch('/api/upload', {
-                method: 'POST',
-                body: formData
-            });
-
-            if (response.ok) {
-                const data = await response.json();
-                const captionMsg = caption ? ' with caption' : '';
-                uploadStatus.innerHTML += `<p style="color: var(--alert-success-text);">✅ ${file.name} uploaded successfully${captionMsg}!</p>`;
+    const jobs = [];
+    const files = selectedFiles.slice();
+    const rows = files.map(file => addUploadRow(uploadStatus, file.customName || file.name));
+
+    // A few files at a time; each one is sent in chunks that resume after a dropped connection
+    let nextFile = 0;
+    const uploadNext = async () => {
+        while (nextFile < files.length) {
+            const i = nextFile++;
+            const file = files[i];
+            const row = rows[i];
+            try {
+                const data = await uploadFileInChunks(file, caption, row);
+                if (data.status === 'duplicate') {
+                    setUploadRowState(row, 1, `ℹ️ ${data.message}`);
+                } else {
+                    setUploadRowState(row, 1, `✅ Uploaded${caption ? ' with caption' : ''}`, 'success');
+                    if (data.job_id) {
+                        jobs.push(data.job_id);
+                    }
+                }
                 successCount++;
-            } else {
-                const data = await response.json();
-                uploadStatus.innerHTML += `<p style="color: var(--alert-error-text);">❌ ${file.name}: ${data.error}</p>`;
+            } catch (error) {
+                setUploadRowState(row, null, `❌ ${error.message}`, 'error');
                 failCount++;
             }
-        } catch (error) {
-            uploadStatus.innerHTML += `<p style="color: var(--alert-error-text);">❌ ${file.name}: ${error.message}</p>`;
-            failCount++;
         }
+    };
+    await Promise.all(Array.from({ length: Math.min(UPLOAD_PARALLEL_FILES, files.length) }, uploadNext));
+
+    // The server adds photos to the slideshow in the background; wait so the counts below include them
+    if (jobs.length > 0) {
+        uploadBtn.textContent = '⏳ Processing...';
+        await Promise.all(jobs.map(waitForJob));
     }
 
     // Re-enable upload button
@@ -875,6 +1067,303 @@ async function uploadSelectedFiles() {
     updateStatus();
 }
 
+function addUploadRow(container, name) {
+    const row = document.createElement('div');
+    row.className = 'upload-row';
+    const label = document.createElement('span');
+    label.className = 'upload-row-name';
+    label.textContent = name;
+    const progress = document.createElement('progress');
+    progress.max = 1;
+    progress.value = 0;
+    const state = document.createElement('span');
+    state.className = 'upload-row-state';
+    state.textContent = 'Waiting...';
+    row.append(label, progress, state);
+    container.appendChild(row);
+    return { progress, state };
+}
+
+function setUploadRowState(row, fraction, text, type) {
+    if (fraction !== null) {
+        row.progress.value = fraction;
+    }
+    row.state.textContent = text;
+    row.state.className = `upload-row-state${type ? ` ${type}` : ''}`;
+}
+
+async function uploadFileInChunks(originalFile, caption, row) {
+    // Returns the server's answer to the last chunk (the same as /api/upload); throws on failure
+    const fileName = originalFile.customName || originalFile.name;
+    let key = `${fileName}:${originalFile.size}:${originalFile.lastModified}`;
+    let file = originalFile;
+    if (prescaleWanted(originalFile)) {
+        setUploadRowState(row, null, 'Shrinking...');
+        file = await prescaleImage(originalFile, Number(settings.upload_max_edge));
+        if (file !== originalFile) {
+            key += `:${settings.upload_max_edge}`;
+        }
+    }
+    const startResponse = await fetch('/api/upload/chunked', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        // The key lets the server continue an earlier, interrupted upload of the same file
+        body: JSON.stringify({ filename: fileName, size: file.size, caption, key })
+    });
+    const upload = await startResponse.json();
+    if (!startResponse.ok) {
+        throw new Error(upload.error || `HTTP ${startResponse.status}`);
+    }
+
+    let offset = upload.offset;
+    let failures = 0;
+    while (true) {
+        const percent = Math.floor(offset / file.size * 100);
+        setUploadRowState(row, offset / file.size, offset > 0 ? `${percent}%` : 'Uploading...');
+        let response;
+        let data = {};
+        try {
+            response = await fetch(`/api/upload/chunked/${upload.upload_id}?offset=${offset}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: file.slice(offset, offset + upload.chunk_size)
+            });
+            data = await response.json();
+        } catch (error) {
+            // Connection dropped: wait, then continue from what the server received
+            if (++failures > UPLOAD_MAX_RETRIES) {
+                throw error;
+            }
+            setUploadRowState(row, null, `Connection lost, retrying (${failures})...`);
+            await new Promise(resolve => setTimeout(resolve, uploadRetryDelay(failures)));
+            try {
+                const statusResponse = await fetch(`/api/upload/chunked/${upload.upload_id}`);
+                if (statusResponse.ok) {
+                    offset = (await statusResponse.json()).offset;
+                }
+            } catch (statusError) {
+                // Still offline; the next PUT fails again and waits longer
+            }
+            continue;
+        }
+        if (response.status === 409 && data.offset !== undefined) {
+            offset = data.offset;
+            continue;
+        }
+        if (response.status === 429 || response.status >= 500) {
+            if (++failures > UPLOAD_MAX_RETRIES) {
+                throw new Error(data.error || `HTTP ${response.status}`);
+            }
+            await new Promise(resolve => setTimeout(resolve, uploadRetryDelay(failures)));
+            continue;
+        }
+        if (!response.ok) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+        failures = 0;
+        if (data.status) {
+            return data;
+        }
+        offset = data.offset;
+    }
+}
+
+function prescaleWanted(file) {
+    const checkbox = document.getElementById('upload-prescale');
+    return settings.upload_client_resize === 'true' && Number(settings.upload_max_edge) > 0
+        && checkbox && checkbox.checked && typeof createImageBitmap === 'function'
+        && /^image\/jpe?g$/i.test(file.type);
+}
+
+async function prescaleImage(file, maxEdge) {
+    // A JPEG of file no larger than maxEdge on its longest side, with the EXIF rotation applied and the
+    // EXIF, XMP and IPTC metadata (captions, dates, GPS) copied over; the file itself if that doesn't help
+    let bitmap;
+    try {
+        bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+    } catch (error) {
+        console.error('Could not decode image for resizing:', error);
+        return file;
+    }
+    try {
+        const scale = maxEdge / Math.max(bitmap.width, bitmap.height);
+        if (scale >= 1) {
+            return file;
+        }
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(bitmap.width * scale);
+        canvas.height = Math.round(bitmap.height * scale);
+        const context = canvas.getContext('2d');
+        context.imageSmoothingQuality = 'high';
+        context.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+        const scaled = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', PRESCALE_JPEG_QUALITY));
+        if (!scaled || scaled.size >= file.size) {
+            return file;
+        }
+        const segments = await jpegMetadataSegments(file, canvas.width, canvas.height);
+        // Metadata goes after the encoder's SOI and JFIF (APP0) segments
+        const head = new Uint8Array(await scaled.slice(0, 64).arrayBuffer());
+        let insertAt = 2;
+        if (head[2] === 0xFF && head[3] === 0xE0) {
+            insertAt = 4 + ((head[4] << 8) | head[5]);
+        }
+        return new Blob([scaled.slice(0, insertAt), ...segments, scaled.slice(insertAt)], { type: 'image/jpeg' });
+    } catch (error) {
+        console.error('Could not resize image:', error);
+        return file;
+    } finally {
+        bitmap.close();
+    }
+}
+
+async function jpegMetadataSegments(file, width, height) {
+    // The APP1 (EXIF, XMP) and APP13 (IPTC) segments of a JPEG, with the EXIF made to describe the
+    // width x height copy (see adjustExifForResize)
+    const bytes = new Uint8Array(await file.slice(0, 512 * 1024).arrayBuffer());
+    const segments = [];
+    let offset = 2;
+    while (offset + 4 <= bytes.length && bytes[offset] === 0xFF) {
+        const marker = bytes[offset + 1];
+        if (marker === 0xDA || marker === 0xD9) {
+            break;
+        }
+        const end = offset + 2 + ((bytes[offset + 2] << 8) | bytes[offset + 3]);
+        if (end > bytes.length) {
+            break;
+        }
+        if (marker === 0xE1) {
+            segments.push(adjustExifForResize(bytes.slice(offset, end), width, height));
+        } else if (marker === 0xED) {
+            segments.push(bytes.slice(offset, end));
+        }
+        offset = end;
+    }
+    return segments;
+}
+
+// Bytes per value of each TIFF field type, for finding where an IFD's out-of-line values end
+const TIFF_TYPE_SIZES = { 1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8 };
+
+function exifIfdEntries(view, ifd, little) {
+    // The entries of the IFD at offset ifd as {tag, type, count, at}, or null if it doesn't fit
+    if (!ifd || ifd + 2 > view.byteLength) {
+        return null;
+    }
+    const count = view.getUint16(ifd, little);
+    if (ifd + 6 + count * 12 > view.byteLength) {
+        return null;
+    }
+    const entries = [];
+    for (let i = 0; i < count; i++) {
+        const at = ifd + 2 + i * 12;
+        entries.push({ tag: view.getUint16(at, little), type: view.getUint16(at + 2, little),
+                       count: view.getUint32(at + 4, little), at });
+    }
+    return entries;
+}
+
+function exifIfdEnd(view, ifd, entries, little) {
+    // Where the IFD and the values it stores outside its entries end
+    let end = ifd + 6 + entries.length * 12;
+    for (const entry of entries) {
+        const size = (TIFF_TYPE_SIZES[entry.type] || 1) * entry.count;
+        if (size > 4) {
+            end = Math.max(end, view.getUint32(entry.at + 8, little) + size);
+        }
+    }
+    return end;
+}
+
+function setExifNumber(view, entry, value, little) {
+    if (entry.type === 3) {
+        view.setUint16(entry.at + 8, value, little);
+    } else if (entry.type === 4) {
+        view.setUint32(entry.at + 8, value, little);
+    }
+}
+
+function adjustExifForResize(segment, width, height) {
+    // segment: a whole APP1 segment; only Exif ones are changed. The orientation is reset to upright
+    // (the pixels are rotated already), PixelXDimension/PixelYDimension are set to the new size and
+    // IFD1, the camera's thumbnail of the old pixels, is dropped. Returns the segment to use.
+    const exifHeader = [0x45, 0x78, 0x69, 0x66, 0x00, 0x00];
+    if (segment.length < 18 || !exifHeader.every((byte, i) => segment[4 + i] === byte)) {
+        return segment;
+    }
+    const view = new DataView(segment.buffer, segment.byteOffset + 10, segment.length - 10);
+    const little = view.getUint16(0) === 0x4949;
+    const ifd0 = view.getUint32(4, little);
+    const entries = exifIfdEntries(view, ifd0, little);
+    if (!entries) {
+        return segment;
+    }
+    let dataEnd = exifIfdEnd(view, ifd0, entries, little);
+    const subIfds = [];
+    for (const entry of entries) {
+        if (entry.tag === 0x0112) {
+            setExifNumber(view, entry, 1, little);
+        } else if (entry.tag === 0x8769 || entry.tag === 0x8825) {
+            subIfds.push(view.getUint32(entry.at + 8, little));  // Exif and GPS IFDs
+        }
+    }
+    for (let i = 0; i < subIfds.length; i++) {
+        const subEntries = exifIfdEntries(view, subIfds[i], little);
+        if (!subEntries) {
+            continue;
+        }
+        dataEnd = Math.max(dataEnd, exifIfdEnd(view, subIfds[i], subEntries, little));
+        for (const entry of subEntries) {
+            if (entry.tag === 0xA002) {
+                setExifNumber(view, entry, width, little);
+            } else if (entry.tag === 0xA003) {
+                setExifNumber(view, entry, height, little);
+            } else if (entry.tag === 0xA005) {
+                subIfds.push(view.getUint32(entry.at + 8, little));  // Interoperability IFD
+            }
+        }
+    }
+    const nextIfdAt = ifd0 + 2 + entries.length * 12;
+    const ifd1 = view.getUint32(nextIfdAt, little);
+    if (!ifd1) {
+        return segment;
+    }
+    view.setUint32(nextIfdAt, 0, little);
+    if (ifd1 < dataEnd || ifd1 >= view.byteLength) {
+        // Something else is stored after the thumbnail; unlinked is the best that can be done
+        return segment;
+    }
+    // The thumbnail and its IFD are last, as usual: cut them off
+    const trimmed = segment.slice(0, 10 + ifd1);
+    trimmed[2] = (trimmed.length - 2) >> 8;
+    trimmed[3] = (trimmed.length - 2) & 0xFF;
+    return trimmed;
+}
+
+function uploadRetryDelay(failures) {
+    return Math.min(UPLOAD_RETRY_MAX_MS, 500 * 2 ** (failures - 1));
+}
+
+async function waitForJob(jobId, timeoutMs = 60000) {
+    // Poll a background job until it finishes; resolves with its last state (null if unknown)
+    const deadline = Date.now() + timeoutMs;
+    while (Date.now() < deadline) {
+        try {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            if (!response.ok) {
+                return null;
+            }
+            const job = await response.json();
+            if (job.state === 'done' || job.state === 'failed') {
+                return job;
+            }
+        } catch (error) {
+            console.error('Error checking job:', error);
+        }
+        await new Promise(resolve => setTimeout(resolve, 500));
+    }
+    return null;
+}
+
 function showAlert(message, type) {
     const alert = document.getElementById('alert');
     alert.textContent = message;
@@ -893,7 +1382,9 @@ function showFullImage() {
     
     if (previewImg.src) {
         // Use the full image endpoint
-        fullImg.src = `/api/image/full?t=${Date.now()}`;
+        // Ask for a copy sized for this screen instead of the multi-megabyte original
+        const size = Math.round(Math.max(window.screen.width, window.screen.height) * (window.devicePixelRatio || 1));
+        fullImg.src = `/api/image/full?v=${lastImageVersion}&size=${size}`;
         modal.style.display = 'block';
     }
 }
@@ -1119,6 +1610,8 @@ async function cancelPowerAction() {
 // ============================================================================
 
 let uploadedImages = [];
+let uploadedTotal = 0;
+let uploadedNextCursor = null;
 let selectedImages = new Set();
 // UI text constants - single source of truth
 const UI_TEXT = {
@@ -1189,10 +1682,36 @@ function closeManageImagesModal() {
     cleanupTemporaryCaptionsCache();
 }
 
+function uploadedImagesQuery(cursor) {
+    // Sort and filter run on the server; pages are fetched with the cursor of the previous one
+    const [sort, order] = (document.getElementById('images-sort')?.value || 'date:desc').split(':');
+    const params = new URLSearchParams({ sort: sort, order: order, per_page: 60 });
+    const filter = document.getElementById('images-filter')?.value.trim();
+    if (filter) params.set('q', filter);
+    if (cursor) params.set('cursor', cursor);
+    return '/api/uploaded-images?' + params.toString();
+}
+
+async function loadMoreUploadedImages() {
+    if (!uploadedNextCursor) return;
+    try {
+        const response = await fetch(uploadedImagesQuery(uploadedNextCursor));
+        const data = await response.json();
+        if (!response.ok || data.error) {
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+        uploadedImages = uploadedImages.concat(data.images || []);
+        uploadedNextCursor = data.next_cursor;
+        renderImagesGrid();
+    } catch (error) {
+        showAlert('Failed to load more images: ' + error.message, 'error');
+    }
+}
+
 async function loadUploadedImages() {
     console.log('Loading uploaded images...');
     try {
-        const response = await fetch('/api/uploaded-images');
+        const response = await fetch(uploadedImagesQuery(null));
         console.log('API response status:', response.status);
 
         if (!response.ok) {
@@ -1207,15 +1726,19 @@ async function loadUploadedImages() {
         }
 
         uploadedImages = data.images || [];
-        console.log('Loaded images:', uploadedImages.length, 'images');
+        uploadedTotal = data.total || 0;
+        uploadedNextCursor = data.next_cursor;
+        console.log('Loaded images:', uploadedImages.length, 'of', uploadedTotal, 'images');
 
-        // Update button count
-        updateUploadedCount(uploadedImages.length);
+        // Update button count (only when the list isn't filtered)
+        if (!document.getElementById('images-filter')?.value.trim()) {
+            updateUploadedCount(uploadedTotal);
+        }
 
         // Hide loading
         document.getElementById('images-loading').style.display = 'none';
 
-        if (uploadedImages.length === 0) {
+        if (uploadedImages.length === 0 && !document.getElementById('images-filter')?.value.trim()) {
             // Show empty state
             document.getElementById('images-empty').style.display = 'block';
             document.getElementById('images-grid').style.display = 'none';
@@ -1240,7 +1763,7 @@ async function loadUploadedImages() {
 
 async function fetchUploadedCount() {
     try {
-        const response = await fetch('/api/uploaded-images');
+        const response = await fetch('/api/uploaded-images?per_page=1');
         if (response.ok) {
             const data = await response.json();
             updateUploadedCount(data.total || 0);
@@ -1263,7 +1786,10 @@ function renderImagesGrid() {
     const countElement = document.getElementById('images-count');
 
     // Update count
-    countElement.textContent = `Found ${uploadedImages.length} uploaded image${uploadedImages.length !== 1 ? 's' : ''}`;
+    countElement.textContent = uploadedImages.length < uploadedTotal
+        ? `Showing ${uploadedImages.length} of ${uploadedTotal} uploaded images`
+        : `Found ${uploadedTotal} uploaded image${uploadedTotal !== 1 ? 's' : ''}`;
+    document.getElementById('images-load-more').style.display = uploadedNextCursor ? '' : 'none';
 
     // Clear existing content
     container.innerHTML = '';
@@ -1274,13 +1800,14 @@ function renderImagesGrid() {
         itemDiv.className = 'image-item';
         itemDiv.innerHTML = `
             <div class="image-thumbnail">
-                <img src="/api/image/preview?path=${encodeURIComponent(image.path)}"
+                <img src="/api/image/preview?path=${encodeURIComponent(image.path)}&v=${image.version}"
                      alt="${image.filename}"
                      loading="lazy"
                      onclick="previewImage('${image.path}')">
                 <input type="checkbox"
                        class="image-checkbox"
                        data-path="${image.path}"
+                       ${selectedImages.has(image.path) ? 'checked' : ''}
                        onchange="toggleImageSelection('${image.path}')">
                 ${editMode ? `
                 <div class="edit-controls">
@@ -1494,7 +2021,7 @@ async function deleteSelectedImages() {
             await loadUploadedImages();
 
             // Update uploaded count in main UI
-            updateUploadedCount(uploadedImages.length);
+            updateUploadedCount(uploadedTotal);
 
             updateStatus();
         }
@@ -1720,25 +2247,24 @@ async function saveCaptionChanges() {
         let successCount = 0;
         let failCount = 0;
 
-        for (const change of changes) {
-            try {
-                const response = await fetch('/api/uploaded-images/caption', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ path: change.path, caption: change.caption })
-                });
-
-                if (response.ok) {
-                    successCount++;
-                    // Update original captions to reflect the save (already trimmed)
-                    originalCaptions[change.path] = change.caption;
-                } else {
-                    failCount++;
-                    console.error(`Failed to save caption for ${change.path}`);
-                }
-            } catch (error) {
+        // One request for all changes; the server reports a result per image
+        const response = await fetch('/api/uploaded-images/captions', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ items: changes })
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Failed to save captions');
+        }
+        for (const result of data.results) {
+            if (result.status === 'ok') {
+                successCount++;
+                // Update original captions to reflect the save (already trimmed)
+                originalCaptions[result.path] = result.caption;
+            } else if (result.status === 'error') {
                 failCount++;
-                console.error(`Error saving caption for ${change.path}:`, error);
+                console.error(`Failed to save caption for ${result.path}: ${result.error}`);
             }
         }
 
@@ -1766,6 +2292,38 @@ async function saveCaptionChanges() {
     }
 }
 
+async function importCaptionsCsv(input) {
+    const file = input.files[0];
+    input.value = '';
+    if (!file) {
+        return;
+    }
+
+    const formData = new FormData();
+    formData.append('file', file);
+    try {
+        const response = await fetch('/api/uploaded-images/captions', {
+            method: 'POST',
+            body: formData
+        });
+        const data = await response.json();
+        if (!response.ok) {
+            showAlert('Caption import failed: ' + (data.error || 'Unknown error'), 'error');
+            return;
+        }
+        if (data.failed > 0) {
+            const failures = data.results.filter(r => r.status === 'error').map(r => `${r.path}: ${r.error}`);
+            console.error('Caption import failures:', failures);
+            showAlert(`Imported ${data.succeeded} caption${data.succeeded !== 1 ? 's' : ''}, ${data.failed} failed (see console)`, 'error');
+        } else {
+            showAlert(`Imported ${data.succeeded} caption${data.succeeded !== 1 ? 's' : ''}`, 'success');
+        }
+        loadUploadedImages();
+    } catch (error) {
+        showAlert('Error importing captions: ' + error.message, 'error');
+    }
+}
+
 function updateEditModeActions() {
     const actionsDiv = document.getElementById('images-actions');
     const saveBtn = document.getElementById('save-changes-btn');
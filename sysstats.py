@@ -0,0 +1,210 @@
+"""
+System statistics for piGallery
+One daemon thread samples memory, CPU load, temperature and disk space from
+/proc, /sys and statvfs (psutil where those don't exist) and publishes a
+snapshot, so the web UI and the resource monitor never start a process or
+wait for a reading.
+"""
+
+import glob
+import os
+import threading
+import time
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+# Thermal zone types reported for the CPU (Raspberry Pi, other ARM boards, Intel, AMD)
+CPU_THERMAL_TYPES = ('cpu-thermal', 'cpu_thermal', 'soc_thermal', 'x86_pkg_temp', 'k10temp')
+
+
+def read_memory_available_mb():
+    """Return available memory in MB, or None"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            free_kb = None
+            for line in f:
+                # Format: "MemAvailable:    123456 kB"; MemFree on kernels without MemAvailable
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+                if line.startswith('MemFree:'):
+                    free_kb = int(line.split()[1])
+            if free_kb is not None:
+                return free_kb / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+
+    if PSUTIL_AVAILABLE:
+        try:
+            return psutil.virtual_memory().available / (1024 * 1024)
+        except Exception:
+            pass
+    return None
+
+
+def read_cpu_times():
+    """Return (busy, total) jiffies since boot from /proc/stat, or None"""
+    try:
+        with open('/proc/stat', 'r') as f:
+            # Format: "cpu  user nice system idle iowait irq softirq steal guest guest_nice"
+            fields = [int(value) for value in f.readline().split()[1:9]]
+    except (OSError, ValueError):
+        return None
+    if len(fields) < 5:
+        return None
+    # guest time is already counted in user; iowait is time spent idle
+    total = sum(fields)
+    idle = fields[3] + fields[4]
+    return total - idle, total
+
+
+def find_cpu_thermal_zone():
+    """Return the temp file of the CPU's thermal zone (the first zone if none is labelled), or None"""
+    zones = sorted(glob.glob('/sys/class/thermal/thermal_zone*'))
+    for zone in zones:
+        try:
+            with open(os.path.join(zone, 'type'), 'r') as f:
+                if f.read().strip() in CPU_THERMAL_TYPES:
+                    return os.path.join(zone, 'temp')
+        except OSError:
+            continue
+    for zone in zones:
+        if os.path.exists(os.path.join(zone, 'temp')):
+            return os.path.join(zone, 'temp')
+    return None
+
+
+def read_cpu_temperature(zone_path):
+    """Return the CPU temperature in °C from a thermal zone (psutil if zone_path is None), or None"""
+    if zone_path:
+        try:
+            with open(zone_path, 'r') as f:
+                # Millidegrees Celsius
+                return int(f.read().strip()) / 1000
+        except (OSError, ValueError):
+            pass
+
+    if PSUTIL_AVAILABLE and hasattr(psutil, 'sensors_temperatures'):
+        try:
+            for entries in psutil.sensors_temperatures().values():
+                if entries:
+                    return entries[0].current
+        except Exception:
+            pass
+    return None
+
+
+def read_disk_usage(path='/'):
+    """Return {'total', 'used', 'available', 'percent_used'} in bytes for the filesystem holding path, or None"""
+    if hasattr(os, 'statvfs'):
+        try:
+            st = os.statvfs(path)
+            total = st.f_blocks * st.f_frsize
+            # Same figures as df: space reserved for root counts as neither used nor available
+            used = (st.f_blocks - st.f_bfree) * st.f_frsize
+            available = st.f_bavail * st.f_frsize
+            percent_used = used / (used + available) * 100 if used + available > 0 else 0
+            return {'total': total, 'used': used, 'available': available, 'percent_used': percent_used}
+        except OSError:
+            pass
+
+    if PSUTIL_AVAILABLE:
+        try:
+            usage = psutil.disk_usage(path)
+            return {'total': usage.total, 'used': usage.used, 'available': usage.free,
+                    'percent_used': usage.percent}
+        except Exception:
+            pass
+    return None
+
+
+class SystemStatsSampler:
+    """Samples system statistics every interval_seconds in a daemon thread.
+
+    snapshot() returns the latest sample without blocking: a dict with any
+    of memory_free_mb, cpu_percent, cpu_temp, disk_total, disk_available
+    and disk_used_percent that could be read, plus sampled_at (time.time()).
+    cpu_percent is the load over the last interval, not the average since
+    boot. The dict is empty until the first sample has been taken."""
+
+    def __init__(self, interval_seconds=5, disk_path='/'):
+        self.interval_seconds = interval_seconds
+        self.disk_path = disk_path
+        self._snapshot = {}
+        self._cpu_times = None
+        self._thermal_zone = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="system-stats", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def snapshot(self):
+        """Return the latest sample (a copy; empty before the first one)"""
+        return dict(self._snapshot)
+
+    def _run(self):
+        self._thermal_zone = find_cpu_thermal_zone()
+        self._cpu_times = read_cpu_times()
+        if self._cpu_times is None and PSUTIL_AVAILABLE:
+            # First call only starts psutil's measurement window
+            psutil.cpu_percent(interval=None)
+        # A short first window so the UI has a CPU figure soon after startup
+        wait = min(1, self.interval_seconds)
+        while not self._stop_event.wait(wait):
+            wait = self.interval_seconds
+            try:
+                self._snapshot = self.sample()
+            except Exception as e:
+                print(f"[System Stats] Sampling failed: {e}")
+
+    def sample(self):
+        """Read every statistic once and return them as a snapshot dict"""
+        stats = {'sampled_at': time.time()}
+        memory = read_memory_available_mb()
+        if memory is not None:
+            stats['memory_free_mb'] = memory
+
+        cpu = self._cpu_percent()
+        if cpu is not None:
+            stats['cpu_percent'] = cpu
+
+        temp = read_cpu_temperature(self._thermal_zone)
+        if temp is not None:
+            stats['cpu_temp'] = temp
+
+        disk = read_disk_usage(self.disk_path)
+        if disk is not None:
+            stats['disk_total'] = disk['total']
+            stats['disk_available'] = disk['available']
+            stats['disk_used_percent'] = disk['percent_used']
+        return stats
+
+    def _cpu_percent(self):
+        """CPU load since the previous call"""
+        times = read_cpu_times()
+        if times is None:
+            if PSUTIL_AVAILABLE:
+                try:
+                    return psutil.cpu_percent(interval=None)
+                except Exception:
+                    pass
+            return None
+        previous, self._cpu_times = self._cpu_times, times
+        if previous is None:
+            return None
+        busy = times[0] - previous[0]
+        total = times[1] - previous[1]
+        if total <= 0:
+            return None
+        return max(0.0, min(100.0, busy / total * 100))
@@ -0,0 +1,9 @@
+"""Shared setup for the piGallery tests: modules import from the repository root and pygame
+runs without a display or sound device"""
+
+import os
+import sys
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
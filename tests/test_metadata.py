@@ -0,0 +1,46 @@
+"""Caption writing on JPEGs whose metadata is unusual"""
+
+import io
+import struct
+
+from PIL import Image
+
+from metadata import read_metadata, write_caption
+
+
+def _ifd(entries, next_offset=0):
+    data = struct.pack('<H', len(entries))
+    for tag, field_type, count, value in entries:
+        data += struct.pack('<HHI', tag, field_type, count) + value
+    return data + struct.pack('<I', next_offset)
+
+
+def _jpeg_with_malformed_exif():
+    """A JPEG whose EXIF has Orientation 6, a DateTimeOriginal and a vendor SHORT array pointing
+    past the end of the segment, which piexif can't load"""
+    exif_offset = 8 + 2 + 2 * 12 + 4
+    date_offset = exif_offset + 2 + 2 * 12 + 4
+    tiff = b'II*\x00' + struct.pack('<I', 8)
+    tiff += _ifd([(0x0112, 3, 1, struct.pack('<HH', 6, 0)), (0x8769, 4, 1, struct.pack('<I', exif_offset))])
+    tiff += _ifd([(0x9003, 2, 20, struct.pack('<I', date_offset)), (0x927C, 3, 100, struct.pack('<I', 0x7FFFFF00))])
+    tiff += b'2020:05:06 07:08:09\x00'
+    payload = b'Exif\x00\x00' + tiff
+    encoded = io.BytesIO()
+    Image.new('RGB', (16, 8), (200, 30, 30)).save(encoded, 'JPEG')
+    jpeg = encoded.getvalue()
+    return jpeg[:2] + b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload + jpeg[2:]
+
+
+def test_caption_is_written_when_piexif_cannot_parse_the_exif(tmp_path):
+    path = tmp_path / 'vendor.jpg'
+    path.write_bytes(_jpeg_with_malformed_exif())
+
+    assert write_caption(str(path), 'Harbour at dusk')
+
+    metadata = read_metadata(str(path))
+    assert metadata.caption == 'Harbour at dusk'
+    assert metadata.orientation == 6
+    assert metadata.date_taken.isoformat() == '2020-05-06T07:08:09'
+    with Image.open(path) as img:
+        img.load()
+        assert img.size == (16, 8)
@@ -0,0 +1,46 @@
+"""Slideshow behaviour that must survive a restart"""
+
+import pygame
+import pytest
+from PIL import Image
+
+import gallery
+
+CONFIG = {'show_temperature': 'false', 'show_weather_code': 'false', 'near_duplicates': 'off'}
+
+
+@pytest.fixture
+def screen():
+    pygame.init()
+    yield pygame.display.set_mode((320, 240))
+    pygame.quit()
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    folder = tmp_path / 'images'
+    folder.mkdir()
+    for i in range(30):
+        Image.new('RGB', (8, 8), (i * 8, 0, 0)).save(folder / f'{i}.jpg')
+    monkeypatch.setattr(gallery, 'POSITION_PATH', str(tmp_path / 'slideshow_position.json'))
+    monkeypatch.setattr(gallery, 'SHOW_STATS_PATH', str(tmp_path / 'show_stats.json'))
+    return str(folder)
+
+
+def test_restart_without_shuffle_seed_resumes_at_saved_image(library, screen):
+    first = gallery.Slideshow(library, screen, 30, dict(CONFIG))
+    for _ in range(7):
+        first.next_image()
+    first.save_position()
+
+    restarted = gallery.Slideshow(library, screen, 30, dict(CONFIG))
+    restarted.next_image()
+
+    assert restarted.shuffle_seed == first.shuffle_seed
+    assert restarted.current_img == first.current_img
+    assert restarted.current_index == first.current_index
+
+
+def test_without_saved_position_a_new_seed_is_drawn(library, screen):
+    seeds = {gallery.Slideshow(library, screen, 30, dict(CONFIG)).shuffle_seed for _ in range(3)}
+    assert len(seeds) == 3
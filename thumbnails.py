@@ -0,0 +1,209 @@
+"""
+Thumbnail cache for piGallery
+JPEG thumbnails and screen-sized variants stored on disk under a key derived from
+the image content, so each size of each photo is decoded and encoded once, not
+on every request.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from media_index import partial_hash_stream
+
+# Requested sizes are rounded up to one of these (longest edge, pixels) so a few
+# files per image serve every client
+THUMBNAIL_SIZES = (200, 400, 800)
+# Screen-sized variants of originals (phone/tablet/desktop screens times their pixel ratio)
+SCREEN_SIZES = (1280, 1920, 2560, 3840)
+# Content keys remembered per (path, size, mtime) so a cached thumbnail costs one stat
+KEY_MEMO_ENTRIES = 4096
+# Default size budget of the cache
+DEFAULT_CACHE_MAX_BYTES = 500 * 1024 * 1024
+# Pruning deletes the least recently used files until the cache is down to this share of its budget
+PRUNE_TARGET = 0.8
+# A cached file's mtime records its last use, updated at most this often (to spare the SD card)
+TOUCH_INTERVAL_SECONDS = 24 * 3600
+
+
+def bucket_size(size, sizes=THUMBNAIL_SIZES):
+    """Return the smallest bucket that is at least size (the largest bucket for bigger sizes)"""
+    for bucket in sizes:
+        if size <= bucket:
+            return bucket
+    return sizes[-1]
+
+
+class ThumbnailCache:
+    """On-disk cache of JPEG thumbnails keyed by image content and bucketed size.
+
+    The key is the media index's partial hash (file size plus its first and
+    last 64 KB), so renamed or copied photos share thumbnails and an edited
+    photo gets new ones. Concurrent requests for a thumbnail that is not
+    cached yet wait for a single generation instead of each decoding the
+    original. Files can be deleted at any time; they are recreated on demand.
+
+    The cache holds at most max_bytes: a file's mtime is its last use, and
+    once generated files take the total over the budget the least recently
+    used ones (thumbnails of deleted or edited photos among them) are
+    deleted in the background. Safe to share between threads."""
+
+    def __init__(self, directory, sizes=THUMBNAIL_SIZES + SCREEN_SIZES, quality=85,
+                 max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.sizes = tuple(sorted(sizes))
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._keys = OrderedDict()
+        # Bytes in the cache (None until a prune has measured it) and whether a prune is running
+        self._total_bytes = None
+        self._pruning = False
+
+    def content_key(self, img_path):
+        """Return the content key of an image file (OSError if it can't be read)"""
+        stat = os.stat(img_path)
+        memo_key = (img_path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            key = self._keys.get(memo_key)
+            if key is not None:
+                self._keys.move_to_end(memo_key)
+                return key
+        with open(img_path, 'rb') as f:
+            key = partial_hash_stream(f, stat.st_size)
+        with self._lock:
+            self._keys[memo_key] = key
+            if len(self._keys) > KEY_MEMO_ENTRIES:
+                self._keys.popitem(last=False)
+        return key
+
+    def path_for(self, key, size):
+        return os.path.join(self.directory, key[:2], f"{key}-{size}.jpg")
+
+    def get(self, img_path, size=THUMBNAIL_SIZES[0]):
+        """Return the path of a cached JPEG thumbnail of img_path, at most size pixels on its
+        longest edge after rounding size up to a bucket; generated on first use"""
+        size = bucket_size(size, self.sizes)
+        target = self.path_for(self.content_key(img_path), size)
+        if self._touch(target):
+            return target
+
+        with self._lock:
+            done = self._in_flight.get(target)
+            leader = done is None
+            if leader:
+                done = self._in_flight[target] = threading.Event()
+        if not leader:
+            # Another request is generating this thumbnail
+            done.wait()
+            if os.path.exists(target):
+                return target
+        try:
+            self._generate(img_path, size, target)
+        finally:
+            if leader:
+                with self._lock:
+                    del self._in_flight[target]
+                done.set()
+        self._added(target)
+        return target
+
+    def _touch(self, path):
+        """Record a use of a cached file; False if it doesn't exist"""
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return False
+        if time.time() - mtime > TOUCH_INTERVAL_SECONDS:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return True
+
+    def _added(self, path):
+        """Count a generated file and start a prune when the cache may be over its budget"""
+        try:
+            added = os.path.getsize(path)
+        except OSError:
+            added = 0
+        with self._lock:
+            if self._total_bytes is not None:
+                self._total_bytes += added
+            start = not self._pruning and (self._total_bytes is None or self._total_bytes > self.max_bytes)
+            if start:
+                self._pruning = True
+        if start:
+            threading.Thread(target=self._prune_in_background, name="thumbnail-prune", daemon=True).start()
+
+    def _prune_in_background(self):
+        try:
+            self.prune()
+        except Exception as e:
+            print(f"[Thumbnails] Pruning the cache failed: {e}")
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def prune(self):
+        """Delete least recently used files until the cache is within its budget (down to
+        PRUNE_TARGET of it when it was over); returns the number of files deleted"""
+        files = []
+        total = 0
+        try:
+            subdirs = [entry.path for entry in os.scandir(self.directory) if entry.is_dir()]
+        except OSError:
+            subdirs = []
+        for subdir in subdirs:
+            try:
+                with os.scandir(subdir) as entries:
+                    for entry in entries:
+                        if entry.name.endswith('.jpg'):
+                            stat = entry.stat()
+                            files.append((stat.st_mtime, stat.st_size, entry.path))
+                            total += stat.st_size
+            except OSError:
+                continue
+        deleted = freed = 0
+        if total > self.max_bytes:
+            files.sort()
+            goal = total - int(self.max_bytes * PRUNE_TARGET)
+            for _, size, path in files:
+                if freed >= goal:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                deleted += 1
+                freed += size
+            print(f"[Thumbnails] Removed {deleted} cached files ({freed / (1024 * 1024):.1f} MB) to stay "
+                  f"under {self.max_bytes / (1024 * 1024):.0f} MB")
+        with self._lock:
+            self._total_bytes = total - freed
+        return deleted
+
+    def _generate(self, img_path, size, target):
+        with Image.open(img_path) as img:
+            # JPEG: let the decoder scale down by up to 8x instead of decoding full resolution
+            img.draft('RGB', (size, size))
+            # The EXIF orientation tag is not copied, so rotate the pixels instead
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            img.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # Written to a temporary name and renamed so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.thumb-', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    img.save(f, format='JPEG', quality=self.quality)
+                os.replace(tmp_path, target)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
@@ -0,0 +1,160 @@
+"""
+Chunked uploads for piGallery
+Photos sent from a phone in chunks are appended to a staging file in the
+upload directory, so a dropped connection resumes after the last chunk received
+instead of starting the file over (see the /api/upload/chunked endpoints).
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+
+# Bytes read from the request at a time while appending a chunk
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+class OffsetMismatch(Exception):
+    """A chunk did not start where the staged file ends; .offset is where the next chunk must start"""
+
+    def __init__(self, offset):
+        super().__init__(f"Expected a chunk starting at byte {offset}")
+        self.offset = offset
+
+
+class ChunkedUploads:
+    """Resumable uploads staged in a directory.
+
+    Each upload has <id>.part (the bytes received so far) and <id>.json (file
+    name, size, caption and the client's key for the file). Both live on disk,
+    so uploads can be resumed after the Pi restarts; the offset to resume at
+    is the size of the .part file. Creating an upload with the key of an
+    unfinished one returns that one. Uploads untouched for expire_seconds are
+    deleted. Chunks of one upload are written one at a time; at most
+    max_parallel chunks (of any uploads) are accepted at once."""
+
+    def __init__(self, directory, max_parallel=3, expire_seconds=24 * 3600):
+        self.directory = directory
+        self.expire_seconds = expire_seconds
+        self._slots = threading.BoundedSemaphore(max_parallel)
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+
+    def _path(self, upload_id, ext):
+        return os.path.join(self.directory, f"{upload_id}{ext}")
+
+    def part_path(self, upload_id):
+        return self._path(upload_id, '.part')
+
+    def create(self, filename, size, caption='', key=None):
+        """Start an upload (or return the unfinished one with the same key); returns its info dict"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire_old()
+        if key:
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    info = self.get(name[:-5])
+                    if info and info.get('key') == key and info['size'] == size:
+                        return info
+        info = {'upload_id': uuid.uuid4().hex, 'filename': filename, 'size': size, 'caption': caption,
+                'key': key, 'created_at': time.time()}
+        open(self.part_path(info['upload_id']), 'wb').close()
+        with open(self._path(info['upload_id'], '.json'), 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        return dict(info, offset=0)
+
+    def get(self, upload_id):
+        """Return the info dict of an upload with its current offset, or None if there is no such upload"""
+        if not upload_id.isalnum():
+            return None
+        try:
+            with open(self._path(upload_id, '.json'), 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            info['offset'] = os.path.getsize(self.part_path(upload_id))
+        except (OSError, ValueError):
+            return None
+        return info
+
+    def try_begin(self):
+        """Reserve one of the parallel chunk slots; False if all are busy. Pair with end()."""
+        return self._slots.acquire(blocking=False)
+
+    def end(self):
+        self._slots.release()
+
+    def write(self, upload_id, offset, stream):
+        """Append the bytes of stream, which must start at offset, to an upload.
+
+        Returns the upload's info with its new offset. Raises KeyError for an
+        unknown upload, OffsetMismatch if offset is not where the staged file
+        ends and ValueError if the data goes past the declared size (nothing
+        of the chunk is kept then). Whatever was written before a dropped
+        connection is kept (waitress only passes on complete request bodies,
+        so there that is whole chunks); the client resumes from the returned
+        or queried offset."""
+        # Checked before a lock is made for it, so bad or stale ids don't leave locks behind
+        if self.get(upload_id) is None:
+            raise KeyError(upload_id)
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(upload_id, threading.Lock())
+        with upload_lock:
+            info = self.get(upload_id)
+            if info is None:
+                # Finished or expired since the check above
+                self._forget_lock(upload_id, upload_lock)
+                raise KeyError(upload_id)
+            if offset != info['offset']:
+                raise OffsetMismatch(info['offset'])
+            remaining = info['size'] - offset
+            with open(self.part_path(upload_id), 'ab') as f:
+                try:
+                    while True:
+                        data = stream.read(min(COPY_BUFFER_SIZE, remaining + 1))
+                        if not data:
+                            break
+                        if len(data) > remaining:
+                            f.truncate(offset)
+                            raise ValueError(f"Chunk goes past the declared size of {info['size']} bytes")
+                        f.write(data)
+                        remaining -= len(data)
+                finally:
+                    f.flush()
+                    os.fsync(f.fileno())
+            info['offset'] = info['size'] - remaining
+            return info
+
+    def discard(self, upload_id):
+        """Forget an upload and delete what was staged (after it was finished or cancelled)"""
+        for ext in ('.part', '.json'):
+            try:
+                os.remove(self._path(upload_id, ext))
+            except OSError:
+                pass
+        self._forget_lock(upload_id)
+
+    def _forget_lock(self, upload_id, upload_lock=None):
+        """Drop the chunk lock of an upload (only if it is still upload_lock, when given)"""
+        with self._lock:
+            if upload_lock is None or self._upload_locks.get(upload_id) is upload_lock:
+                self._upload_locks.pop(upload_id, None)
+
+    def expire_old(self):
+        """Delete uploads nobody has added to for expire_seconds"""
+        cutoff = time.time() - self.expire_seconds
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-5]
+            try:
+                last_write = max(os.path.getmtime(self._path(upload_id, '.json')),
+                                 os.path.getmtime(self.part_path(upload_id)))
+            except OSError:
+                last_write = 0
+            if last_write < cutoff:
+                print(f"[Upload] Discarding unfinished upload {upload_id}")
+                self.discard(upload_id)
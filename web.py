@@ -3,8 +3,11 @@ Web API endpoints for piGallery
 Handles all Flask routes and web interface functionality
 """
 
-from flask import jsonify, request, send_from_directory, send_file
+from flask import Response, jsonify, request, send_from_directory, send_file
 import os
+import base64
+import re
+import hashlib
 import sys
 import subprocess
 import configparser
@@ -13,11 +16,33 @@ import time
 import io
 import datetime
 import json
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
 import pygame
 from PIL import Image
 from PIL.ExifTags import TAGS
 from PIL import IptcImagePlugin
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.formparser import FormDataParser
 from werkzeug.utils import secure_filename
+from assets import ENCODINGS, StaticAssets, compress, negotiate_encoding
+from events import StatusFeed
+from jobs import JobQueue
+from uploads import ChunkedUploads, OffsetMismatch
+from ingest import (IncomingImage, RejectedUpload, UploadTooLarge, check_image, filename_for_format,
+                    move_into, normalize_image, sniff_image_file)
+from sysstats import SystemStatsSampler
+from media_index import LIST_SORT_COLUMNS
+from metadata import read_metadata, write_caption
+from thumbnails import SCREEN_SIZES, THUMBNAIL_SIZES, ThumbnailCache
+
+try:
+    from waitress.server import create_server as create_waitress_server
+    from waitress import wasyncore
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
 
 # These will be set by gallery.py before routes are registered
 app = None
@@ -28,22 +53,341 @@ power_action_cancel_event = None
 CONFIG_PATH = None
 LOG_FILE = None
 logger = None
-
-
-def init_web(app_instance, slideshow_ref, telegram_ref, config_path, log_file, logger_instance):
+thumbnail_cache = None
+status_feed = None
+static_assets = None
+system_stats = None
+upload_jobs = None
+web_server = None
+# Live /api/events streams each hold a worker thread of the production server, so
+# only this many are allowed at once; other pages poll /api/status (None: no limit)
+event_stream_slots = None
+
+# Most caption updates accepted in one /api/uploaded-images/captions request
+MAX_CAPTION_BATCH = 1000
+# Most results returned per /api/search page
+MAX_SEARCH_PAGE_SIZE = 100
+# Most images returned per /api/uploaded-images page
+MAX_UPLOAD_PAGE_SIZE = 500
+
+# Smallest longest edge upload_normalize scales photos down to, whatever the screen size
+MIN_NORMALIZED_EDGE = 1024
+
+# Defaults of upload_max_megabytes and upload_max_megapixels, and room allowed for the
+# rest of an upload request (form fields, multipart headers)
+DEFAULT_UPLOAD_MAX_MEGABYTES = 80
+DEFAULT_UPLOAD_MAX_MEGAPIXELS = 120
+UPLOAD_REQUEST_OVERHEAD = 1024 * 1024
+
+# Chunked uploads: preferred chunk size, chunks accepted at once, and the staging
+# folder inside the upload directory
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_PARALLEL_UPLOAD_CHUNKS = 3
+UPLOAD_STAGING_DIR = '.incoming'
+_chunked_uploads = {}
+_chunked_uploads_lock = threading.Lock()
+
+# Production server: worker threads (web_workers), workers kept free of event streams,
+# seconds before an idle keep-alive or stalled connection is closed, and seconds
+# running requests get to finish on shutdown
+DEFAULT_WEB_WORKERS = 8
+RESERVED_WEB_WORKERS = 2
+WEB_CHANNEL_TIMEOUT = 30
+WEB_SHUTDOWN_TIMEOUT = 5
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# Responses for URLs that name their content (v= version or fingerprinted file name) never change
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# app.3f2a9c81d0.js -> app.js
+FINGERPRINTED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<fingerprint>[0-9a-f]{10})(?P<ext>\.[A-Za-z0-9]+)$')
+# JSON responses at least this large are compressed for clients that accept it
+JSON_COMPRESS_MIN_BYTES = 2048
+# Screen-sized copy of the current image is prepared in the background at the size last
+# asked for with /api/image/full?size=, so opening the viewer doesn't wait for a resize
+_variant_warmer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='variant-warmer')
+_warm_variant = {'size': None, 'image': None}
+
+
+def init_web(app_instance, slideshow_ref, telegram_ref, config_path, log_file, logger_instance, system_stats_ref=None):
     """Initialize web module with references to Flask app and global state"""
-    global app, slideshow_instance, telegram_notifier, CONFIG_PATH, LOG_FILE, logger
+    global app, slideshow_instance, telegram_notifier, CONFIG_PATH, LOG_FILE, logger, thumbnail_cache, status_feed
+    global system_stats, upload_jobs, static_assets
     app = app_instance
     slideshow_instance = slideshow_ref
     telegram_notifier = telegram_ref
     CONFIG_PATH = config_path
     LOG_FILE = log_file
     logger = logger_instance
+    cache_dir = slideshow_ref.config.get('thumbnail_cache_directory', '').strip() if slideshow_ref else ''
+    if cache_dir:
+        cache_dir = os.path.expanduser(cache_dir)
+    else:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(config_path)), 'thumbnail_cache')
+    try:
+        cache_megabytes = float(slideshow_ref.config.get('thumbnail_cache_megabytes', '500')) if slideshow_ref else 500
+    except ValueError:
+        cache_megabytes = 500
+    thumbnail_cache = ThumbnailCache(cache_dir, max_bytes=int(max(10.0, cache_megabytes) * 1024 * 1024))
+    if system_stats_ref is None:
+        system_stats_ref = SystemStatsSampler()
+        system_stats_ref.start()
+    system_stats = system_stats_ref
+    upload_jobs = JobQueue()
+    status_feed = StatusFeed(build_status, collect_system_stats)
+    # Bundled, hashed and precompressed now rather than on the first page load
+    static_assets = StaticAssets(STATIC_DIR)
+    static_assets.build()
+    # Larger requests are refused before they are read
+    app.config['MAX_CONTENT_LENGTH'] = upload_limits()[0] + UPLOAD_REQUEST_OVERHEAD
     register_routes()
 
 
+def upload_limits():
+    """(max_bytes, max_pixels) an uploaded image may have (upload_max_megabytes, upload_max_megapixels)"""
+    config = slideshow_instance.config if slideshow_instance else {}
+    try:
+        megabytes = float(config.get('upload_max_megabytes', DEFAULT_UPLOAD_MAX_MEGABYTES))
+    except ValueError:
+        megabytes = DEFAULT_UPLOAD_MAX_MEGABYTES
+    try:
+        megapixels = float(config.get('upload_max_megapixels', DEFAULT_UPLOAD_MAX_MEGAPIXELS))
+    except ValueError:
+        megapixels = DEFAULT_UPLOAD_MAX_MEGAPIXELS
+    return int(max(1.0, megabytes) * 1024 * 1024), int(max(1.0, megapixels) * 1000 * 1000)
+
+
+def file_version(img_path):
+    """Short token for an image file's path, size and mtime, used as the v= parameter of
+    cacheable image URLs ('' if the file can't be read)"""
+    try:
+        stat = os.stat(img_path)
+    except OSError:
+        return ''
+    token = f"{img_path}\0{stat.st_size}\0{stat.st_mtime_ns}".encode('utf-8', 'surrogateescape')
+    return hashlib.blake2b(token, digest_size=8).hexdigest()
+
+
+def send_image_file(file_path, etag, version_of=None, mimetype=None):
+    """send_file with a strong ETag, Last-Modified and 304 handling.
+
+    If the request's v= parameter is the current file_version of version_of
+    (the original image), the URL names this exact content and the response
+    may be cached for good; otherwise browsers revalidate every time."""
+    response = send_file(file_path, mimetype=mimetype, conditional=True, etag=etag)
+    version = request.args.get('v')
+    if version and version_of and version == file_version(version_of):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
+
+
+def collect_system_stats():
+    """Return memory, CPU, temperature and disk figures for the status display (from the
+    sampler's latest snapshot; never blocks)"""
+    snapshot = system_stats.snapshot()
+    stats = {}
+    for key in ('memory_free_mb', 'cpu_percent', 'cpu_temp', 'disk_used_percent'):
+        if key in snapshot:
+            stats[key] = round(snapshot[key], 1)
+    if 'disk_available' in snapshot:
+        stats['disk_free_gb'] = round(snapshot['disk_available'] / (1024 * 1024 * 1024), 2)
+    return stats
+
+
+def build_status():
+    """Return the slideshow status shown by the web UI (without system stats)"""
+    # Calculate time remaining until next image
+    elapsed = time.time() - slideshow_instance.image_display_start_time
+    # Subtract pause duration if currently paused
+    if slideshow_instance.paused and slideshow_instance.pause_start_time:
+        pause_duration = time.time() - slideshow_instance.pause_start_time
+        elapsed -= pause_duration
+    time_remaining = max(0, slideshow_instance.display_time_seconds - int(elapsed))
+    
+    current_img = slideshow_instance.current_img
+    img_path = slideshow_instance._resolve_image_path(current_img) if current_img else None
+    if img_path:
+        warm_screen_variant(img_path)
+    return {
+        'current_image': current_img,
+        'current_index': slideshow_instance.current_index + 1,
+        'total_images': slideshow_instance.total_images,
+        'temperature': slideshow_instance.current_temp,
+        'weather': slideshow_instance.current_weather,
+        'time': datetime.datetime.now().strftime("%I:%M %p"),
+        'date': datetime.datetime.now().strftime("%d %b %Y"),
+        'paused': slideshow_instance.paused,
+        'display_on': slideshow_instance.is_display_on(),
+        'manual_override': slideshow_instance.manual_display_override,
+        'time_remaining': time_remaining,
+        'delay_seconds': slideshow_instance.display_time_seconds,
+        'favorite': bool(current_img) and slideshow_instance.is_favorite(current_img),
+        # v= for the preview/full image URLs, so browsers can keep them cached
+        'image_version': file_version(img_path) if img_path else ''
+    }
+
+
+def screen_variant_size(img_path, size):
+    """Return the size to ask the thumbnail cache for when a client wants img_path at most size
+    pixels on its longest edge, or None if the original already fits"""
+    metadata = read_metadata(img_path)
+    longest_edge = max(metadata.width or 0, metadata.height or 0) if metadata else 0
+    if longest_edge and longest_edge <= min(size, SCREEN_SIZES[-1]):
+        return None
+    return max(size, SCREEN_SIZES[0])
+
+
+def warm_screen_variant(img_path):
+    """Generate the screen-sized copy of img_path in the background if a client asked for one before"""
+    size = _warm_variant['size']
+    if not size or not img_path or _warm_variant['image'] == img_path:
+        return
+    _warm_variant['image'] = img_path
+
+    def warm():
+        try:
+            variant_size = screen_variant_size(img_path, size)
+            if variant_size:
+                thumbnail_cache.get(img_path, variant_size)
+        except Exception as e:
+            print(f"[Web] Could not prepare screen-sized image for {img_path}: {e}")
+    _variant_warmer.submit(warm)
+
+
+def send_asset(asset, immutable):
+    """Response for a prepared static asset in the encoding the client prefers.
+
+    immutable: the URL names this exact content (hashed name), so browsers
+    may cache it for good; otherwise they revalidate with the ETag."""
+    encoding = negotiate_encoding(request.accept_encodings, tuple(asset.encoded))
+    response = Response(asset.encoded[encoding] if encoding else asset.data, mimetype=asset.mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Each encoding is a different representation with its own ETag
+    response.set_etag(f"{asset.hash}-{encoding}" if encoding else asset.hash)
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 def get_image_caption(img_path):
-    """Read caption from image metadata (EXIF/IPTC/XMP)
+    """Return the caption of an image, or None if it has none.
+
+    A caption in the sidecar store (see caption_storage) wins over the one in
+    the file. Embedded captions are cached in the slideshow's media index
+    keyed by path, size and mtime, so the file is only opened when it changed
+    since the caption was last read (see read_image_caption)"""
+    index = getattr(slideshow_instance, 'media_index', None)
+    index_path = slideshow_instance._relative_image_path(img_path) if index is not None else None
+    if index_path is None:
+        return read_image_caption(img_path)
+    found, caption = index.get_sidecar_caption(index_path)
+    if found:
+        return caption or None
+    try:
+        stat = os.stat(img_path)
+    except OSError:
+        return None
+    found, caption = index.get_caption(index_path, stat.st_size, stat.st_mtime)
+    if not found:
+        caption = read_image_caption(img_path)
+        index.set_captions([(index_path, stat.st_size, stat.st_mtime, caption)])
+    return caption
+
+
+def invalidate_image_caption(img_path):
+    """Drop the cached caption for an image file (called after its caption is written)"""
+    invalidate_image_captions([img_path])
+
+
+def invalidate_image_captions(img_paths):
+    """Drop the cached and sidecar captions for image files whose embedded caption was just written"""
+    index = getattr(slideshow_instance, 'media_index', None)
+    if index is None:
+        return
+    index_paths = [slideshow_instance._relative_image_path(img_path) for img_path in img_paths]
+    index_paths = [path for path in index_paths if path is not None]
+    index.invalidate_captions(index_paths)
+    index.remove_sidecar_captions(index_paths)
+
+
+def caption_storage():
+    """Where caption edits go: 'embedded' (image metadata) or 'sidecar' (the media index database)"""
+    storage = str(slideshow_instance.config.get('caption_storage', 'embedded')).strip().lower()
+    return storage if storage in ('embedded', 'sidecar') else 'embedded'
+
+
+def store_sidecar_captions(rows):
+    """Save (image file path, caption) rows in the sidecar store in one transaction.
+
+    The originals are not touched; with caption_export = true the background
+    scanner writes the captions into the files later. Returns the number of
+    rows stored (files outside the library can't be stored)."""
+    index = getattr(slideshow_instance, 'media_index', None)
+    if index is None:
+        return 0
+    index_rows = [(slideshow_instance._relative_image_path(img_path), caption) for img_path, caption in rows]
+    index_rows = [(path, caption) for path, caption in index_rows if path is not None]
+    index.set_sidecar_captions(index_rows)
+    if index_rows and slideshow_instance.scanner and \
+            slideshow_instance.config.get('caption_export', 'false').lower() == 'true':
+        slideshow_instance.scanner.wake()
+    return len(index_rows)
+
+
+def parse_caption_csv(text):
+    """Parse CSV caption import into [{'path': ..., 'caption': ...}]
+
+    Accepts a header row naming a path (or filename) column and a caption
+    column, or rows of exactly path,caption without a header. Bare filenames
+    are taken to be uploads (uploaded/<filename>)."""
+    rows = [row for row in csv.reader(io.StringIO(text)) if any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if 'caption' in header:
+        path_column = next((header.index(name) for name in ('path', 'filename', 'file') if name in header), None)
+        if path_column is None:
+            raise ValueError("CSV header needs a path or filename column")
+        caption_column = header.index('caption')
+        rows = rows[1:]
+    else:
+        path_column, caption_column = 0, 1
+    items = []
+    for row in rows:
+        path = row[path_column].strip() if path_column < len(row) else ''
+        caption = row[caption_column] if caption_column < len(row) else ''
+        if path and '/' not in path:
+            path = f'uploaded/{path}'
+        items.append({'path': path, 'caption': caption})
+    return items
+
+
+def read_image_caption(img_path):
+    """Read caption from image metadata in one pass over the file (see metadata.read_metadata
+    for the sources and their priority). Returns caption string or None if not found"""
+    try:
+        image_metadata = read_metadata(img_path)
+    except OSError:
+        return None
+    except Exception as e:
+        print(f"[Caption] Could not parse metadata of {img_path}: {e}")
+        image_metadata = None
+    if image_metadata is None:
+        return read_image_caption_pil(img_path)
+    return image_metadata.caption
+
+
+def read_image_caption_pil(img_path):
+    """Read caption from image metadata (EXIF/IPTC) with PIL and piexif
+    Used for files read_metadata can't parse; benchmarks.py compares against it
     Returns caption string or None if not found"""
 
     def sanitize_caption(text):
@@ -248,12 +592,42 @@ def register_routes():
     
     @app.route('/')
     def index():
-        return send_from_directory('static', 'index.html')
+        """Serve index.html linking the bundled stylesheet and hashed scripts (revalidated on every load)"""
+        return send_asset(static_assets.page(), immutable=False)
     
     @app.route('/static/<path:filename>')
     def static_files(filename):
-        """Serve static files"""
-        return send_from_directory('static', filename)
+        """Serve static files; hashed names of prepared assets (see assets.StaticAssets) are
+        precompressed and cached by browsers for good"""
+        asset = static_assets.get(filename)
+        if asset is not None:
+            return send_asset(asset, immutable=True)
+        match = FINGERPRINTED_NAME.match(filename)
+        if match:
+            # Page from an older version; serve the current file but don't cache it
+            plain_name = match.group('stem') + match.group('ext')
+            asset = static_assets.current(plain_name)
+            if asset is not None:
+                return send_asset(asset, immutable=False)
+            return send_from_directory(STATIC_DIR, plain_name)
+        return send_from_directory(STATIC_DIR, filename)
+    
+    @app.after_request
+    def compress_json(response):
+        """gzip (or brotli) JSON responses of JSON_COMPRESS_MIN_BYTES or more for clients that
+        accept it; streamed responses are sent as they are"""
+        if (response.mimetype != 'application/json' or response.direct_passthrough or response.is_streamed
+                or response.status_code in (204, 206, 304) or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < JSON_COMPRESS_MIN_BYTES:
+            return response
+        encoding = negotiate_encoding(request.accept_encodings, ENCODINGS)
+        if encoding:
+            response.set_data(compress(data, encoding, fast=True))
+            response.headers['Content-Encoding'] = encoding
+        return response
     
     @app.route('/api/status')
     def api_status():
@@ -261,57 +635,36 @@ def register_routes():
         if slideshow_instance is None:
             return jsonify({'error': 'Slideshow not initialized'}), 503
         
-        # Get system stats
-        system_stats = {}
-        try:
-            from gallery import get_memory_info, get_cpu_usage, get_cpu_temperature, get_disk_usage
-            memory = get_memory_info()
-            if memory is not None:
-                system_stats['memory_free_mb'] = round(memory, 1)
-            
-            cpu = get_cpu_usage()
-            if cpu is not None:
-                system_stats['cpu_percent'] = round(cpu, 1)
-            
-            temp = get_cpu_temperature()
-            if temp is not None:
-                system_stats['cpu_temp'] = round(temp, 1)
-            
-            disk = get_disk_usage()
-            if disk is not None:
-                system_stats['disk_free_gb'] = round(disk['available'] / (1024 * 1024 * 1024), 2)
-                system_stats['disk_used_percent'] = round(disk['percent_used'], 1)
-        except Exception as e:
-            print(f"[API] Error getting system stats: {e}")
-        
-        # Calculate time remaining until next image
-        elapsed = time.time() - slideshow_instance.image_display_start_time
-        # Subtract pause duration if currently paused
-        if slideshow_instance.paused and slideshow_instance.pause_start_time:
-            pause_duration = time.time() - slideshow_instance.pause_start_time
-            elapsed -= pause_duration
-        time_remaining = max(0, slideshow_instance.display_time_seconds - int(elapsed))
-        
-        response = {
-            'current_image': slideshow_instance.current_img,
-            'current_index': slideshow_instance.current_index + 1,
-            'total_images': slideshow_instance.total_images,
-            'temperature': slideshow_instance.current_temp,
-            'weather': slideshow_instance.current_weather,
-            'time': datetime.datetime.now().strftime("%I:%M %p"),
-            'date': datetime.datetime.now().strftime("%d %b %Y"),
-            'paused': slideshow_instance.paused,
-            'display_on': slideshow_instance.is_display_on(),
-            'manual_override': slideshow_instance.manual_display_override,
-            'time_remaining': time_remaining,
-            'delay_seconds': slideshow_instance.display_time_seconds
-        }
-        
-        if system_stats:
-            response['system'] = system_stats
+        response = build_status()
+        stats = collect_system_stats()
+        if stats:
+            response['system'] = stats
         
         return jsonify(response)
     
+    @app.route('/api/events')
+    def api_events():
+        """Server-Sent Events stream: 'status' when the slideshow state changes, 'stats' periodically"""
+        if slideshow_instance is None:
+            return jsonify({'error': 'Slideshow not initialized'}), 503
+        slots = event_stream_slots
+        if slots is not None and not slots.acquire(blocking=False):
+            # The page falls back to polling /api/status
+            return jsonify({'error': 'Too many live status streams'}), 503
+        
+        def stream():
+            try:
+                yield from status_feed.events()
+            finally:
+                if slots is not None:
+                    slots.release()
+        
+        response = Response(stream(), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Ask nginx & co. not to buffer the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+    
     @app.route('/api/logs')
     def api_logs():
         """Get application logs"""
@@ -395,210 +748,56 @@ def register_routes():
         return img_path if os.path.exists(img_path) else None
     
     def set_image_caption(img_path, caption):
+        """Store caption in the sidecar store (caption_storage = sidecar) or write it to image
+        metadata and invalidate the cached caption for the file"""
+        if caption_storage() == 'sidecar' and store_sidecar_captions([(img_path, caption)]):
+            return True
+        try:
+            return write_image_caption(img_path, caption)
+        finally:
+            invalidate_image_caption(img_path)
+    
+    def write_image_caption(img_path, caption):
         """Write caption to image metadata (EXIF for JPEG, text chunks for PNG)
         Returns True if successful, False otherwise
         
-        JPEG files: Uses piexif library for EXIF UserComment
-        PNG files: Uses PIL's text chunk support (tEXt)
+        JPEG and PNG files: only the EXIF segment / text chunks are replaced, the image data
+        is copied unchanged (see metadata.write_caption)
         Other formats: Attempts PIL's info dict"""
         try:
-            from PIL import Image
-            from PIL.ExifTags import TAGS
-            import tempfile
-            import shutil
-            
             if not os.path.exists(img_path):
                 return False
             
-            # Open image to determine format
-            img = Image.open(img_path)
-            img_format = img.format or 'JPEG'
-            
-            # Handle PNG files using text chunks
-            if img_format == 'PNG':
-                try:
-                    from PIL import PngImagePlugin
-                    
-                    # PNG supports text chunks (tEXt, zTXt, iTXt)
-                    # Use PngInfo for proper PNG metadata support
-                    pnginfo = PngImagePlugin.PngInfo()
-                    
-                    # Copy existing text chunks from original image (except Comment if we're updating it)
-                    if img.info:
-                        for key, value in img.info.items():
-                            # Skip Comment if we're setting a new caption
-                            if key == 'Comment' and caption:
-                                continue
-                            # Only copy text values (PNG text chunks are strings)
-                            if isinstance(value, str):
-                                pnginfo.add_text(key, value)
-                    
-                    # Store caption in PNG text chunk
-                    # Try multiple keys for maximum compatibility
-                    # "Comment" is the standard PNG text chunk key
-                    # Windows Explorer may or may not display this depending on version
-                    if caption:
-                        pnginfo.add_text("Comment", caption)
-                        # Also add as Description for compatibility
-                        pnginfo.add_text("Description", caption)
-                    # If caption is empty and Comment existed, it will be omitted (removed)
-                    
-                    # Ensure image is fully loaded (convert to RGB/RGBA if needed for saving)
-                    img.load()  # Ensure image is loaded
-                    
-                    # Convert palette images to RGB for better compatibility
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    elif img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
-                        # Convert unsupported modes to RGB
-                        if img.mode in ('1', 'I', 'F'):
-                            img = img.convert('RGB')
-                    
-                    # Save with PngInfo (this properly writes text chunks)
-                    # Note: We need to preserve other PNG settings like compression
-                    save_kwargs = {'format': 'PNG', 'pnginfo': pnginfo}
-                    if 'compress_level' in (img.info or {}):
-                        save_kwargs['compress_level'] = img.info.get('compress_level', 6)
-                    
-                    # Save to a temporary file first, then move it (safer)
-                    import tempfile
-                    import shutil
-                    temp_fd, temp_path = tempfile.mkstemp(suffix='.png', dir=os.path.dirname(img_path) or '.')
-                    try:
-                        os.close(temp_fd)
-                        img.save(temp_path, **save_kwargs)
-                        img.close()
-                        
-                        # Replace original file
-                        shutil.move(temp_path, img_path)
-                        
-                        # Verify the caption was written
-                        verify_img = Image.open(img_path)
-                        written_caption = verify_img.info.get('Comment', '')
-                        written_description = verify_img.info.get('Description', '')
-                        has_comment = 'Comment' in verify_img.info
-                        has_description = 'Description' in verify_img.info
-                        all_text_keys = [k for k, v in verify_img.info.items() if isinstance(v, str)]
-                        verify_img.close()
-                        
-                        if caption:
-                            if written_caption == caption or written_description == caption:
-                                print(f"[Caption] Successfully wrote caption to PNG")
-                                print(f"[Caption] Text chunks in file: {all_text_keys}")
-                                print(f"[Caption] Comment value: '{written_caption}'")
-                                print(f"[Caption] Description value: '{written_description}'")
-                                print(f"[Caption] Note: Windows Explorer may not display PNG text chunks in Properties.")
-                                print(f"[Caption] The comment is embedded in the file and can be read by image viewers.")
-                                return True
-                            else:
-                                print(f"[Caption] Warning: Caption may not have been written correctly.")
-                                print(f"[Caption] Expected: '{caption}'")
-                                print(f"[Caption] Got Comment: '{written_caption}', Description: '{written_description}'")
-                                return False
-                        else:
-                            # Caption removed
-                            if not has_comment and not has_description:
-                                print(f"[Caption] Successfully removed caption from PNG")
-                                return True
-                            else:
-                                print(f"[Caption] Warning: Caption may not have been fully removed")
-                                return False
-                    except Exception as e:
-                        # Clean up temp file on error
-                        try:
-                            if os.path.exists(temp_path):
-                                os.remove(temp_path)
-                        except:
-                            pass
-                        raise e
-                except Exception as e:
-                    print(f"[Caption] Error writing PNG text chunk: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    try:
-                        img.close()
-                    except:
-                        pass
-                    return False
-            
-            # Handle JPEG files using EXIF (piexif)
-            elif img_format in ('JPEG', 'JPG'):
-                try:
-                    import piexif
-                    
-                    # Read current EXIF data (or create new if none exists)
-                    try:
-                        with open(img_path, 'rb') as f:
-                            exif_dict = piexif.load(f.read())
-                    except Exception:
-                        # No existing EXIF, create new dict
-                        exif_dict = {'0th': {}, 'Exif': {}, 'GPS': {}, '1st': {}, 'thumbnail': None}
-                    
-                    # Set UserComment (tag 37510 in Exif IFD) - this is the "Comments" field in image viewers
-                    # UserComment format: 8-byte encoding identifier + text bytes
-                    if 'Exif' not in exif_dict:
-                        exif_dict['Exif'] = {}
-                    
-                    if caption:
-                        # Use ASCII encoding prefix for better compatibility
-                        # Format: "ASCII\0\0\0" (8 bytes) + text bytes
-                        caption_bytes = caption.encode('utf-8')
-                        user_comment = b'ASCII\x00\x00\x00' + caption_bytes
-                    else:
-                        user_comment = b'ASCII\x00\x00\x00'
-                    
-                    exif_dict['Exif'][piexif.ExifIFD.UserComment] = user_comment
-                    
-                    # Convert EXIF dict to bytes
-                    exif_bytes = piexif.dump(exif_dict)
-                    
-                    # Read original image data
-                    with open(img_path, 'rb') as f:
-                        img_data = f.read()
-                    
-                    # Create temporary file for output
-                    temp_fd, temp_path = tempfile.mkstemp(suffix='.jpg')
-                    try:
-                        os.close(temp_fd)
-                        
-                        # Insert EXIF into image and write to temp file
-                        piexif.insert(exif_bytes, img_data, temp_path)
-                        
-                        # Replace original file with updated one
-                        shutil.move(temp_path, img_path)
-                        return True
-                    except Exception as e:
-                        # Clean up temp file on error
-                        try:
-                            if os.path.exists(temp_path):
-                                os.remove(temp_path)
-                        except:
-                            pass
-                        raise e
-                except ImportError:
-                    print("[Caption] piexif not available for JPEG. Install with: pip install piexif")
-                    return False
-                except Exception as e:
-                    print(f"[Caption] Error using piexif for JPEG: {e}")
-                    return False
+            try:
+                if write_caption(img_path, caption):
+                    print(f"[Caption] {'Wrote' if caption else 'Removed'} caption in {os.path.basename(img_path)}")
+                    return True
+            except ImportError:
+                print("[Caption] piexif not available for JPEG. Install with: pip install piexif")
+                return False
+            except Exception as e:
+                print(f"[Caption] Error writing caption to {img_path}: {e}")
+                return False
             
             # Handle other formats (TIFF, etc.) - try PIL's info dict
-            else:
-                try:
-                    # For other formats, try to save in info dict
-                    info = img.info.copy() if img.info else {}
-                    if caption:
-                        info['caption'] = caption
-                    else:
-                        if 'caption' in info:
-                            del info['caption']
-                    
-                    # Save with updated info
-                    img.save(img_path, format=img_format, **info)
-                    return True
-                except Exception as e:
-                    print(f"[Caption] Error writing caption for {img_format}: {e}")
-                    return False
+            from PIL import Image
+            img = Image.open(img_path)
+            img_format = img.format
+            try:
+                # For other formats, try to save in info dict
+                info = img.info.copy() if img.info else {}
+                if caption:
+                    info['caption'] = caption
+                else:
+                    if 'caption' in info:
+                        del info['caption']
+                
+                # Save with updated info
+                img.save(img_path, format=img_format, **info)
+                return True
+            except Exception as e:
+                print(f"[Caption] Error writing caption for {img_format}: {e}")
+                return False
                 
         except Exception as e:
             print(f"[Caption] Error setting caption for {img_path}: {e}")
@@ -606,7 +805,7 @@ def register_routes():
     
     @app.route('/api/image/preview')
     def api_image_preview():
-        """Get image as thumbnail preview (current image or specified path)"""
+        """Get image as thumbnail preview (current image or specified path; optional size, default 200)"""
         if slideshow_instance is None:
             return jsonify({'error': 'Slideshow not initialized'}), 503
 
@@ -614,9 +813,7 @@ def register_routes():
         requested_path = request.args.get('path')
 
         try:
-            from PIL import Image
             from flask import send_file
-            import io
 
             if requested_path:
                 # Handle specific path request (for uploaded images modal)
@@ -649,16 +846,15 @@ def register_routes():
                 if not img_path:
                     return jsonify({'error': 'Image file not found'}), 404
 
-            # Create thumbnail (max 200x200 for modal, maintains aspect ratio)
-            img = Image.open(img_path)
-            img.thumbnail((200, 200), Image.Resampling.LANCZOS)
-
-            # Convert to bytes
-            img_bytes = io.BytesIO()
-            img.save(img_bytes, format='JPEG', quality=85)
-            img_bytes.seek(0)
-
-            return send_file(img_bytes, mimetype='image/jpeg')
+            try:
+                size = min(int(request.args.get('size', THUMBNAIL_SIZES[0])), THUMBNAIL_SIZES[-1])
+            except ValueError:
+                size = THUMBNAIL_SIZES[0]
+            # Generated once per image content and size bucket, then served from disk;
+            # the cache file name (<content key>-<size>) is a strong ETag
+            thumbnail_path = thumbnail_cache.get(img_path, size)
+            etag = os.path.splitext(os.path.basename(thumbnail_path))[0]
+            return send_image_file(thumbnail_path, etag, version_of=img_path, mimetype='image/jpeg')
 
         except ImportError:
             # Fallback: serve original image if PIL not available
@@ -693,7 +889,8 @@ def register_routes():
     
     @app.route('/api/image/full')
     def api_image_full():
-        """Get current image at full resolution"""
+        """Get current image at full resolution, or with size=<pixels> (the client's longest screen
+        edge times its pixel ratio) a cached JPEG no larger than needed. Supports Range requests"""
         if slideshow_instance is None:
             return jsonify({'error': 'Slideshow not initialized'}), 503
         
@@ -705,14 +902,19 @@ def register_routes():
             if not img_path:
                 return jsonify({'error': 'Image file not found'}), 404
             
-            if slideshow_instance.current_img.startswith("uploaded/"):
-                upload_dir = slideshow_instance.config.get('upload_directory', '').strip()
-                if upload_dir:
-                    upload_dir = os.path.expanduser(upload_dir)
-                    actual_path = slideshow_instance.current_img.replace("uploaded/", "", 1).replace("uploaded\\", "", 1)
-                    return send_from_directory(upload_dir, actual_path)
-            else:
-                return send_from_directory(slideshow_instance.folder, slideshow_instance.current_img)
+            size = request.args.get('size', type=int)
+            if size and size > 0:
+                _warm_variant['size'] = size
+                variant_size = screen_variant_size(img_path, size)
+                # Originals that already fit the screen are sent as they are
+                if variant_size:
+                    variant_path = thumbnail_cache.get(img_path, variant_size)
+                    etag = os.path.splitext(os.path.basename(variant_path))[0]
+                    return send_image_file(variant_path, etag, version_of=img_path, mimetype='image/jpeg')
+            # The original is passed by path so the WSGI server can use sendfile (wsgi.file_wrapper).
+            # Its ETag comes from size and mtime: a sampled content key would miss an edit that
+            # keeps the size and leaves the first and last blocks alone
+            return send_image_file(img_path, file_version(img_path), version_of=img_path)
         except Exception as e:
             print(f"[Web] Error serving full image: {e}")
             return jsonify({'error': str(e)}), 500
@@ -775,6 +977,25 @@ def register_routes():
             print(f"[Web] Error setting caption: {e}")
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/api/image/favorite', methods=['POST'])
+    def api_set_favorite():
+        """Mark or unmark the current image as a favorite (boosted in weighted order)"""
+        if slideshow_instance is None:
+            return jsonify({'error': 'Slideshow not initialized'}), 503
+        
+        if not slideshow_instance.current_img:
+            return jsonify({'error': 'No image loaded'}), 404
+        
+        data = request.get_json(silent=True) or {}
+        current_img = slideshow_instance.current_img
+        # Toggle when no explicit value is given
+        favorite = data.get('favorite', not slideshow_instance.is_favorite(current_img))
+        favorite = str(favorite).lower() in ('1', 'true', 'yes', 'on')
+        slideshow_instance.set_favorite(current_img, favorite)
+        print(f"[Web] {'Added' if favorite else 'Removed'} favorite: {current_img}")
+        status_feed.poke()
+        return jsonify({'status': 'ok', 'image': current_img, 'favorite': favorite})
+    
     @app.route('/api/next', methods=['POST'])
     def api_next():
         """Go to next image"""
@@ -786,6 +1007,7 @@ def register_routes():
             slideshow_instance.force_redraw = True  # Force immediate redraw
             slideshow_instance.image_display_start_time = time.time()  # Reset countdown
         
+        status_feed.poke()
         return jsonify({'status': 'ok', 'current_image': slideshow_instance.current_img})
     
     @app.route('/api/prev', methods=['POST'])
@@ -799,8 +1021,64 @@ def register_routes():
             slideshow_instance.force_redraw = True  # Force immediate redraw
             slideshow_instance.image_display_start_time = time.time()  # Reset countdown
         
+        status_feed.poke()
         return jsonify({'status': 'ok', 'current_image': slideshow_instance.current_img})
     
+    @app.route('/api/search', methods=['GET'])
+    def api_search():
+        """Full-text search over file names, folder names and captions (ranked, paginated)"""
+        if slideshow_instance is None:
+            return jsonify({'error': 'Slideshow not initialized'}), 503
+
+        index = slideshow_instance.media_index
+        if not index.search_available:
+            return jsonify({'error': 'Search needs SQLite with FTS5'}), 501
+
+        query = request.args.get('q', '').strip()
+        try:
+            page = max(1, int(request.args.get('page', 1)))
+            per_page = min(MAX_SEARCH_PAGE_SIZE, max(1, int(request.args.get('per_page', 24))))
+        except ValueError:
+            return jsonify({'error': 'page and per_page must be integers'}), 400
+
+        total, rows = index.search(query, limit=per_page, offset=(page - 1) * per_page)
+        results = []
+        for path, caption in rows:
+            folder, _, filename = path.rpartition('/')
+            results.append({
+                'path': path,
+                'filename': filename,
+                'folder': folder,
+                'caption': caption or '',
+                'thumbnail_url': '/api/image/preview?path={}&v={}'.format(
+                    quote(path), file_version(slideshow_instance._resolve_image_path(path))),
+            })
+        return jsonify({'status': 'ok', 'query': query, 'page': page, 'per_page': per_page, 'total': total,
+                        'has_more': page * per_page < total, 'results': results})
+
+    @app.route('/api/show', methods=['POST'])
+    def api_show():
+        """Show a given image now (e.g. a search result); the slideshow continues from there"""
+        if slideshow_instance is None:
+            return jsonify({'error': 'Slideshow not initialized'}), 503
+
+        data = request.get_json(silent=True) or {}
+        img_path = data.get('path')
+        if not isinstance(img_path, str) or not img_path:
+            return jsonify({'error': 'path required'}), 400
+        # Security: only relative paths inside the library
+        if os.path.isabs(img_path) or '..' in img_path.replace('\\', '/').split('/'):
+            return jsonify({'error': 'Invalid path'}), 400
+
+        with slideshow_instance.control_lock:
+            if not slideshow_instance.show_image(img_path):
+                return jsonify({'error': 'Image not found'}), 404
+            slideshow_instance.force_redraw = True  # Force immediate redraw
+            slideshow_instance.image_display_start_time = time.time()  # Reset countdown
+
+        status_feed.poke()
+        return jsonify({'status': 'ok', 'current_image': slideshow_instance.current_img})
+
     @app.route('/api/pause', methods=['POST'])
     def api_pause():
         """Toggle pause state"""
@@ -815,6 +1093,7 @@ def register_routes():
         status = 'paused' if slideshow_instance.paused else 'playing'
         print(f"[Web] Slideshow {status}")
         
+        status_feed.poke()
         return jsonify({'status': 'ok', 'paused': slideshow_instance.paused})
     
     @app.route('/api/display', methods=['POST'])
@@ -839,6 +1118,7 @@ def register_routes():
         slideshow_instance.force_redraw = True
         
         print(f"[Web] Display set to: {action}")
+        status_feed.poke()
         return jsonify({'status': 'ok', 'action': action})
     
     @app.route('/api/system/shutdown', methods=['POST'])
@@ -1047,97 +1327,333 @@ def register_routes():
     
     @app.route('/api/upload', methods=['POST'])
     def api_upload():
-        """Upload new image to separate upload directory"""
+        """Upload new image to separate upload directory.
+
+        The web server has the whole request body by the time this runs
+        (waitress buffers it and refuses bodies over the upload limit with 413,
+        see WebServer). The file part is then copied into a temporary file in
+        the upload directory and checked as it is copied (see
+        ingest.IncomingImage): non-images, files over upload_max_megabytes and
+        images over upload_max_megapixels are refused (400/413) after their
+        header, without copying or decoding the rest."""
         if slideshow_instance is None:
             return jsonify({'error': 'Slideshow not initialized'}), 503
         
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
+        upload_dir, error = prepare_upload_directory()
+        if error:
+            return error
         
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+        max_bytes, max_pixels = upload_limits()
+        incoming = []
         
-        if not file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-            return jsonify({'error': 'Invalid file type. Only JPG and PNG allowed'}), 400
-        
-        filename = secure_filename(file.filename)
+        def stream_factory(total_content_length, content_type, filename, content_length=None):
+            if not (filename or '').lower().endswith(('.jpg', '.jpeg', '.png')):
+                raise RejectedUpload('Invalid file type. Only JPG and PNG allowed')
+            incoming.append(IncomingImage(upload_dir, max_bytes, max_pixels))
+            return incoming[-1]
         
-        # Determine upload directory
-        upload_dir = slideshow_instance.config.get('upload_directory', '').strip()
-        if not upload_dir:
-            # Default: create 'uploaded' subdirectory in images directory
-            upload_dir = os.path.join(slideshow_instance.folder, 'uploaded')
-        else:
-            # Use configured upload directory
-            upload_dir = os.path.expanduser(upload_dir)  # Support ~ for home directory
+        parser = FormDataParser(stream_factory=stream_factory, max_form_memory_size=request.max_form_memory_size,
+                                max_form_parts=request.max_form_parts, silent=False)
+        try:
+            try:
+                _, form, files = parser.parse(request.stream, request.mimetype, request.content_length,
+                                              request.mimetype_params)
+            except RejectedUpload as e:
+                return rejected_upload_response(e, 'upload')
+            except RequestEntityTooLarge:
+                return rejected_upload_response(UploadTooLarge('Upload is too large'), 'upload')
+            except ValueError as e:
+                return jsonify({'error': f'Malformed upload request: {e}'}), 400
+            except OSError as e:
+                return jsonify({'error': f'Upload directory is not writable: {e}'}), 500
+            
+            file = files.get('file')
+            if file is None:
+                return jsonify({'error': 'No file provided'}), 400
+            if file.filename == '':
+                return jsonify({'error': 'No file selected'}), 400
+            filename = secure_filename(file.filename)
+            
+            # Don't store a second copy of a photo that is already in the library
+            duplicate = duplicate_upload_response(file.stream, filename)
+            if duplicate:
+                return duplicate
+            
+            try:
+                filepath = file.stream.keep(upload_dir, filename)
+            except RejectedUpload as e:
+                return rejected_upload_response(e, filename)
+            except OSError as e:
+                error_msg = f'Failed to save file: {e}'
+                if telegram_notifier:
+                    telegram_notifier.notify_error(error_msg, f"Upload: {filename}")
+                return jsonify({'error': error_msg}), 500
+            filename = os.path.basename(filepath)
+            print(f"[Web] Uploaded new image: {filename} to {upload_dir}")
+            return queue_upload(upload_dir, filepath, filename, form.get('caption', '').strip())
+        finally:
+            # Whatever wasn't kept (other file fields, refused uploads)
+            for image in incoming:
+                if os.path.exists(image.path):
+                    image.discard()
+    
+    def rejected_upload_response(error, filename):
+        """400 response for an upload that is not an acceptable image (413 if it is too large)"""
+        print(f"[Web] Refused upload {filename}: {error}")
+        return jsonify({'error': str(error)}), 413 if isinstance(error, UploadTooLarge) else 400
+    
+    def prepare_upload_directory():
+        """Create the upload directory if needed; returns (upload_dir, None) or (None, error response)"""
+        upload_dir = get_upload_directory()
         
         # Create upload directory if it doesn't exist
         try:
             os.makedirs(upload_dir, exist_ok=True)
             # Verify directory was actually created
             if not os.path.exists(upload_dir):
-                return jsonify({'error': f'Failed to create upload directory: {upload_dir}'}), 500
+                return None, (jsonify({'error': f'Failed to create upload directory: {upload_dir}'}), 500)
             if not os.path.isdir(upload_dir):
-                return jsonify({'error': f'Upload path exists but is not a directory: {upload_dir}'}), 500
+                return None, (jsonify({'error': f'Upload path exists but is not a directory: {upload_dir}'}), 500)
             print(f"[Web] Upload directory: {upload_dir}")
         except PermissionError as e:
-            return jsonify({'error': f'Permission denied creating upload directory: {e}'}), 500
+            return None, (jsonify({'error': f'Permission denied creating upload directory: {e}'}), 500)
         except Exception as e:
-            return jsonify({'error': f'Failed to create upload directory: {e}'}), 500
-        
-        # Verify directory is writable
+            return None, (jsonify({'error': f'Failed to create upload directory: {e}'}), 500)
+        # Whether it is writable shows when the upload's temporary file is created
+        return upload_dir, None
+    
+    def duplicate_upload_response(stream, filename):
+        """Response for an upload that is already in the library (deduplicate = true), or None"""
+        if slideshow_instance.config.get('deduplicate', 'true').lower() != 'true':
+            return None
         try:
-            test_file = os.path.join(upload_dir, '.write_test')
-            with open(test_file, 'w') as f:
-                f.write('test')
-            os.remove(test_file)
+            existing = slideshow_instance.media_index.find_duplicate_of(stream, slideshow_instance._resolve_image_path)
         except Exception as e:
-            return jsonify({'error': f'Upload directory is not writable: {e}'}), 500
-        
-        # Save file to upload directory
-        filepath = os.path.join(upload_dir, filename)
-        
-        # Handle filename conflicts (add number if exists)
-        base_name, ext = os.path.splitext(filename)
-        counter = 1
-        while os.path.exists(filepath):
-            filename = f"{base_name}_{counter}{ext}"
-            filepath = os.path.join(upload_dir, filename)
-            counter += 1
-        
+            print(f"[Web] Duplicate check failed for {filename}: {e}")
+            existing = None
+        if not existing:
+            return None
+        print(f"[Web] Upload {filename} is a duplicate of {existing}, not saved")
+        return jsonify({'status': 'duplicate', 'filename': filename, 'existing': existing,
+                        'message': f'Already in library as {existing}'})
+    
+    def queue_upload(upload_dir, filepath, filename, caption):
+        """Hand a saved upload to the background job queue and return the 202 response"""
+        # Caption, thumbnails and adding to the slideshow happen in the background
+        job = upload_jobs.submit('upload', process_upload, filepath, filename, caption)
+        return jsonify({'status': 'ok', 'filename': filename, 'upload_dir': upload_dir, 'caption_added': bool(caption),
+                        'job_id': job.id, 'job_url': f'/api/jobs/{job.id}'}), 202
+    
+    def get_chunked_uploads(upload_dir):
+        """The ChunkedUploads staging area of an upload directory (same filesystem, so finished
+        files are moved into place with a rename)"""
+        staging = os.path.join(upload_dir, UPLOAD_STAGING_DIR)
+        with _chunked_uploads_lock:
+            uploads = _chunked_uploads.get(staging)
+            if uploads is None:
+                uploads = _chunked_uploads[staging] = ChunkedUploads(staging, max_parallel=MAX_PARALLEL_UPLOAD_CHUNKS)
+        return uploads
+    
+    def chunked_upload_info(info):
+        return {'upload_id': info['upload_id'], 'filename': info['filename'], 'size': info['size'],
+                'offset': info['offset'], 'chunk_size': UPLOAD_CHUNK_SIZE, 'max_parallel': MAX_PARALLEL_UPLOAD_CHUNKS}
+    
+    @app.route('/api/upload/chunked', methods=['POST'])
+    def api_upload_chunked_start():
+        """Start a resumable upload.
+
+        Body: JSON {"filename", "size" (bytes), "caption" (optional), "key"
+        (optional; the same key and size resume the unfinished upload of that
+        file, e.g. name/size/modification time)}. Returns upload_id, the offset
+        to continue from, and the chunk_size and max_parallel the server
+        prefers. Chunks are then sent with PUT /api/upload/chunked/<id>."""
+        if slideshow_instance is None:
+            return jsonify({'error': 'Slideshow not initialized'}), 503
+        data = request.get_json(silent=True) or {}
+        filename = str(data.get('filename') or '')
+        if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+            return jsonify({'error': 'Invalid file type. Only JPG and PNG allowed'}), 400
+        filename = secure_filename(filename)
+        size = data.get('size')
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            return jsonify({'error': 'size must be a positive number of bytes'}), 400
+        max_bytes = upload_limits()[0]
+        if size > max_bytes:
+            return rejected_upload_response(UploadTooLarge(f"File is larger than {max_bytes // (1024 * 1024)} MB"),
+                                            filename)
+        key = data.get('key')
+        upload_dir, error = prepare_upload_directory()
+        if error:
+            return error
         try:
-            file.save(filepath)
-            print(f"[Web] Uploaded new image: {filename} to {upload_dir}")
-        except Exception as e:
-            error_msg = f'Failed to save file: {e}'
-            if telegram_notifier:
-                telegram_notifier.notify_error(error_msg, f"Upload: {filename}")
-            return jsonify({'error': error_msg}), 500
-        
-        # If caption provided, save it to image metadata
-        caption = request.form.get('caption', '').strip()
+            info = get_chunked_uploads(upload_dir).create(
+                filename, size, str(data.get('caption') or '').strip(), str(key) if key else None)
+        except OSError as e:
+            return jsonify({'error': f'Could not start upload: {e}'}), 500
+        return jsonify(chunked_upload_info(info)), 200 if info['offset'] else 201
+    
+    @app.route('/api/upload/chunked/<upload_id>', methods=['GET'])
+    def api_upload_chunked_status(upload_id):
+        """Offset a resumable upload continues from"""
+        if slideshow_instance is None:
+            return jsonify({'error': 'Slideshow not initialized'}), 503
+        info = get_chunked_uploads(get_upload_directory()).get(upload_id)
+        if info is None:
+            return jsonify({'error': 'Unknown upload'}), 404
+        return jsonify(chunked_upload_info(info))
+    
+    @app.route('/api/upload/chunked/<upload_id>', methods=['PUT'])
+    def api_upload_chunked_put(upload_id):
+        """Append one chunk (the raw request body) starting at byte ?offset= of a resumable upload.
+
+        Answers 409 with the expected offset if the chunk doesn't start there
+        and 429 while the server is busy with other chunks. The file's header
+        is checked as soon as it has arrived, so a non-image or an image over
+        upload_max_megapixels is refused (400/413, the upload is deleted)
+        after its first chunk. The chunk that completes the file returns the
+        same response as /api/upload."""
+        if slideshow_instance is None:
+            return jsonify({'error': 'Slideshow not initialized'}), 503
+        try:
+            offset = int(request.args.get('offset', ''))
+        except ValueError:
+            return jsonify({'error': 'offset must be an integer'}), 400
+        upload_dir = get_upload_directory()
+        uploads = get_chunked_uploads(upload_dir)
+        if not uploads.try_begin():
+            response = jsonify({'error': 'Too many chunks in progress, try again'})
+            response.headers['Retry-After'] = '1'
+            return response, 429
+        try:
+            info = uploads.write(upload_id, offset, request.stream)
+        except KeyError:
+            return jsonify({'error': 'Unknown upload'}), 404
+        except OffsetMismatch as e:
+            return jsonify({'error': str(e), 'offset': e.offset}), 409
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except OSError as e:
+            return jsonify({'error': f'Could not save chunk: {e}'}), 500
+        finally:
+            uploads.end()
+        part_path = uploads.part_path(upload_id)
+        filename = info['filename']
+        max_bytes, max_pixels = upload_limits()
+        try:
+            if info['offset'] < info['size']:
+                # Reads no further than the header, which is usually in the first chunk
+                sniff_image_file(part_path, max_bytes, max_pixels)
+                return jsonify(chunked_upload_info(info))
+            # Last chunk: the staged file becomes the upload
+            image_format = check_image(part_path, max_bytes, max_pixels)
+        except RejectedUpload as e:
+            uploads.discard(upload_id)
+            return rejected_upload_response(e, filename)
+        with open(part_path, 'rb') as f:
+            duplicate = duplicate_upload_response(f, filename)
+        if duplicate:
+            uploads.discard(upload_id)
+            return duplicate
+        try:
+            filepath = move_into(part_path, upload_dir, filename_for_format(filename, image_format))
+        except OSError as e:
+            return jsonify({'error': f'Failed to save file: {e}'}), 500
+        filename = os.path.basename(filepath)
+        uploads.discard(upload_id)
+        print(f"[Web] Uploaded new image: {filename} to {upload_dir} ({info['size']} bytes in chunks)")
+        return queue_upload(upload_dir, filepath, filename, info.get('caption', ''))
+    
+    @app.route('/api/upload/chunked/<upload_id>', methods=['DELETE'])
+    def api_upload_chunked_cancel(upload_id):
+        """Cancel a resumable upload and delete what was received"""
+        if slideshow_instance is None:
+            return jsonify({'error': 'Slideshow not initialized'}), 503
+        uploads = get_chunked_uploads(get_upload_directory())
+        if uploads.get(upload_id) is None:
+            return jsonify({'error': 'Unknown upload'}), 404
+        uploads.discard(upload_id)
+        return jsonify({'status': 'ok'})
+    
+    def process_upload(job, filepath, filename, caption):
+        """Upload job: normalize the file (upload_normalize), write the caption, cache metadata and
+        thumbnails, then add the photo to the slideshow"""
+        steps = ['metadata', 'thumbnails', 'playlist']
         if caption:
-            try:
-                success = set_image_caption(filepath, caption)
-                if success:
+            steps.insert(0, 'caption')
+        if slideshow_instance.config.get('upload_normalize', 'false').lower() == 'true':
+            steps.insert(0, 'normalize')
+        result = {'filename': filename, 'caption_added': False}
+        for number, step in enumerate(steps):
+            job.update(step, number / len(steps))
+            if step == 'normalize':
+                # Keep the upload as it is if it can't be normalized
+                try:
+                    filepath = normalize_upload(filepath)
+                    filename = result['filename'] = os.path.basename(filepath)
+                except Exception as e:
+                    print(f"[Web] Could not normalize {filename}: {e}")
+            elif step == 'caption':
+                # Don't fail the upload if caption saving fails
+                try:
+                    result['caption_added'] = bool(set_image_caption(filepath, caption))
+                except Exception as e:
+                    print(f"[Web] Error saving caption to {filename}: {e}")
+                if result['caption_added']:
                     print(f"[Web] Added caption to uploaded image: {filename}")
                 else:
                     print(f"[Web] Warning: Failed to save caption to {filename}")
-            except Exception as e:
-                print(f"[Web] Error saving caption to {filename}: {e}")
-                # Don't fail the upload if caption saving fails
-        
-        # Refresh images to include the new upload (refresh_images scans recursively)
-        slideshow_instance.refresh_images()
-        slideshow_instance.rebuild_navigation_preserve_current()
-        slideshow_instance.force_redraw = True
+            elif step == 'metadata':
+                # Fills the caption cache so the uploads list doesn't open the file
+                get_image_caption(filepath)
+            elif step == 'thumbnails':
+                try:
+                    thumbnail_cache.get(filepath, THUMBNAIL_SIZES[0])
+                    # The web viewer's screen-sized copy, if a client has opened the viewer
+                    if _warm_variant['size']:
+                        variant_size = screen_variant_size(filepath, _warm_variant['size'])
+                        if variant_size:
+                            thumbnail_cache.get(filepath, variant_size)
+                except Exception as e:
+                    print(f"[Web] Could not create thumbnails for {filename}: {e}")
+            elif step == 'playlist':
+                rel_path = slideshow_instance._relative_image_path(filepath)
+                if rel_path is not None:
+                    slideshow_instance.add_images([rel_path])
+                else:
+                    # Not under a folder the slideshow knows how to name; fall back to a full scan
+                    slideshow_instance.refresh_images()
+                    slideshow_instance.rebuild_navigation_preserve_current()
+                slideshow_instance.force_redraw = True
+                status_feed.poke()
         
         # Notify Telegram of upload
         if telegram_notifier:
             telegram_notifier.notify_upload(filename)
-        
-        return jsonify({'status': 'ok', 'filename': filename, 'upload_dir': upload_dir, 'caption_added': bool(caption)})
+        return result
+    
+    def upload_max_edge():
+        """Longest edge uploads are scaled down to: the screen's longest side times upload_max_edge_factor"""
+        try:
+            factor = float(slideshow_instance.config.get('upload_max_edge_factor', '1.5'))
+        except ValueError:
+            factor = 1.5
+        return max(MIN_NORMALIZED_EDGE, int(max(slideshow_instance.screen_w, slideshow_instance.screen_h) * factor))
+    
+    def normalize_upload(filepath):
+        """Apply normalize_image with the upload_* settings; returns the resulting path"""
+        config = slideshow_instance.config
+        originals_dir = config.get('upload_originals_directory', '').strip()
+        return normalize_image(filepath, upload_max_edge(),
+                               png_to_jpeg=config.get('upload_png_to_jpeg', 'true').lower() == 'true',
+                               originals_directory=os.path.expanduser(originals_dir) if originals_dir else None)
+    
+    @app.route('/api/jobs/<job_id>')
+    def api_job(job_id):
+        """State and progress of a background job (e.g. the job_id returned by /api/upload)"""
+        job = upload_jobs.get(job_id) if upload_jobs else None
+        if job is None:
+            return jsonify({'error': 'Unknown job (finished jobs are kept for a while only)'}), 404
+        return jsonify(job.to_dict())
 
     def get_upload_directory():
         """Get the upload directory path"""
@@ -1154,54 +1670,127 @@ def register_routes():
 
         return upload_dir
 
+    def upload_index_prefix(upload_dir):
+        """The folder the media index files uploads under: 'uploaded/' for the default upload
+        directory or one outside the images folder, its library-relative path (e.g. 'phone/')
+        for one configured inside it"""
+        rel_path = slideshow_instance._relative_image_path(os.path.join(upload_dir, '_'))
+        return rel_path[:-1] if rel_path is not None else 'uploaded/'
+
+    def sync_upload_index(upload_dir, prefix):
+        """Bring the media index's view of the upload directory up to date: files saved since the
+        last library scan (an upload still being processed, a file copied in) are added and
+        deleted ones dropped. Reads the directory once; only new files are stat'ed"""
+        try:
+            with os.scandir(upload_dir) as entries:
+                names = {entry.name for entry in entries
+                         if entry.name.lower().endswith(('.jpg', '.jpeg', '.png')) and entry.is_file()}
+        except OSError as e:
+            print(f"[Web] Could not list upload directory {upload_dir}: {e}")
+            return
+        index = slideshow_instance.media_index
+        indexed = index.folder_names(prefix)
+        rows = []
+        for name in names - indexed:
+            try:
+                stat = os.stat(os.path.join(upload_dir, name))
+            except OSError:
+                continue
+            rows.append((prefix + name, stat.st_size, stat.st_mtime))
+        if rows:
+            index.update_stats(rows)
+        gone = indexed - names
+        if gone:
+            index.remove(prefix + name for name in gone)
+
     @app.route('/api/uploaded-images', methods=['GET'])
     def api_list_uploaded_images():
-        """List all uploaded images with metadata"""
+        """List uploaded images a page at a time, from the media index.
+
+        Query parameters: sort (date, name or size), order (asc/desc), per_page,
+        cursor (next_cursor of the previous page), q (part of the file name),
+        has_caption (true/false) and stream=1 to stream the JSON as it is built.
+        The first page also reads the upload directory's file names so files
+        not indexed yet are listed; otherwise only the images on the page are
+        touched on disk, and captions come from the caption cache."""
         if slideshow_instance is None:
             return jsonify({'error': 'Slideshow not initialized'}), 503
 
         upload_dir = get_upload_directory()
         if not upload_dir or not os.path.exists(upload_dir):
-            return jsonify({'images': [], 'total': 0})
-
-        images = []
+            return jsonify({'images': [], 'total': 0, 'next_cursor': None})
+
+        sort = request.args.get('sort', 'date')
+        if sort not in LIST_SORT_COLUMNS:
+            return jsonify({'error': f"sort must be one of: {', '.join(LIST_SORT_COLUMNS)}"}), 400
+        order = request.args.get('order', 'asc' if sort == 'name' else 'desc').lower()
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': 'order must be asc or desc'}), 400
         try:
-            for filename in os.listdir(upload_dir):
-                if filename.lower().endswith(('.jpg', '.jpeg', '.png')) and not filename.startswith('.'):
-                    filepath = os.path.join(upload_dir, filename)
-                    stat = os.stat(filepath)
-
-                    # Always read directly from image metadata (source of truth)
-                    image_caption = ''
-                    try:
-                        metadata_caption = get_image_caption(filepath)
-                        if metadata_caption:
-                            image_caption = metadata_caption
-                    except Exception as e:
-                        print(f"[Web] Could not read caption from {filename} metadata: {e}")
-
-                    images.append({
-                        'filename': filename,
-                        'path': f'uploaded/{filename}',  # Relative path for frontend
-                        'size': stat.st_size,
-                        'size_human': _format_file_size(stat.st_size),
-                        'upload_date': stat.st_mtime,
-                        'upload_date_human': _format_timestamp(stat.st_mtime),
-                        'caption': image_caption
-                    })
-
-            # Sort by upload date (newest first)
-            images.sort(key=lambda x: x['upload_date'], reverse=True)
-
+            per_page = min(MAX_UPLOAD_PAGE_SIZE, max(1, int(request.args.get('per_page', 60))))
+        except ValueError:
+            return jsonify({'error': 'per_page must be an integer'}), 400
+        after = None
+        if request.args.get('cursor'):
+            try:
+                after = json.loads(base64.urlsafe_b64decode(request.args['cursor'].encode('ascii')))
+                if not (isinstance(after, list) and len(after) == 2 and isinstance(after[1], str)):
+                    raise ValueError
+            except (ValueError, TypeError, UnicodeError):
+                return jsonify({'error': 'Invalid cursor'}), 400
+        has_caption = request.args.get('has_caption')
+        if has_caption is not None:
+            has_caption = has_caption.lower() in ('1', 'true', 'yes')
+
+        prefix = upload_index_prefix(upload_dir)
+        try:
+            if after is None:
+                # Later pages continue from the same snapshot
+                sync_upload_index(upload_dir, prefix)
+            total, rows = slideshow_instance.media_index.list_files(
+                prefix, sort=sort, descending=order == 'desc', after=after, limit=per_page,
+                name=request.args.get('q', '').strip() or None, has_caption=has_caption)
         except Exception as e:
             print(f"[Web] Error listing uploaded images: {e}")
             return jsonify({'error': f'Failed to list images: {str(e)}'}), 500
 
-        return jsonify({
-            'images': images,
-            'total': len(images),
-            'upload_directory': upload_dir
-        })
+        next_cursor = None
+        if len(rows) == per_page:
+            last = rows[-1]
+            value = {'date': last[2], 'size': last[1], 'name': last[0]}[sort]
+            next_cursor = base64.urlsafe_b64encode(json.dumps([value, last[0]]).encode()).decode('ascii')
+
+        def images():
+            for path, size, mtime, caption, caption_cached in rows:
+                filename = path[len(prefix):]
+                filepath = os.path.join(upload_dir, filename)
+                if not caption_cached:
+                    try:
+                        # Reads the file once and caches the caption for next time
+                        caption = get_image_caption(filepath)
+                    except Exception as e:
+                        print(f"[Web] Could not read caption from {filename} metadata: {e}")
+                yield {
+                    'filename': filename,
+                    'path': f'uploaded/{filename}',  # Relative path for frontend
+                    'size': size,
+                    'size_human': _format_file_size(size),
+                    'upload_date': mtime,
+                    'upload_date_human': _format_timestamp(mtime),
+                    'caption': caption or '',
+                    'version': file_version(filepath)
+                }
+
+        head = {'total': total, 'upload_directory': upload_dir, 'next_cursor': next_cursor,
+                'sort': sort, 'order': order}
+        if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+            def stream():
+                yield json.dumps(head)[:-1] + ', "images": ['
+                for position, image in enumerate(images()):
+                    yield (',' if position else '') + json.dumps(image)
+                yield ']}'
+            return Response(stream(), mimetype='application/json')
+        return jsonify(dict(head, images=list(images())))
 
     @app.route('/api/uploaded-images/delete', methods=['POST'])
     def api_delete_uploaded_images():
@@ -1223,6 +1812,7 @@ def register_routes():
                 return jsonify({'error': 'Upload directory not configured'}), 500
 
             deleted = []
+            deleted_paths = []
             failed = []
 
             for image_path in images_to_delete:
@@ -1248,6 +1838,7 @@ def register_routes():
 
                     os.remove(full_path)
                     deleted.append(image_path)
+                    deleted_paths.append(full_path)
                     print(f"[Web] Deleted uploaded image: {safe_path}")
 
                 except Exception as e:
@@ -1261,6 +1852,8 @@ def register_routes():
                 )
 
             if deleted:  # Only refresh if images were actually deleted
+                slideshow_instance.media_index.remove_sidecar_captions(
+                    [slideshow_instance._relative_image_path(path) for path in deleted_paths])
                 slideshow_instance.refresh_images()
                 slideshow_instance.rebuild_navigation_preserve_current()
                 slideshow_instance.force_redraw = True
@@ -1323,8 +1916,12 @@ def register_routes():
             if os.path.exists(new_path):
                 return jsonify({'error': 'A file with that name already exists'}), 409
 
-            # Perform the rename
+            # Perform the rename (a sidecar caption moves with the file)
             os.rename(old_path, new_path)
+            old_index_path = slideshow_instance._relative_image_path(old_path)
+            new_index_path = slideshow_instance._relative_image_path(new_path)
+            if old_index_path and new_index_path:
+                slideshow_instance.media_index.rename_sidecar_caption(old_index_path, new_index_path)
 
             # Refresh images to update the cache
             slideshow_instance.refresh_images()
@@ -1388,6 +1985,100 @@ def register_routes():
             print(f"[Web] Error updating caption: {e}")
             return jsonify({'error': f'Failed to update caption: {str(e)}'}), 500
 
+    @app.route('/api/uploaded-images/captions', methods=['POST'])
+    def api_update_uploaded_image_captions():
+        """Update captions for many uploaded images in one request
+        
+        Body: JSON {"items": [{"path": "uploaded/name.jpg", "caption": "..."}, ...]}, or a CSV
+        file (form field "file", or a text/csv body) with path/filename and caption columns.
+        Files are written by a small worker pool (caption_write_workers) and every item gets a
+        result; caption caches and the slideshow redraw are refreshed once for the whole batch."""
+        if slideshow_instance is None:
+            return jsonify({'error': 'Slideshow not initialized'}), 503
+
+        try:
+            if 'file' in request.files:
+                items = parse_caption_csv(request.files['file'].read().decode('utf-8-sig'))
+            elif request.mimetype == 'text/csv':
+                items = parse_caption_csv(request.get_data().decode('utf-8-sig'))
+            else:
+                data = request.get_json(silent=True) or {}
+                items = data.get('items')
+        except (UnicodeDecodeError, csv.Error, ValueError) as e:
+            return jsonify({'error': f'Could not read CSV: {e}'}), 400
+
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items (path and caption pairs) required'}), 400
+        if len(items) > MAX_CAPTION_BATCH:
+            return jsonify({'error': f'At most {MAX_CAPTION_BATCH} captions per request'}), 400
+
+        upload_dir = get_upload_directory()
+        if not upload_dir:
+            return jsonify({'error': 'Upload directory not configured'}), 500
+
+        # Only the last caption given for a file is written
+        last_for_path = {}
+        for position, item in enumerate(items):
+            if isinstance(item, dict) and isinstance(item.get('path'), str):
+                last_for_path[item['path']] = position
+
+        sidecar = caption_storage() == 'sidecar'
+
+        def apply(position):
+            item = items[position]
+            if not isinstance(item, dict):
+                return {'path': None, 'status': 'error', 'error': 'Item must be an object with path and caption'}
+            image_path = item.get('path')
+            if not isinstance(image_path, str) or not image_path.startswith('uploaded/') \
+                    or not os.path.basename(image_path):
+                return {'path': image_path, 'status': 'error', 'error': 'Invalid image path'}
+            result = {'path': image_path}
+            if last_for_path.get(image_path) != position:
+                return dict(result, status='skipped', error='Superseded by a later item for the same path')
+            filename = os.path.basename(image_path)
+            full_path = os.path.join(upload_dir, filename)
+            if not os.path.exists(full_path):
+                return dict(result, status='error', error='Image file not found')
+            caption = str(item.get('caption') or '').strip()
+            if not sidecar and not write_image_caption(full_path, caption):
+                return dict(result, status='error', error='Failed to save caption to image metadata')
+            return dict(result, status='ok', caption=caption, full_path=full_path)
+
+        if sidecar:
+            # Only validation per item; the captions are stored in one transaction below
+            results = [apply(position) for position in range(len(items))]
+        else:
+            try:
+                workers = max(1, int(slideshow_instance.config.get('caption_write_workers', '2')))
+            except (ValueError, TypeError):
+                workers = 2
+            with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+                results = list(pool.map(apply, range(len(items))))
+
+        written = [result['full_path'] for result in results if result['status'] == 'ok']
+        if sidecar:
+            store_sidecar_captions([(result['full_path'], result['caption'])
+                                    for result in results if result['status'] == 'ok'])
+        else:
+            invalidate_image_captions(written)
+        for result in results:
+            result.pop('full_path', None)
+        current = slideshow_instance.current_img
+        if current and any(current.endswith(os.path.basename(path)) for path in written):
+            slideshow_instance._cached_caption = None
+            slideshow_instance._cached_caption_image = None
+        if written:
+            slideshow_instance.force_redraw = True
+
+        failed = sum(1 for result in results if result['status'] == 'error')
+        print(f"[Web] Batch caption update: {len(written)} written, {failed} failed")
+        return jsonify({
+            'status': 'ok' if not failed else 'partial',
+            'succeeded': len(written),
+            'failed': failed,
+            'results': results
+        })
+
     @app.route('/api/uploaded-images/cleanup-cache', methods=['POST'])
     def api_cleanup_captions_cache():
         """Clean up temporary captions cache when modal is closed"""
@@ -1447,7 +2138,10 @@ def register_routes():
                 'shutdown_on_display_off': slideshow_instance.config.get('shutdown_on_display_off', 'true'),
                 'shutdown_countdown_seconds': slideshow_instance.config.get('shutdown_countdown_seconds', '10'),
                 'sort_order': slideshow_instance.config.get('sort_order', 'random'),
-                'sort_reverse': slideshow_instance.config.get('sort_reverse', 'false')
+                'sort_reverse': slideshow_instance.config.get('sort_reverse', 'false'),
+                # Browsers may shrink JPEGs to upload_max_edge before uploading them
+                'upload_client_resize': slideshow_instance.config.get('upload_client_resize', 'false'),
+                'upload_max_edge': upload_max_edge()
             })
         
         elif request.method == 'POST':
@@ -1689,7 +2383,78 @@ def register_routes():
             return jsonify({'status': 'ok'})
 
 
+class WebServer:
+    """Serves a WSGI app with waitress (mode 'production') or Werkzeug's development server.
+
+    waitress handles connections, keep-alive and slow clients on one I/O thread
+    and runs requests on a fixed pool of worker threads, so a burst of phones
+    can't start an unbounded number of threads next to the render loop. The
+    development server starts a thread per connection and closes the
+    connection after every response. Falls back to it if waitress is not
+    installed."""
+
+    def __init__(self, wsgi_app, host='0.0.0.0', port=5000, mode='production', workers=DEFAULT_WEB_WORKERS,
+                 max_request_body_size=None):
+        if mode == 'production' and not WAITRESS_AVAILABLE:
+            print("[Web] waitress not installed (pip install waitress); using the development server")
+            mode = 'development'
+        self.mode = mode
+        self.workers = workers
+        if mode == 'production':
+            self._server = create_waitress_server(
+                wsgi_app, host=host, port=port, threads=workers,
+                channel_timeout=WEB_CHANNEL_TIMEOUT, ident='piGallery',
+                # waitress receives whole request bodies before the app sees them, so this is
+                # what bounds how much of an oversized upload is received at all
+                **({'max_request_body_size': max_request_body_size} if max_request_body_size is not None else {}))
+        else:
+            from werkzeug.serving import make_server
+            self._server = make_server(host, port, wsgi_app, threaded=True)
+        self.port = self._server.effective_port if mode == 'production' else self._server.port
+
+    def serve(self):
+        """Handle requests until stop() is called (blocks)"""
+        if self.mode == 'production':
+            self._server.run()
+        else:
+            self._server.serve_forever()
+
+    def stop(self, timeout=WEB_SHUTDOWN_TIMEOUT):
+        """Stop accepting connections, give running requests up to timeout seconds to finish
+        and close the remaining connections"""
+        if self.mode != 'production':
+            self._server.shutdown()
+            return
+        server = self._server
+        server.accepting = False
+        server.pull_trigger()
+        server.task_dispatcher.shutdown(cancel_pending=True, timeout=timeout)
+        # Closing every channel (in the I/O thread) ends run()
+        server.trigger.pull_trigger(lambda: wasyncore.close_all(server._map, ignore_all=True))
+
+
 def start_web_server(host='0.0.0.0', port=5000):
-    """Start Flask web server in background thread"""
-    print(f"[Web] Starting web server on http://{host}:{port}")
-    app.run(host=host, port=port, debug=False, threaded=True)
+    """Start the web server (blocks; run in a background thread)"""
+    global web_server, event_stream_slots
+    config = slideshow_instance.config if slideshow_instance else {}
+    mode = config.get('web_server', 'production').strip().lower()
+    try:
+        workers = max(1, int(config.get('web_workers', DEFAULT_WEB_WORKERS)))
+    except ValueError:
+        workers = DEFAULT_WEB_WORKERS
+    web_server = WebServer(app, host, port, mode, workers, upload_limits()[0] + UPLOAD_REQUEST_OVERHEAD)
+    if web_server.mode == 'production':
+        event_stream_slots = threading.BoundedSemaphore(max(1, workers - RESERVED_WEB_WORKERS))
+    print(f"[Web] Starting {web_server.mode} web server on http://{host}:{port}"
+          + (f" with {workers} workers" if web_server.mode == 'production' else ''))
+    web_server.serve()
+
+
+def stop_web_server():
+    """Finish running requests and close the server (called on shutdown)"""
+    if status_feed is not None:
+        # Ends the event streams so their workers are free
+        status_feed.close()
+    if web_server is not None:
+        web_server.stop()
+        print("[Web] Web server stopped")